@@ -6,6 +6,9 @@ Created on Mon Mar 11 16:53:00 2019
 @author: chong
 
 Defines method will_be_allston_course that determines which courses will be taught on the Allston campus
+
+The alternative policies for which courses move to Allston are compiled into sets (see selector_policy and
+POLICIES), and the policy used can be changed at run time with set_policy, e.g., to compare scenarios.
 """
 import sys, pickle
 
@@ -37,14 +40,7 @@ def will_be_allston_course_canonical_cn(cn):
     :param cn, e.g., "COMPSCI 50"
     :return boolean indicating whether the course will be taught in Alston.
     """
-    start = cn.find(' ')
-    subject = cn[:start]
-    catalog = cn[start+1:]
-
-    assert subject == subject.upper().strip()
-    assert catalog == catalog.upper().strip()
-
-    return will_be_allston_course_subj_catalog(subject, catalog)
+    return _policy.in_allston_canonical_cn(cn)
     
 def will_be_allston_course_subj_catalog(subject, catalog):
     """
@@ -54,68 +50,115 @@ def will_be_allston_course_subj_catalog(subject, catalog):
     :param catalog, e.g., "50"
     :return boolean indicating whether the course will be taught in Alston.
     """
-    #return _all_seas(subject, catalog)
-    return _current_best(subject, catalog)
-    #return _move_stat_or_econ(subject, catalog)
-    
-def _current_best(subject, catalog):
+    return _policy.in_allston(subject, catalog)
+
+class selector_policy(object):
     """
-    Our current (March 2019) best understanding of what courses will be taught in Allston.
+    A policy for which courses will be taught in Allston, compiled into sets so that deciding a course is a couple of
+    set lookups:
+      whole_subjects is a dictionary from each subject all of whose courses will be in Allston to the set of catalog
+      numbers of its courses that are exceptions (and will stay in Cambridge), and
+      courses is the set of (subject, catalog) of the other courses that will be in Allston.
+    The answers for canonical course names are also remembered, so that the names are only split once.
     """
-
-    if subject == "COMPSCI":
-        if catalog in ["50","90NCR","90NBR"]:
-            # CS50, and the 90 seminars taught in the law school will be in Cambridge
+    def __init__(self, name, whole_subjects, courses):
+        self.name = name
+        self.whole_subjects = {subject: frozenset(exceptions) for (subject, exceptions) in whole_subjects.items()}
+        self.courses = frozenset(courses)
+        # The subjects with at least one course in Allston
+        self.subjects = frozenset(self.whole_subjects) | frozenset(subject for (subject, catalog) in self.courses)
+        self.cn_d = {}
+
+    def in_allston(self, subject, catalog):
+        if subject not in self.subjects:
             return False
-        # other CS courses will be in Allston
-        return True
-
-    if subject == "APCOMP":
-        return catalog in ["209A", "227", "298R", "209B", "221", "290R", "297R"]
-
-    if subject == "APMTH":
-        return catalog in ["101", "106", "121", "207", "227", "254", "50A", "107", "221", "231"]
-
-    if subject == "APPHY" and catalog in ["50A", "50B"]:
-        return True
-
-    if subject == "BE":
-        return catalog in ["110", "121", "125", "128", "129", "130", "191"]
-
-    if subject == "ESE":
-        return catalog in ["166", "6"]
-
-    if subject == "ENG-SCI":
-        return catalog in ["100HFA", "125", "139", "152", "155", "173", "181", "190", "21",
-                           "222", "239", "25", "254", "280", "51", "53", "91HFR", "95R", "96",
-                           "112", "120", "123", "150", "151", "156", "177", "183", "201", "22",
-                           "221", "23", "23", "230", "234", "249", "26", "277", "298R", "51",
-                           "54", "91HFR", "95R", "96"]
+        exceptions = self.whole_subjects.get(subject)
+        if exceptions is not None:
+            return catalog not in exceptions
+        return (subject, catalog) in self.courses
+
+    def in_allston_canonical_cn(self, cn):
+        res = self.cn_d.get(cn)
+        if res is None:
+            start = cn.find(' ')
+            subject = cn[:start]
+            catalog = cn[start+1:]
+
+            assert subject == subject.upper().strip()
+            assert catalog == catalog.upper().strip()
+
+            res = self.in_allston(subject, catalog)
+            self.cn_d[cn] = res
+        return res
+
+def _courses(subject, catalogs):
+    return [(subject, catalog) for catalog in catalogs]
+
+# Our current (March 2019) best understanding of what courses will be taught in Allston.
+_CURRENT_BEST_WHOLE_SUBJECTS = {
+    # CS50, and the 90 seminars taught in the law school will be in Cambridge; other CS courses will be in Allston
+    "COMPSCI": ["50","90NCR","90NBR"],
+}
+_CURRENT_BEST_COURSES = \
+    _courses("APCOMP", ["209A", "227", "298R", "209B", "221", "290R", "297R"]) + \
+    _courses("APMTH", ["101", "106", "121", "207", "227", "254", "50A", "107", "221", "231"]) + \
+    _courses("APPHY", ["50A", "50B"]) + \
+    _courses("BE", ["110", "121", "125", "128", "129", "130", "191"]) + \
+    _courses("ESE", ["166", "6"]) + \
+    _courses("ENG-SCI", ["100HFA", "125", "139", "152", "155", "173", "181", "190", "21",
+                         "222", "239", "25", "254", "280", "51", "53", "91HFR", "95R", "96",
+                         "112", "120", "123", "150", "151", "156", "177", "183", "201", "22",
+                         "221", "23", "23", "230", "234", "249", "26", "277", "298R", "51",
+                         "54", "91HFR", "95R", "96"])
+
+# Dictionary from name to the policies that can be selected with set_policy. All other courses will be in Cambridge.
+POLICIES = {
+    "current_best": selector_policy("current_best", _CURRENT_BEST_WHOLE_SUBJECTS, _CURRENT_BEST_COURSES),
+    "all_seas": selector_policy("all_seas",
+                                {subject: [] for subject in ["COMPSCI", "ENG-SCI", "BE", "APMTH", "APCOMP"]},
+                                _courses("APPHY", ["50B"]) + _courses("ESE", ["166", "6"])),
+    "move_stat": selector_policy("move_stat", dict(_CURRENT_BEST_WHOLE_SUBJECTS, STAT=[]), _CURRENT_BEST_COURSES),
+    "move_econ": selector_policy("move_econ", dict(_CURRENT_BEST_WHOLE_SUBJECTS, ECON=[]), _CURRENT_BEST_COURSES),
+    "move_stat_and_econ": selector_policy("move_stat_and_econ", dict(_CURRENT_BEST_WHOLE_SUBJECTS, STAT=[], ECON=[]), _CURRENT_BEST_COURSES),
+}
+
+DEFAULT_POLICY = "current_best"
+
+_policy = POLICIES[DEFAULT_POLICY]
+
+def set_policy(name):
+    """
+    Select the policy (a key of POLICIES) used by the will_be_allston_course functions, e.g., to compare scenarios.
+    Processes started afterwards by multiprocessing (which fork this one) use it too.
+    """
+    global _policy
+    if name not in POLICIES:
+        raise ValueError("Unknown Allston course policy %s; the policies are %s"%(name, ", ".join(sorted(POLICIES))))
+    _policy = POLICIES[name]
 
+def get_policy():
+    """
+    The name of the selected policy.
+    """
+    return _policy.name
 
-    # All other courses will be in Cambridge
-    return False
+def _current_best(subject, catalog):
+    """
+    Our current (March 2019) best understanding of what courses will be taught in Allston.
+    """
+    return POLICIES["current_best"].in_allston(subject, catalog)
 
 def _all_seas(subject, catalog):
-    if subject == "APPHY" and catalog ==  "50B":
-        return True
-
-    if subject == "ESE":
-        return catalog in ["166", "6"]
-
-    return subject in ["COMPSCI", "ENG-SCI", "BE", "APMTH", "APCOMP"]
+    return POLICIES["all_seas"].in_allston(subject, catalog)
     
 def _move_stat_or_econ(subject, catalog, move_stat = True, move_econ = False):
-    if _current_best(subject, catalog):
-        return True
-
-    if move_stat and subject == "STAT":
-        return True
-
-    if move_econ and subject == "ECON":
-        return True
-    
-    return False
+    if move_stat and move_econ:
+        return POLICIES["move_stat_and_econ"].in_allston(subject, catalog)
+    if move_stat:
+        return POLICIES["move_stat"].in_allston(subject, catalog)
+    if move_econ:
+        return POLICIES["move_econ"].in_allston(subject, catalog)
+    return _current_best(subject, catalog)
 
 def _legacy(l):
     """
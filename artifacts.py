@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A file format for the intermediate dictionaries passed between the analysis programs (student_schedule_d,
+transition_d, conflicts_d, and the course_pair_stats_d and course_stats_d dictionaries), to replace pickling
+them with make_name_dicts.pickle_data.
+
+An artifact file holds one or more named tables. Each table is a dictionary, whose values are packed with struct
+by a codec for the kind of value (see CODECS). Each codec has a schema version, which is recorded in the file and
+checked when the file is read, so that a file written by an older version of the code is rejected with a clear
+message, rather than being unpickled into the wrong shape of object.
+
+Reading is lazy: opening a file only reads its directory of tables, the keys and offsets of a table are read when
+the table is first used, and each value is decoded only when it is looked up. So a program that needs one table,
+or a few values, doesn't pay to load the whole file.
+
+The layout of a file is:
+  MAGIC, FORMAT_VERSION (uint32), length of directory (uint32), directory (JSON)
+  for each table: header (JSON, with the codec, schema version, string table and keys), offsets (uint64 per value, plus one), values
+The directory gives the position of the header, offsets and values of each table.
+"""
+
+import sys, os, json, mmap, struct
+import collections.abc as col
+from collections import defaultdict
+import class_time as ct
+from build_course_pair_stats_d import course_pair_stats, course_stats
+
+MAGIC = b'SCHEDART'
+FORMAT_VERSION = 1
+
+# Conventional file names for the artifacts written by the analysis programs
+STUDENT_SCHEDULE_FILE = 'student_schedule_d.art'
+TRANSITION_FILE = 'transition_d.art'
+CONFLICTS_FILE = 'conflicts_d.art'
+COURSE_PAIR_STATS_FILE = 'course_pair_stats_d.art'
+
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_U32_PAIR = struct.Struct('<II')
+_INT = struct.Struct('<q')
+_COURSE_PAIR_STATS = struct.Struct('<???7q')
+_COURSE_STATS = struct.Struct('<3qH')
+_TERM_ENROLLMENT = struct.Struct('<Iq')
+
+def _encode_student_sched(v, intern):
+    parts = [_U32.pack(intern(v.student_num)), _U16.pack(len(v.class_nums))]
+    parts.extend(_U32.pack(intern(cn)) for cn in v.class_nums)
+    parts.append(struct.pack('<%sh'%len(v.entries), *v.entries))
+    return b''.join(parts)
+
+def _decode_student_sched(buf, strings):
+    (student_num,) = _U32.unpack_from(buf, 0)
+    (n,) = _U16.unpack_from(buf, _U32.size)
+    pos = _U32.size + _U16.size
+    v = ct.student_sched(strings[student_num])
+    for j in range(n):
+        (cn,) = _U32.unpack_from(buf, pos)
+        pos += _U32.size
+        v.class_nums.append(strings[cn])
+    v.entries.extend(struct.unpack_from('<%sh'%((len(buf) - pos) // 2), buf, pos))
+    return v
+
+def _encode_transition(v, intern):
+    parts = []
+    for day in v.trans_time:
+        parts.append(_U16.pack(len(day)))
+        for t, where in day.items():
+            parts.append(_U32_PAIR.pack(intern(t), intern(where)))
+    return b''.join(parts)
+
+def _decode_transition(buf, strings):
+    v = ct.transition.__new__(ct.transition)
+    v.trans_time = []
+    pos = 0
+    while pos < len(buf):
+        (n,) = _U16.unpack_from(buf, pos)
+        pos += _U16.size
+        day = {}
+        for j in range(n):
+            (t, where) = _U32_PAIR.unpack_from(buf, pos)
+            pos += _U32_PAIR.size
+            day[strings[t]] = strings[where]
+        v.trans_time.append(day)
+    return v
+
+def _encode_int(v, intern):
+    return _INT.pack(v)
+
+def _decode_int(buf, strings):
+    return _INT.unpack_from(buf, 0)[0]
+
+def _encode_course_pair_stats(v, intern):
+    return _U32_PAIR.pack(intern(v.cn1), intern(v.cn2)) + \
+        _COURSE_PAIR_STATS.pack(v.cn1_in_allston, v.cn2_in_allston, v.in_allston,
+                                v.num_students, v.num_same_term, v.num_before, v.num_after,
+                                v.num_within_one, v.num_within_two, v.num_within_three)
+
+def _decode_course_pair_stats(buf, strings):
+    # Bypass __init__, which checks the course names, since they were checked when the value was created
+    v = course_pair_stats.__new__(course_pair_stats)
+    (cn1, cn2) = _U32_PAIR.unpack_from(buf, 0)
+    (v.cn1, v.cn2) = (strings[cn1], strings[cn2])
+    (v.cn1_in_allston, v.cn2_in_allston, v.in_allston,
+     v.num_students, v.num_same_term, v.num_before, v.num_after,
+     v.num_within_one, v.num_within_two, v.num_within_three) = _COURSE_PAIR_STATS.unpack_from(buf, _U32_PAIR.size)
+    return v
+
+def _encode_course_stats(v, intern):
+    parts = [_U32.pack(intern(v.cn)), _COURSE_STATS.pack(v.num_students, v.num_fall, v.num_spring, len(v.term_enrollment))]
+    for term, n in v.term_enrollment.items():
+        parts.append(_TERM_ENROLLMENT.pack(intern(term), n))
+    return b''.join(parts)
+
+def _decode_course_stats(buf, strings):
+    v = course_stats.__new__(course_stats)
+    (cn,) = _U32.unpack_from(buf, 0)
+    v.cn = strings[cn]
+    (v.num_students, v.num_fall, v.num_spring, n) = _COURSE_STATS.unpack_from(buf, _U32.size)
+    v.term_enrollment = defaultdict(int)
+    pos = _U32.size + _COURSE_STATS.size
+    for j in range(n):
+        (term, count) = _TERM_ENROLLMENT.unpack_from(buf, pos)
+        pos += _TERM_ENROLLMENT.size
+        v.term_enrollment[strings[term]] = count
+    return v
+
+# Dictionary from codec name to (schema version, encode function, decode function). Increase the schema version
+# whenever the encoding of a codec (or the class it encodes) changes, so that old files are rejected.
+CODECS = {
+    'student_sched': (2, _encode_student_sched, _decode_student_sched),
+    'transition': (1, _encode_transition, _decode_transition),
+    'int': (1, _encode_int, _decode_int),
+    'course_pair_stats': (1, _encode_course_pair_stats, _decode_course_pair_stats),
+    'course_stats': (1, _encode_course_stats, _decode_course_stats),
+}
+
+def _key_to_json(k):
+    return list(k) if isinstance(k, tuple) else k
+
+def _key_from_json(k):
+    return tuple(k) if isinstance(k, list) else k
+
+def save(f_name, tables):
+    """
+    Write an artifact file.
+    :param f_name: the name of the file to create. If the file already exists, it will be overwritten
+    :param tables: a list of triples (name, codec, d), where name is the name of the table, codec is a key of CODECS
+                   for the values of the table, and d is the dictionary to store. Keys must be strings or tuples of strings.
+    :return: None
+    """
+    # Build each table: its header, offsets and values
+    built = []
+    for (name, codec, d) in tables:
+        (schema, encode, decode) = CODECS[codec]
+        strings = []
+        string_ids = {}
+        def intern(s):
+            if s not in string_ids:
+                string_ids[s] = len(strings)
+                strings.append(s)
+            return string_ids[s]
+
+        values = [encode(v, intern) for v in d.values()]
+        offsets = [0]
+        for b in values:
+            offsets.append(offsets[-1] + len(b))
+
+        header = json.dumps({"codec": codec, "schema": schema, "strings": strings,
+                             "keys": [_key_to_json(k) for k in d.keys()]}).encode('utf-8')
+        built.append((name, header, struct.pack('<%sQ'%len(offsets), *offsets), b''.join(values)))
+
+    # The directory needs to know its own length to give the positions of the tables, so lay it
+    # out with placeholder positions first, then fill them in.
+    def make_directory(start):
+        directory = {}
+        pos = start
+        for (name, header, offsets, values) in built:
+            directory[name] = {"header": [pos, len(header)], "offsets": [pos + len(header), len(offsets)],
+                               "values": [pos + len(header) + len(offsets), len(values)]}
+            pos += len(header) + len(offsets) + len(values)
+        return json.dumps(directory).encode('utf-8')
+
+    prefix_len = len(MAGIC) + 2 * _U32.size
+    directory = make_directory(0)
+    while True:
+        new_directory = make_directory(prefix_len + len(directory))
+        if len(new_directory) == len(directory):
+            directory = new_directory
+            break
+        directory = new_directory
+
+    with open(f_name, 'wb') as fout:
+        fout.write(MAGIC)
+        fout.write(_U32.pack(FORMAT_VERSION))
+        fout.write(_U32.pack(len(directory)))
+        fout.write(directory)
+        for (name, header, offsets, values) in built:
+            fout.write(header)
+            fout.write(offsets)
+            fout.write(values)
+
+def save_dict(f_name, codec, d):
+    """
+    Write an artifact file with a single table, d, named after the file (e.g., "conflicts_d" for "conflicts_d.art").
+    """
+    save(f_name, [(os.path.splitext(os.path.basename(f_name))[0], codec, d)])
+
+def is_artifact(f_name):
+    """
+    Is the file f_name an artifact file (rather than, e.g., a pickle)?
+    """
+    with open(f_name, 'rb') as fin:
+        return fin.read(len(MAGIC)) == MAGIC
+
+class lazy_table(col.Mapping):
+    """
+    A read-only dictionary backed by a table of an artifact file. Values are decoded when they are first looked up.
+    If close_when_read is true, the artifact is closed once all of the values have been decoded (see load_dict).
+    """
+    def __init__(self, art, name, entry):
+        self.art = art
+        self.name = name
+        self.close_when_read = False
+        buf = art.buf
+
+        (start, length) = entry["header"]
+        header = json.loads(bytes(buf[start:start+length]).decode('utf-8'))
+        if header["codec"] not in CODECS:
+            raise ValueError("Table %s of %s uses unknown codec %s"%(name, art.f_name, header["codec"]))
+        (schema, encode, self.decode) = CODECS[header["codec"]]
+        if header["schema"] != schema:
+            raise ValueError("Table %s of %s has schema version %s for %s, but this code reads version %s; please rebuild it"%(name, art.f_name, header["schema"], header["codec"], schema))
+
+        self.codec = header["codec"]
+        self.strings = header["strings"]
+        self.keys_l = [_key_from_json(k) for k in header["keys"]]
+        self.index = {k: i for (i, k) in enumerate(self.keys_l)}
+
+        (self.offsets_start, length) = entry["offsets"]
+        (self.values_start, length) = entry["values"]
+        self.cache = {}
+
+    def _close_if_read(self):
+        if self.close_when_read and len(self.cache) == len(self.keys_l):
+            self.art.close()
+
+    def __getitem__(self, k):
+        i = self.index[k]
+        if i not in self.cache:
+            (start, end) = struct.unpack_from('<2Q', self.art.buf, self.offsets_start + 8*i)
+            view = memoryview(self.art.buf)
+            self.cache[i] = self.decode(view[self.values_start+start:self.values_start+end], self.strings)
+            # release the view, so that the mapping can be closed
+            view.release()
+            self._close_if_read()
+        return self.cache[i]
+
+    def __iter__(self):
+        return iter(self.keys_l)
+
+    def __len__(self):
+        return len(self.keys_l)
+
+    def __contains__(self, k):
+        return k in self.index
+
+class artifact(object):
+    """
+    An artifact file, opened for reading. Tables are read when they are first asked for.
+    The file stays mapped into memory until close is called (it can also be used in a with statement).
+    """
+    def __init__(self, f_name):
+        self.f_name = f_name
+        with open(f_name, 'rb') as fin:
+            self.buf = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buf[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not an artifact file"%f_name)
+        (version,) = _U32.unpack_from(self.buf, len(MAGIC))
+        if version != FORMAT_VERSION:
+            raise ValueError("%s has format version %s, but this code reads version %s; please rebuild it"%(f_name, version, FORMAT_VERSION))
+        (length,) = _U32.unpack_from(self.buf, len(MAGIC) + _U32.size)
+        start = len(MAGIC) + 2 * _U32.size
+        self.directory = json.loads(bytes(self.buf[start:start+length]).decode('utf-8'))
+        self.tables = {}
+
+    def close(self):
+        """
+        Unmap the file. Values that were already decoded can still be looked up in the tables.
+        """
+        if not self.buf.closed:
+            self.buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def table_names(self):
+        return list(self.directory.keys())
+
+    def table(self, name):
+        if name not in self.tables:
+            if name not in self.directory:
+                raise KeyError("No table %s in %s (tables are %s)"%(name, self.f_name, self.table_names()))
+            self.tables[name] = lazy_table(self, name, self.directory[name])
+        return self.tables[name]
+
+def load_dict(f_name, name=None):
+    """
+    Returns the table name (by default, the only table) of the artifact file f_name, as a lazy_table.
+    The file is closed once all of the table's values have been looked up.
+    """
+    art = artifact(f_name)
+    if name is None:
+        names = art.table_names()
+        assert len(names) == 1, "%s has tables %s; need to say which one"%(f_name, names)
+        name = names[0]
+    t = art.table(name)
+    t.close_when_read = True
+    t._close_if_read()
+    return t
+
+if __name__ == '__main__':
+    def usage():
+        print('Usage: artifacts.py <file.art>')
+        print('  Lists the tables in an artifact file.')
+        sys.exit(1)
+
+    if len(sys.argv) != 2:
+        usage()
+
+    with artifact(sys.argv[1]) as art:
+        for name in art.table_names():
+            t = art.table(name)
+            print("%s: %s values of %s (schema version %s)"%(name, len(t), t.codec, CODECS[t.codec][0]))
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A benchmark of the schedulers (schedule_allston_courses.py and schedule_courses.py) and the scorer
+(build_schedule_score.py) on synthetic instances.
+
+An instance is a directory holding the same input files the schedulers take: a fixed schedule (schedule.csv, in the
+format of sct.build_course_schedule), bad course conflicts (conflicts.csv), multi-year enrollments (enrollments.csv)
+and the courses to schedule (to_schedule.csv, in the format of build_to_schedule_d). synthetic_instance generates
+one: students in Allston or Cambridge concentrations take popular courses of their concentration and of the rest of
+the catalog, and, like bad_course_conflicts.csv, the conflict weights are the numbers of students who took both
+courses at most two terms apart.
+
+For each instance, scheduler, solver version and backend, the model is built and solved once, and its size, build
+time, solve time, objective value, and the simple score of the schedule (and the time to compute it) are recorded.
+The simulated annealing scheduler (local_search_scheduler.py) is run as the "local_search" backend. The results are
+written as a JSON report, which can be compared with the report of another commit.
+"""
+
+import warnings
+import sys, os, csv, json, random, datetime, platform, subprocess, tempfile
+from ortools.linear_solver import pywraplp
+import ortools
+import scheduling_course_time as sct
+import build_schedule_score as schedule_score
+import allston_course_selector
+from harvard_course_info import is_cross_list_canonical
+import schedule_slots as ss
+import cpsat_backend
+import local_search_scheduler
+import schedule_allston_courses
+import schedule_courses
+
+# Sizes of the synthetic instances
+SIZES = {
+    "small" : dict(num_allston=15, num_cambridge=40, num_students=1000),
+    "medium" : dict(num_allston=40, num_cambridge=150, num_students=4000),
+    "large" : dict(num_allston=80, num_cambridge=400, num_students=15000),
+}
+
+SCHEDULERS = ("schedule_allston_courses", "schedule_courses")
+
+# Cambridge class times, and the days of the week (Mon to Fri) of the meeting patterns, with how common they are
+_CLASS_TIMES = [("9:00 AM","10:15 AM"),("10:30 AM","11:45 AM"),("12:00 PM","1:15 PM"),("1:30 PM","2:45 PM"),("3:00 PM","4:15 PM"),("4:30 PM","5:45 PM")]
+_LONG_CLASS_TIMES = [("9:00 AM","11:45 AM"),("12:00 PM","2:45 PM"),("3:00 PM","5:45 PM")]
+_DAY_PATTERNS = [("YNYNN", 4), ("NYNYN", 4), ("YNYNY", 2), ("NNNNY", 1)]
+_ONE_DAY_PATTERNS = ["YNNNN", "NYNNN", "NNYNN", "NNNYN"]
+
+# The (x, y) of the courses to schedule (meet x times a week for y slots), with how common they are
+_TO_SCHEDULE_FREQS = [((2,1), 12), ((1,1), 2), ((1,2), 2), ((2,2), 1)]
+
+_CAMBRIDGE_SUBJECTS = ["ECON", "STAT", "MATH", "GOV", "HIST", "PHYSICS", "CHEM", "LIFESCI", "PSY", "ENGLISH", "PHIL", "EXPOS"]
+
+# The status names of the solver results
+_STATUS_NAMES = {
+    pywraplp.Solver.OPTIMAL : "OPTIMAL",
+    pywraplp.Solver.FEASIBLE : "FEASIBLE",
+    pywraplp.Solver.INFEASIBLE : "INFEASIBLE",
+    pywraplp.Solver.UNBOUNDED : "UNBOUNDED",
+    pywraplp.Solver.ABNORMAL : "ABNORMAL",
+    pywraplp.Solver.MODEL_INVALID : "MODEL_INVALID",
+    pywraplp.Solver.NOT_SOLVED : "NOT_SOLVED",
+}
+
+def _course_names(r, num_allston, num_cambridge):
+    """
+    Choose the names of num_allston courses that will be in Allston (under the selected allston_course_selector
+    policy) and num_cambridge that won't.
+    """
+    policy = allston_course_selector.POLICIES[allston_course_selector.get_policy()]
+    candidates = sorted(set("%s %s"%sc for sc in policy.courses) | set("COMPSCI %d"%n for n in range(100, 300)))
+    allston = [cn for cn in candidates if is_cross_list_canonical(cn) and allston_course_selector.will_be_allston_course_canonical_cn(cn)]
+
+    candidates = ["%s %d"%(subj, n) for subj in _CAMBRIDGE_SUBJECTS for n in range(1, 200)]
+    cambridge = [cn for cn in candidates if is_cross_list_canonical(cn) and not allston_course_selector.will_be_allston_course_canonical_cn(cn)]
+
+    assert num_allston <= len(allston) and num_cambridge <= len(cambridge), "Instance too large"
+    return (sorted(r.sample(allston, num_allston)), sorted(r.sample(cambridge, num_cambridge)))
+
+def _schedule_row(cn, start, end, days):
+    (subj, catalog) = sct.parse_canonical_course_name(cn)
+    return [subj, catalog, start, end] + list(days) + ["N", "N"]
+
+def synthetic_instance(out_dir, num_allston, num_cambridge, num_students, terms_per_student=8, courses_per_term=4, conflicts_per_course=2, seed=0):
+    """
+    Generate an instance in the directory out_dir (see the module description), and return a dictionary describing it.
+    Each student takes courses_per_term courses in each of terms_per_student consecutive terms. About a third of the
+    students are in Allston concentrations, and take most of their courses in Allston. The conflicts are the
+    conflicts_per_course * (number of courses) pairs of courses taken together by the most students.
+    """
+    r = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    (allston, cambridge) = _course_names(r, num_allston, num_cambridge)
+
+    # The fixed schedule. The times of the Allston courses will be ignored, but match how often they meet.
+    to_schedule = {cn : r.choices([f for (f, w) in _TO_SCHEDULE_FREQS], [w for (f, w) in _TO_SCHEDULE_FREQS])[0] for cn in allston}
+    with open(os.path.join(out_dir, "schedule.csv"), 'w') as fout:
+        cout = csv.writer(fout)
+        cout.writerow(["SUBJECT", "CATALOG", "Mtg Start", "Mtg End", "Mon", "Tues", "Wed", "Thurs", "Fri", "Sat", "Sun"])
+        for cn in cambridge:
+            (start, end) = r.choice(_CLASS_TIMES)
+            days = r.choices([d for (d, w) in _DAY_PATTERNS], [w for (d, w) in _DAY_PATTERNS])[0]
+            cout.writerow(_schedule_row(cn, start, end, days))
+        for cn in allston:
+            (x, y) = to_schedule[cn]
+            (start, end) = r.choice(_CLASS_TIMES if y == 1 else _LONG_CLASS_TIMES)
+            days = ["NNYNN", "YNYNN"][x - 1] if y == 2 else r.choice(_ONE_DAY_PATTERNS if x == 1 else ["YNYNN", "NYNYN"])
+            cout.writerow(_schedule_row(cn, start, end, days))
+
+    with open(os.path.join(out_dir, "to_schedule.csv"), 'w') as fout:
+        cout = csv.writer(fout)
+        cout.writerow(["Course", "x", "y"])
+        for cn in allston:
+            cout.writerow([cn, to_schedule[cn][0], to_schedule[cn][1]])
+
+    # Enrollments. Each kind of concentration ranks the courses by popularity, which falls off with rank, as in
+    # real enrollments. popular[concentration] is a pair of lists (courses, cumulative weights) for the Allston and
+    # the Cambridge courses.
+    def ranked(courses):
+        courses = r.sample(courses, len(courses))
+        cum_weights = []
+        total = 0.0
+        for i in range(len(courses)):
+            total += 1.0 / (i + 1)
+            cum_weights.append(total)
+        return (courses, cum_weights)
+    popular = {"Allston" : (ranked(allston), ranked(cambridge)), "Cambridge" : (ranked(allston), ranked(cambridge))}
+    pair_counts = {}
+    with open(os.path.join(out_dir, "enrollments.csv"), 'w') as fout:
+        cout = csv.writer(fout)
+        cout.writerow(["HUID", "TERM", "SUBJECT", "CATALOG", "CONCENTRATION", "CLASS_OF"])
+        for s in range(num_students):
+            huid = "%08d"%s
+            concentration = "Allston" if r.random() < 0.35 else "Cambridge"
+            (allston_pop, cambridge_pop) = popular[concentration]
+            frac_allston = 0.6 if concentration == "Allston" else 0.05
+            start = r.randrange(4)
+            career = []
+            for n in range(start, start + terms_per_student):
+                term = "%d %s"%(2015 + (n + 1) // 2, "Fall" if n % 2 == 0 else "Spring")
+                courses = set()
+                while len(courses) < courses_per_term:
+                    (pop, cum_weights) = allston_pop if r.random() < frac_allston else cambridge_pop
+                    courses.add(r.choices(pop, cum_weights=cum_weights)[0])
+                for cn in sorted(courses):
+                    (subj, catalog) = sct.parse_canonical_course_name(cn)
+                    cout.writerow([huid, term, subj, catalog, concentration, 2019 + (start + terms_per_student) // 2])
+                career.append(courses)
+
+            # Pairs of courses taken at most two terms apart
+            taken = {}
+            for (n, courses) in enumerate(career):
+                for cn in courses:
+                    taken.setdefault(cn, n)
+            names = sorted(taken)
+            for (i, cn1) in enumerate(names):
+                for cn2 in names[i+1:]:
+                    if abs(taken[cn1] - taken[cn2]) <= 2:
+                        pair_counts[(cn1, cn2)] = pair_counts.get((cn1, cn2), 0) + 1
+
+    num_conflicts = conflicts_per_course * (num_allston + num_cambridge)
+    with open(os.path.join(out_dir, "conflicts.csv"), 'w') as fout:
+        cout = csv.writer(fout)
+        cout.writerow(["Course1", "Course2", "W"])
+        for (p, n) in sorted(pair_counts.items(), key=lambda x: (-x[1], x[0]))[:num_conflicts]:
+            cout.writerow([p[0], p[1], n])
+
+    return dict(num_allston=num_allston, num_cambridge=num_cambridge, num_students=num_students,
+                terms_per_student=terms_per_student, courses_per_term=courses_per_term,
+                conflicts_per_course=conflicts_per_course, seed=seed)
+
+def load_instance(instance_dir):
+    """
+    Read an instance. Returns a triple (conflicts_d, sched_d, enroll_d), where sched_d still includes the courses
+    to schedule (so that their enrollments are kept).
+    """
+    with open(os.path.join(instance_dir, "conflicts.csv"), 'r') as fin:
+        cin = csv.reader(fin)
+        # discard first row (which contains headers).
+        h = next(cin)
+        conflicts_d = schedule_score.build_conflicts_d(cin)
+
+    schedule_file = os.path.join(instance_dir, "schedule.csv")
+    with open(schedule_file, 'r') as fin:
+        sched_d = sct.build_course_schedule(csv.reader(fin), filename=schedule_file)
+
+    enroll_d = schedule_score.load_enrollment_d(os.path.join(instance_dir, "enrollments.csv"), sched_d)
+    return (conflicts_d, sched_d, enroll_d)
+
+def _load_to_schedule(instance_dir, scheduler, sched_d):
+    with open(os.path.join(instance_dir, "to_schedule.csv"), 'r') as fin:
+        cin = csv.reader(fin)
+        # discard headers
+        h = next(cin)
+        if scheduler == "schedule_allston_courses":
+            return schedule_allston_courses.build_to_schedule_d(cin)
+        return schedule_courses.build_to_schedule_d(cin, sched_d)
+
+def _seconds(starttime):
+    return (datetime.datetime.now() - starttime).total_seconds()
+
+def _score(scheduler, fixed_sched_d, conflicts_d, enroll_d, courses_to_schedule_d, courses_to_mt_d):
+    """
+    Score a schedule as the scheduler does. Returns a pair (score, seconds).
+    """
+    module = schedule_allston_courses if scheduler == "schedule_allston_courses" else schedule_courses
+    starttime = datetime.datetime.now()
+    output_sched_d = module.make_sched_d_from_solution(fixed_sched_d, courses_to_mt_d)
+    if scheduler == "schedule_allston_courses":
+        (res, rt_blame, lunch_blame) = schedule_score.build_schedule_score(output_sched_d, conflicts_d, enroll_d, print_conflicts=False)
+    else:
+        (res, rt_blame, lunch_blame) = schedule_score.build_schedule_score(output_sched_d, conflicts_d, enroll_d, courses_to_count=courses_to_schedule_d, print_conflicts=False)
+    return (res, _seconds(starttime))
+
+def run_scheduler(scheduler, version, backend, conflicts_d, fixed_sched_d, enroll_d, courses_to_schedule_d, time_limit):
+    """
+    Build and solve the model of one scheduler once (or run local search, for the "local_search" backend), and
+    return a dictionary of the results.
+    """
+    module = schedule_allston_courses if scheduler == "schedule_allston_courses" else schedule_courses
+    row = dict(scheduler=scheduler, version=version, backend=backend, num_courses=len(courses_to_schedule_d))
+    fixed_conflicts = ss.fixed_conflict_index(fixed_sched_d)
+
+    if backend == "local_search":
+        starttime = datetime.datetime.now()
+        problem = module.build_local_search_problem(conflicts_d, fixed_sched_d, courses_to_schedule_d, fixed_conflicts)
+        row['build_seconds'] = _seconds(starttime)
+        starttime = datetime.datetime.now()
+        (courses_to_mt_d, cost) = local_search_scheduler.local_search(problem)
+        row['solve_seconds'] = _seconds(starttime)
+        row.update(status="FEASIBLE", objective=cost)
+    else:
+        module.SOLVER_BACKEND = backend
+        starttime = datetime.datetime.now()
+        if scheduler == "schedule_allston_courses":
+            schedule_allston_courses.SOLVER_VERSION = version
+            (solver, courses, conflict_vars_d) = module.build_schedule_model(conflicts_d, fixed_sched_d, courses_to_schedule_d, enroll_d, fixed_conflicts = fixed_conflicts)
+        else:
+            (solver, courses, conflict_vars_d) = module.build_schedule_model(conflicts_d, fixed_sched_d, courses_to_schedule_d, fixed_conflicts)
+        row['build_seconds'] = _seconds(starttime)
+        row.update(num_variables=solver.NumVariables(), num_constraints=solver.NumConstraints())
+
+        solver.SetTimeLimit(int(time_limit * 1000))
+        starttime = datetime.datetime.now()
+        status = solver.Solve()
+        row['solve_seconds'] = _seconds(starttime)
+        row['status'] = _STATUS_NAMES.get(status, str(status))
+        if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+            return row
+        row.update(objective=solver.Objective().Value(), gap=cpsat_backend.solution_gap(solver))
+        courses_to_mt_d = {cn : courses[cn].solution_meeting_time() for cn in courses}
+
+    (res, row['score_seconds']) = _score(scheduler, fixed_sched_d, conflicts_d, enroll_d, courses_to_schedule_d, courses_to_mt_d)
+    row.update(simple_score=list(res['simple_score']), conflict_score=res['conflict_score'], total_round_trips=res['total_round_trips'])
+    return row
+
+def run_benchmark(instance_dir, schedulers=SCHEDULERS, versions=(3,), backends=("cbc", "cpsat", "local_search"), time_limit=60):
+    """
+    Run the schedulers on the instance in instance_dir, with each of the solver versions (of schedule_allston_courses)
+    and backends. Returns a list of dictionaries of results (see run_scheduler), starting with one for the scorer on
+    the fixed schedule of the instance.
+    """
+    (conflicts_d, sched_d, enroll_d) = load_instance(instance_dir)
+
+    starttime = datetime.datetime.now()
+    (res, rt_blame, lunch_blame) = schedule_score.build_schedule_score(sched_d, conflicts_d, enroll_d, print_conflicts=False)
+    rows = [dict(scheduler="build_schedule_score", version=None, backend=None, num_courses=len(sched_d),
+                 score_seconds=_seconds(starttime), simple_score=list(res['simple_score']),
+                 conflict_score=res['conflict_score'], total_round_trips=res['total_round_trips'])]
+
+    for scheduler in schedulers:
+        courses_to_schedule_d = _load_to_schedule(instance_dir, scheduler, sched_d)
+        fixed_sched_d = {cn : cts for (cn, cts) in sched_d.items() if cn not in courses_to_schedule_d}
+        for version in (versions if scheduler == "schedule_allston_courses" else (None,)):
+            for backend in backends:
+                if backend == "local_search" and version not in (None, 3):
+                    # Local search doesn't depend on the solver version, and has no student schedule terms
+                    continue
+                print("Running %s%s with %s"%(scheduler, "" if version is None else " version %s"%version, backend))
+                rows.append(run_scheduler(scheduler, version, backend, conflicts_d, fixed_sched_d, enroll_d, courses_to_schedule_d, time_limit))
+    return rows
+
+def _git_commit():
+    try:
+        res = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    except OSError:
+        return None
+    return res.stdout.strip() if res.returncode == 0 else None
+
+def _result_key(row):
+    return (row['instance'], row['scheduler'], row['version'], row['backend'])
+
+def compare_reports(old, new):
+    """
+    Print the results of two reports side by side, for the runs that are in both.
+    """
+    print("Comparing %s (%s) with %s (%s)"%(old.get('commit'), old.get('date'), new.get('commit'), new.get('date')))
+    old_rows = {_result_key(row) : row for row in old['results']}
+    print("%-8s %-24s %-4s %-12s %21s %21s  %s"%("instance", "scheduler", "ver", "backend", "build secs", "solve secs", "simple score"))
+    for row in new['results']:
+        o = old_rows.get(_result_key(row))
+        if o is None:
+            continue
+        def secs(k):
+            if o.get(k) is None or row.get(k) is None:
+                return ""
+            return "%9.2f -> %9.2f"%(o[k], row[k])
+        def score():
+            if o.get('simple_score') == row.get('simple_score'):
+                return "same %s"%(row.get('simple_score'),)
+            return "%s -> %s"%(o.get('simple_score'), row.get('simple_score'))
+        print("%-8s %-24s %-4s %-12s %21s %21s  %s"%(row['instance'], row['scheduler'], row['version'] or "", row['backend'] or "",
+                                                   secs('build_seconds'), secs('solve_seconds') or secs('score_seconds'), score()))
+
+if __name__ == '__main__':
+    def usage():
+        print('Usage: benchmark_schedulers.py [-sizes small,medium,large] [-seed N] [-versions 1,2,3] [-backends cbc,cpsat,local_search] [-schedulers %s] [-time-limit SECONDS] [-instances DIR] [-out report.json] [-compare old_report.json]'%",".join(SCHEDULERS))
+        print('  Generates synthetic instances and runs the schedulers and the scorer on them')
+        print('  -sizes are the instance sizes to run (default small,medium), of %s'%", ".join("%s %s"%(k, v) for (k, v) in SIZES.items()))
+        print('  -seed is the random seed of the instances (default 0)')
+        print('  -versions are the solver versions of schedule_allston_courses to run (default 3)')
+        print('  -backends are the solver backends to run (default cbc,cpsat,local_search)')
+        print('  -time-limit is the time limit of each solve (default 60)')
+        print('  -instances DIR keeps the instances in DIR/SIZE (by default they are written to a temporary directory)')
+        print('  -out writes the report to a JSON file')
+        print('  -compare prints the results side by side with those of an earlier report')
+        sys.exit(1)
+
+    def process_flag_param_arg(args, flag):
+        if flag in args:
+            ind = args.index(flag)
+            res = args[ind+1]
+            del args[ind:ind+2]
+            return res
+        return None
+
+    def brief_warning(message, category, filename, lineno, line=None):
+        return "Warning: %s\n"%message
+
+    warnings.formatwarning = brief_warning
+
+    args = list(sys.argv[1:])
+    sizes = (process_flag_param_arg(args, "-sizes") or "small,medium").split(",")
+    seed = int(process_flag_param_arg(args, "-seed") or 0)
+    versions = [int(v) for v in (process_flag_param_arg(args, "-versions") or "3").split(",")]
+    backends = (process_flag_param_arg(args, "-backends") or "cbc,cpsat,local_search").split(",")
+    schedulers = (process_flag_param_arg(args, "-schedulers") or ",".join(SCHEDULERS)).split(",")
+    time_limit = float(process_flag_param_arg(args, "-time-limit") or 60)
+    instances_dir = process_flag_param_arg(args, "-instances")
+    output_file = process_flag_param_arg(args, "-out")
+    compare_file = process_flag_param_arg(args, "-compare")
+
+    if args or any(s not in SIZES for s in sizes) or any(v not in (1,2,3) for v in versions) or \
+       any(b not in cpsat_backend.BACKENDS + ("local_search",) for b in backends) or any(s not in SCHEDULERS for s in schedulers):
+        usage()
+
+    if instances_dir is None:
+        instances_dir = tempfile.mkdtemp(prefix="schedule_benchmark_")
+
+    report = dict(commit=_git_commit(), date=datetime.datetime.now().isoformat(timespec='seconds'),
+                  python=platform.python_version(), ortools=ortools.__version__, cpu_count=os.cpu_count(),
+                  cpsat_workers=cpsat_backend.NUM_WORKERS, time_limit=time_limit, instances={}, results=[])
+    for size in sizes:
+        instance_dir = os.path.join(instances_dir, size)
+        print("Generating %s instance in %s"%(size, instance_dir))
+        report['instances'][size] = synthetic_instance(instance_dir, seed=seed, **SIZES[size])
+        for row in run_benchmark(instance_dir, schedulers, versions, backends, time_limit):
+            row['instance'] = size
+            report['results'].append(row)
+
+    if output_file:
+        with open(output_file, 'w') as fout:
+            json.dump(report, fout, indent=1, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=1, sort_keys=True))
+
+    if compare_file:
+        with open(compare_file, 'r') as fin:
+            compare_reports(json.load(fin), report)
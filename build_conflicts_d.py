@@ -11,6 +11,7 @@ such pair maps to the count of the number of students with that conflict.
 """
 
 import make_name_dicts as md
+import artifacts
 import class_time as ct
 import sys
 
@@ -34,18 +35,20 @@ def build_conflicts_d (st_sched_d):
         conflict_pairs = set()
         
         for i in range(0,7):
-            # cs is the courses that the student takes on day i
-            cs = sched.days[i]
+            # cs is the courses that the student takes on day i (that have a time), as tuples
+            # (class id, start, end, in_allston); see class_time.student_sched.day_entries
+            cs = [e for e in sched.day_entries(i) if e[1] >= 0]
             for c1 in range(len(cs)-1):
-                for c2 in range(c1,len(cs)):
-                    # get the schedule entries
-                    sch_en1 = cs[c1]
-                    sch_en2 = cs[c2]
-                    if sch_en1.conflicts_with(sch_en2):
+                (id1, start1, end1, a1) = cs[c1]
+                for c2 in range(c1+1,len(cs)):
+                    (id2, start2, end2, a2) = cs[c2]
+                    # A class cannot conflict with itself
+                    if id1 != id2 and start1 < end2 and start2 < end1:
                         # the courses conflict!
                         # construct a pair ordered by class_num
-                        conflict_pairs.add((min(sch_en1.class_num,sch_en2.class_num),
-                                            max(sch_en1.class_num,sch_en2.class_num)))
+                        cn1 = sched.class_nums[id1]
+                        cn2 = sched.class_nums[id2]
+                        conflict_pairs.add((min(cn1,cn2), max(cn1,cn2)))
 
         # Now increment based on the conflict pairs
         for cp in conflict_pairs:
@@ -64,7 +67,7 @@ def build_conflicts_d (st_sched_d):
     return ret_d
 
 if __name__ == '__main__':
-    schedule_d = md.unpickle_data('student_schedule_d.pkl')
+    schedule_d = artifacts.load_dict(artifacts.STUDENT_SCHEDULE_FILE)
     conflicts_d = build_conflicts_d(schedule_d)
-    md.pickle_data('conflicts_d.pkl', conflicts_d)
+    artifacts.save_dict(artifacts.CONFLICTS_FILE, 'int', conflicts_d)
 
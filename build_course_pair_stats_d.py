@@ -18,7 +18,8 @@ would be bad (or good) if they conflict in the new schedule.
 """
 
 import warnings
-import sys, csv
+import sys, os, csv, tempfile, zlib
+import multiprocessing
 import make_name_dicts as md
 from allston_course_selector import will_be_allston_course_subj_catalog
 from collections import defaultdict
@@ -54,39 +55,58 @@ def parse_term(t):
     
     return (int(year), semester)
 
-def term_cmp(t1, t2):
+# Number of temporary files the enrollments are split into by stream_careers_partitioned
+STREAM_PARTITIONS = 64
+
+# Chronological order of the semesters within a year
+SEMESTER_ORDER = {"Spring": 0, "Summer": 1, "Fall": 2}
+
+class term_registry(object):
     """
-    Compare two terms in chronological order
+    Parses each distinct term string (e.g., "2018 Fall") once, the first time it is seen, and records integers for
+    it, so that comparing terms, and counting the terms between them, is integer arithmetic:
+      the ordinal of a term orders all terms chronologically, and
+      the number of a spring or fall term counts spring and fall terms, so that consecutive ones differ by one
+      (summer terms have no number).
     """
-    (y1, s1) = parse_term(t1)
-    (y2, s2) = parse_term(t2)
+    def __init__(self):
+        # dictionary from term string to (ordinal, number, semester)
+        self.terms_d = {}
 
-    if y1 < y2:
-        return -1
+    def register(self, t):
+        """
+        Returns the triple (ordinal, number, semester) for term t, registering t if needed.
+        """
+        info = self.terms_d.get(t)
+        if info is None:
+            (year, semester) = parse_term(t)
+            ordinal = year * len(SEMESTER_ORDER) + SEMESTER_ORDER[semester]
+            number = None if semester == "Summer" else year * 2 + (1 if semester == "Fall" else 0)
+            info = (ordinal, number, semester)
+            self.terms_d[t] = info
+        return info
 
-    if y2 < y1:
-        return 1
+    def ordinal(self, t):
+        return self.register(t)[0]
 
-    # same year
-    if s1 == s2:
-        return 0
-    if s1 == "Spring":
-        assert s2 in ["Summer", "Fall"]
-        return -1
+    def number(self, t):
+        (ordinal, number, semester) = self.register(t)
+        assert number is not None, "Term %s is not a spring or fall term"%t
+        return number
 
-    if s2 == "Spring":
-        assert s1 in ["Summer", "Fall"]
-        return 1
+    def semester(self, t):
+        return self.register(t)[2]
 
-    if s1 == "Summer":
-        assert s2 in ["Fall"]
-        return -1
+# The registry used by the functions below
+TERM_REGISTRY = term_registry()
 
-    if s2 == "Summer":
-        assert s1 in ["Fall"]
-        return 1
-    
-    assert False
+def term_cmp(t1, t2):
+    """
+    Compare two terms in chronological order
+    """
+    o1 = TERM_REGISTRY.ordinal(t1)
+    o2 = TERM_REGISTRY.ordinal(t2)
+    return (o1 > o2) - (o1 < o2)
 
 def term_diff(t1, t2):
     """
@@ -94,35 +114,13 @@ def term_diff(t1, t2):
     For example, if t1 is "2018 Spring" and t2 is "2018 Fall" then this function will return -1.
     For example, if t1 is "2018 Spring" and t2 is "2019 Spring" then this function will return -2.
     """
-    (y1, s1) = parse_term(t1)
-    (y2, s2) = parse_term(t2)
-
-    assert s1 in ["Spring", "Fall"]
-    assert s2 in ["Spring", "Fall"]
-
-    # Represent the terms as numbers and take the difference
-    n1 = y1 * 2
-    if s1 == "Fall":
-        n1 += 1
-        
-    n2 = y2 * 2
-    if s2 == "Fall":
-        n2 += 1
-
-    return n1 - n2
+    return TERM_REGISTRY.number(t1) - TERM_REGISTRY.number(t2)
         
 def is_summer_term(t):
     """
     Is this a summer term?
     """
-    (y1, s1) = parse_term(t)
-
-    if s1 == "Summer":
-        return True
-
-    assert s1 in ["Fall", "Spring"]
-    
-    return False
+    return TERM_REGISTRY.semester(t) == "Summer"
     
 class career(object):
     """
@@ -202,17 +200,36 @@ class course_pair_stats(object):
         """
         Invoked to count a student that took cn1 in term t1 and cn2 in term t2
         """
+        self.count_term_diff(term_diff(t1, t2))
+
+    def merge(self, other):
+        """
+        Add the counts of other, the course_pair_stats of the same pair of courses for other students, to this.
+        """
+        assert (self.cn1, self.cn2) == (other.cn1, other.cn2)
+        self.num_students += other.num_students
+        self.num_same_term += other.num_same_term
+        self.num_before += other.num_before
+        self.num_after += other.num_after
+        self.num_within_one += other.num_within_one
+        self.num_within_two += other.num_within_two
+        self.num_within_three += other.num_within_three
+
+    def count_term_diff(self, diff):
+        """
+        Invoked to count a student that took cn1 diff terms after cn2 (see term_diff), so diff is negative
+        if cn1 was taken first.
+        """
         self.num_students += 1
 
-        cmp = term_cmp(t1, t2)
-        if cmp < 0:
+        # Only spring and fall terms are counted, so the order of the terms is the sign of diff
+        if diff < 0:
             self.num_before += 1
-        elif cmp > 0:
+        elif diff > 0:
             self.num_after += 1
-        elif cmp == 0:
+        else:
             self.num_same_term += 1
 
-        diff = term_diff(t1, t2)
         if abs(diff) <= 1:
             self.num_within_one += 1
 
@@ -249,7 +266,7 @@ class course_stats(object):
         Invoked to count a student that took this sould in the given term
         """
         self.num_students += 1
-        (year, semester) = parse_term(term)
+        semester = TERM_REGISTRY.semester(term)
 
         assert semester in ["Fall", "Spring"]
         
@@ -261,6 +278,17 @@ class course_stats(object):
 
         self.term_enrollment[term] += 1
 
+    def merge(self, other):
+        """
+        Add the counts of other, the course_stats of the same course for other students, to this.
+        """
+        assert self.cn == other.cn
+        self.num_students += other.num_students
+        self.num_fall += other.num_fall
+        self.num_spring += other.num_spring
+        for term, n in other.term_enrollment.items():
+            self.term_enrollment[term] += n
+
     @property
     def is_large(self):
         # Course is large if it had more than 100 students in at least 2 terms
@@ -273,6 +301,42 @@ class course_stats(object):
         
         return len([True for enr in self.term_enrollment.values() if enr >= 100]) > 1
         
+def _read_enrollment(l, colindex):
+    """
+    Returns (huid, class_of, concentration, cn, term) from a row l of a multi-year enrollment file, where cn is the
+    canonical, cross-listed, course name.
+    """
+    huid = l[colindex["HUID"]]
+    concentration = l[colindex["CONCENTRATION"]]
+    term = l[colindex["TERM"]]
+    subject = l[colindex["SUBJECT"]]
+    catalog = l[colindex["CATALOG"]]
+
+    if "CLASS_OF" in colindex:
+        class_of = l[colindex["CLASS_OF"]]
+    else:
+        class_of = None
+
+    cn = canonical_course_name(subject, catalog)
+    cn = cross_list_canonical(cn)
+    return (huid, class_of, concentration, cn, term)
+
+def _add_enrollments(st_sched_d, csv_in, colindex):
+    """
+    Add the enrollments of the rows of csv_in to the careers in st_sched_d. Returns the number of rows.
+    """
+    count = 0
+    for l in csv_in:
+        count = count+1
+        (huid, class_of, concentration, cn, term) = _read_enrollment(l, colindex)
+
+        if huid not in st_sched_d:
+            # student is not yet in the dictionary.
+            st_sched_d[huid] = career(huid, class_of, concentration)
+
+        st_sched_d[huid].add_course(cn, term)
+    return count
+
 def build_career_sched(csv_in, colindex):
     """
     Build (1) a dictionary keyed by student id with value a student career schedule that reflects courses the
@@ -283,41 +347,178 @@ def build_career_sched(csv_in, colindex):
     :return: ???
     """
     st_sched_d = {}
-    count = 0
-    for l in csv_in:
-        count = count+1
-        huid = l[colindex["HUID"]]
-        concentration = l[colindex["CONCENTRATION"]]
-        term = l[colindex["TERM"]]
-        subject = l[colindex["SUBJECT"]]
-        catalog = l[colindex["CATALOG"]]
-
-        if "CLASS_OF" in colindex:
-            class_of = l[colindex["CLASS_OF"]]
-        else:
-            class_of = None
+    count = _add_enrollments(st_sched_d, csv_in, colindex)
+
+    print("Total enrollment entries: ",count)
+    return st_sched_d
+
+def build_career_sched_from_store(store, colindex):
+    """
+    Same as build_career_sched, but reading the enrollment data from an enrollment_store.enrollment_store.
+    colindex is as for build_career_sched, for the headers of the store.
+    """
+    # Work out the canonical, cross-listed course name once per distinct course, rather than once per row
+    (course_ids, courses) = store.distinct([colindex["SUBJECT"], colindex["CATALOG"]])
+    cns = [cross_list_canonical(canonical_course_name(subject, catalog)) for (subject, catalog) in courses]
+
+    huids = store.values(colindex["HUID"])
+    concentrations = store.values(colindex["CONCENTRATION"])
+    terms = store.values(colindex["TERM"])
+    class_ofs = store.values(colindex["CLASS_OF"]) if "CLASS_OF" in colindex else None
 
+    huid_ids = store.ids(colindex["HUID"]).tolist()
+    concentration_ids = store.ids(colindex["CONCENTRATION"]).tolist()
+    term_ids = store.ids(colindex["TERM"]).tolist()
+    class_of_ids = store.ids(colindex["CLASS_OF"]).tolist() if class_ofs is not None else [None] * len(huid_ids)
+
+    st_sched_d = {}
+    for (h, con, t, co, c) in zip(huid_ids, concentration_ids, term_ids, class_of_ids, course_ids.tolist()):
+        huid = huids[h]
         if huid not in st_sched_d:
             # student is not yet in the dictionary.
-            st_sched_d[huid] = career(huid, class_of, concentration)
+            st_sched_d[huid] = career(huid, class_ofs[co] if class_ofs is not None else None, concentrations[con])
 
-        car = st_sched_d[huid]
+        st_sched_d[huid].add_course(cns[c], terms[t])
+
+    print("Total enrollment entries: ",len(huid_ids))
+    return st_sched_d
+
+
+def build_career_sched_from_file(filename):
+    """
+    Build the dictionary of careers (see build_career_sched) from filename, which is either a multi-year enrollment
+    CSV file or a store directory created by enrollment_store.py.
+    """
+    if os.path.isdir(filename):
+        import enrollment_store
+        if enrollment_store.is_store(filename):
+            store = enrollment_store.enrollment_store(filename)
+            colindex = build_column_index(store.headers, ["HUID","TERM","SUBJECT","CATALOG", "CONCENTRATION"], ["CLASS_OF"])
+            return build_career_sched_from_store(store, colindex)
+
+    fin = open(filename, 'r')
+    cin = csv.reader(fin)
+
+    # discard first row (which contains headers)
+    headers = next(cin)
+    colindex = build_column_index(headers, ["HUID","TERM","SUBJECT","CATALOG", "CONCENTRATION"], ["CLASS_OF"])
+
+    st_sched_d = build_career_sched(cin, colindex)
+
+    fin.close()
+    return st_sched_d
+
+def stream_careers_sorted(csv_in, colindex):
+    """
+    Generate the careers (see build_career_sched) of the students in csv_in one at a time, for files whose rows are
+    sorted by HUID, so that only one student's career is in memory at once.
+    """
+    car = None
+    count = 0
+    for l in csv_in:
+        count = count+1
+        (huid, class_of, concentration, cn, term) = _read_enrollment(l, colindex)
+
+        if car is None or huid != car.huid:
+            if car is not None:
+                assert huid > car.huid, "Enrollments are not sorted by HUID: %s is after %s"%(huid, car.huid)
+                yield car
+            car = career(huid, class_of, concentration)
 
-        
-        cn = canonical_course_name(subject, catalog)
-        cn = cross_list_canonical(cn)
         car.add_course(cn, term)
 
+    if car is not None:
+        yield car
     print("Total enrollment entries: ",count)
+
+def _partition_enrollments(csv_in, colindex, tmp_dir, num_partitions):
+    """
+    Split the rows of csv_in by HUID into num_partitions CSV files in tmp_dir, so that all the rows of a student are
+    in the same file. Returns (list of the file names, number of rows).
+    """
+    names = [os.path.join(tmp_dir, "part%d.csv"%i) for i in range(num_partitions)]
+    files = [open(name, 'w', newline='') for name in names]
+    writers = [csv.writer(f) for f in files]
+    count = 0
+    for l in csv_in:
+        count = count+1
+        writers[zlib.crc32(l[colindex["HUID"]].encode('utf-8')) % num_partitions].writerow(l)
+    for f in files:
+        f.close()
+    return (names, count)
+
+def _read_partition(name, colindex):
+    """
+    Build the dictionary of careers (see build_career_sched) of a file written by _partition_enrollments.
+    """
+    st_sched_d = {}
+    with open(name, 'r', newline='') as fin:
+        _add_enrollments(st_sched_d, csv.reader(fin), colindex)
     return st_sched_d
 
+def stream_careers_partitioned(csv_in, colindex, num_partitions=STREAM_PARTITIONS):
+    """
+    Generate the careers (see build_career_sched) of the students in csv_in, for files in any order. The rows are
+    first split by HUID into num_partitions temporary files, so that all the rows of a student are in the same file,
+    and then the careers of one file at a time are built and generated. So only about 1/num_partitions of the
+    careers are in memory at once.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        (names, count) = _partition_enrollments(csv_in, colindex, tmp_dir, num_partitions)
+        for name in names:
+            for car in _read_partition(name, colindex).values():
+                yield car
+
+    print("Total enrollment entries: ",count)
 
-def build_course_pair_stats_d(st_sched_d):
+def _open_multi_year(filename):
+    """
+    Open filename (a multi-year enrollment CSV file, or a store directory created by enrollment_store.py).
+    Returns (file to close or None, generator of the rows after the header row, column index).
+    """
+    fin = None
+    if os.path.isdir(filename):
+        import enrollment_store
+        cin = enrollment_store.open_enrollments(filename)
+    else:
+        fin = open(filename, 'r')
+        cin = csv.reader(fin)
+
+    # discard first row (which contains headers)
+    headers = next(cin)
+    colindex = build_column_index(headers, ["HUID","TERM","SUBJECT","CATALOG", "CONCENTRATION"], ["CLASS_OF"])
+    return (fin, cin, colindex)
+
+def stream_careers_from_file(filename, is_sorted=False, num_partitions=STREAM_PARTITIONS):
+    """
+    Generate the careers in filename (a multi-year enrollment CSV file, or a store directory created by
+    enrollment_store.py) one at a time (see stream_careers_sorted and stream_careers_partitioned). If is_sorted,
+    the rows of the file must be sorted by HUID.
+    """
+    (fin, cin, colindex) = _open_multi_year(filename)
+
+    if is_sorted:
+        for car in stream_careers_sorted(cin, colindex):
+            yield car
+    else:
+        for car in stream_careers_partitioned(cin, colindex, num_partitions):
+            yield car
+
+    if fin is not None:
+        fin.close()
+
+def count_careers(careers):
+    """
+    Count the pairs of courses of the careers (an iterable of career objects, e.g., from one of the stream_careers
+    functions), one career at a time. Returns (course_pair_stats_d, course_stats_d); see build_course_pair_stats_d.
+    """
     course_stats_d = {}
     course_pair_stats_d = {}
     # For each student, go through their career courses and record information about each pair
-    for huid, car in st_sched_d.items():
+    for car in careers:
         clist = list(car.courses_d.keys())
+        # the term numbers (see term_registry) of the courses
+        nlist = [TERM_REGISTRY.number(car.courses_d[cn]) for cn in clist]
         for i in range(len(clist)):
             (cn_i, t_i) = (clist[i], car.courses_d[clist[i]])
 
@@ -327,11 +528,11 @@ def build_course_pair_stats_d(st_sched_d):
             course_stats_d[cn_i].count_student(t_i)
             
             for j in range(i+1, len(clist)):
-                (cn_j, t_j) = (clist[j], car.courses_d[clist[j]])
+                cn_j = clist[j]
 
                 
                 cp = (cn_i, cn_j) if cn_i < cn_j else (cn_j, cn_i)
-                tp = (t_i, t_j) if cn_i < cn_j else (t_j, t_i)
+                diff = nlist[i] - nlist[j] if cn_i < cn_j else nlist[j] - nlist[i]
 
                 if cp not in course_pair_stats_d:
                     (subj1, cat1) = parse_canonical_course_name(cp[0])
@@ -342,10 +543,64 @@ def build_course_pair_stats_d(st_sched_d):
                     course_pair_stats_d[cp] = course_pair_stats(cp[0], cp[1], cn1_in_allston, cn2_in_allston)
 
                 stats = course_pair_stats_d[cp]
-                stats.count_student(tp[0], tp[1])
+                stats.count_term_diff(diff)
 
     return (course_pair_stats_d, course_stats_d)
 
+def build_course_pair_stats_d(st_sched_d, backend="python"):
+    # backend is "python" or "numpy". The numpy backend (see course_pair_stats_numpy.py) gives the same
+    # results, and is much faster for many students.
+    assert backend in ("python", "numpy"), backend
+    if backend == "numpy":
+        import course_pair_stats_numpy
+        return course_pair_stats_numpy.build_course_pair_stats_d(st_sched_d)
+
+    return count_careers(st_sched_d.values())
+
+
+def merge_stats_d(into_d, from_d):
+    """
+    Add the counts of from_d, a dictionary of course_pair_stats or of course_stats (e.g., for one set of
+    students), to into_d, a dictionary of the same kind (e.g., for another set of students). Updates into_d,
+    and may use the values of from_d in it.
+    """
+    for k, v in from_d.items():
+        if k in into_d:
+            into_d[k].merge(v)
+        else:
+            into_d[k] = v
+
+def _count_partition(args):
+    """
+    Used by count_careers_sharded to count the pairs of courses of the students in a partition file.
+    """
+    (name, colindex, backend) = args
+    return build_course_pair_stats_d(_read_partition(name, colindex), backend)
+
+def count_careers_sharded(filename, num_jobs, backend="python", num_partitions=STREAM_PARTITIONS):
+    """
+    Same as build_course_pair_stats_d(build_career_sched_from_file(filename), backend), but the students are split
+    by HUID into num_partitions shards (see _partition_enrollments), which are counted by a pool of num_jobs
+    processes, and the partial tables are then merged.
+    """
+    (fin, cin, colindex) = _open_multi_year(filename)
+    course_pair_stats_d = {}
+    course_stats_d = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        (names, count) = _partition_enrollments(cin, colindex, tmp_dir, num_partitions)
+        if fin is not None:
+            fin.close()
+        print("Total enrollment entries: ",count)
+
+        pool = multiprocessing.Pool(num_jobs)
+        try:
+            for (pair_d, stats_d) in pool.imap_unordered(_count_partition, [(name, colindex, backend) for name in names]):
+                merge_stats_d(course_pair_stats_d, pair_d)
+                merge_stats_d(course_stats_d, stats_d)
+        finally:
+            pool.terminate()
+
+    return (course_pair_stats_d, course_stats_d)
 
 def build_column_index(headers, required_cols, optional_cols):
     """
@@ -382,10 +637,36 @@ def build_column_index(headers, required_cols, optional_cols):
 if __name__ == '__main__':
 
     def usage():
-        print('Usage: build_course_pair_stats_d <multi-year-enrollments.csv>')
+        print('Usage: build_course_pair_stats_d [-numpy] [-stream [-sorted] | -jobs N] <multi-year-enrollments.csv>')
+        print('  The enrollments may also be a store directory created by enrollment_store.py')
+        print('  -numpy counts the pairs of courses with NumPy (see course_pair_stats_numpy.py), which is faster')
+        print('  -stream reads one student at a time, so that memory is not needed for all the students at once.')
+        print('     The enrollments are first split by student into temporary files, unless -sorted is given,')
+        print('     which says the enrollments are already sorted by HUID')
+        print('  -jobs N splits the students into shards, and counts them with N processes')
         sys.exit(1)
         
-    if len(sys.argv) != 2:
+    args = list(sys.argv[1:])
+    backend = "python"
+    if "-numpy" in args:
+        backend = "numpy"
+        args.remove("-numpy")
+    stream = "-stream" in args
+    if stream:
+        args.remove("-stream")
+    is_sorted = "-sorted" in args
+    if is_sorted:
+        args.remove("-sorted")
+
+    num_jobs = None
+    if "-jobs" in args:
+        ind = args.index("-jobs")
+        if ind + 1 >= len(args):
+            usage()
+        num_jobs = int(args[ind+1])
+        del args[ind:ind+2]
+
+    if len(args) != 1 or (stream and backend == "numpy") or (is_sorted and not stream) or (stream and num_jobs is not None):
         usage()
 
 
@@ -395,23 +676,21 @@ if __name__ == '__main__':
     warnings.formatwarning = brief_warning
 
 
-    filename = sys.argv[1]
-
-    fin = open(filename, 'r')
-    cin = csv.reader(fin)
-
-    # discard first row (which contains headers)
-    headers = next(cin)
-    colindex = build_column_index(headers, ["HUID","TERM","SUBJECT","CATALOG", "CONCENTRATION"], ["CLASS_OF"])
-
-    st_sched_d = build_career_sched(cin, colindex)
+    # imported here, since artifacts imports this module
+    import artifacts
 
-    fin.close()
-    
-    res = build_course_pair_stats_d(st_sched_d)
+    if stream:
+        res = count_careers(stream_careers_from_file(args[0], is_sorted))
+    elif num_jobs is not None:
+        res = count_careers_sharded(args[0], num_jobs, backend)
+    else:
+        st_sched_d = build_career_sched_from_file(args[0])
+        res = build_course_pair_stats_d(st_sched_d, backend)
 
-    outfilename = 'course_pair_stats_d.pkl'
+    outfilename = artifacts.COURSE_PAIR_STATS_FILE
     print('Writing file %s'%outfilename)
-    md.pickle_data(outfilename, res)
+    (course_pair_stats_d, course_stats_d) = res
+    artifacts.save(outfilename, [('course_pair_stats_d', 'course_pair_stats', course_pair_stats_d),
+                                 ('course_stats_d', 'course_stats', course_stats_d)])
 
     
@@ -53,6 +53,19 @@ def build_ct_d(csv_in, convert_to_allston):
         
     return ret_d
 
+def build_ct_d_from_file(filename, convert_to_allston):
+    """
+    Same as build_ct_d, reading the course times from the CSV file filename (which has a header row).
+    """
+    fin = open(filename, 'r')
+    cin = csv.reader(fin)
+    h = next(cin)
+
+    class_time_d = build_ct_d(cin, convert_to_allston)
+
+    fin.close()
+    return class_time_d
+
 if __name__ == '__main__':
 
     def usage():
@@ -81,11 +94,5 @@ if __name__ == '__main__':
         else:
             usage()
 
-    fin = open(filename, 'r')
-    cin = csv.reader(fin)
-    h = next(cin)
-
-    class_time_d = build_ct_d(cin, convert_to_allston)
-
-    fin.close()
+    class_time_d = build_ct_d_from_file(filename, convert_to_allston)
     mnd.pickle_data('class_time_d.pkl', class_time_d)
\ No newline at end of file
@@ -10,6 +10,7 @@ between 11am and 2pm.
 """
 
 import make_name_dicts as md
+import artifacts
 import class_time as ct
 import sys
 
@@ -59,15 +60,11 @@ def build_no_lunch_d (st_sched_d):
     for k,sched in st_sched_d.items():
         no_lunch_days = 0
         for i in range(0,7):
-            # cs is the list courses that the student takes on day i, sorted by start time.
-
             avail_lunch = [(lunch_start, lunch_end)]
-            cs = sched.days[i]
-            for sch_en in cs:                
-                # get the time interval for sch_en and remove it from avail_lunch
-                inter = sch_en.as_interval()
-                if inter is not None:
-                    avail_lunch = subtract_interval(avail_lunch, inter)
+            for (class_id, start, end, in_allston) in sched.day_entries(i):
+                # remove the time interval of the class (if it has a time) from avail_lunch
+                if start >= 0:
+                    avail_lunch = subtract_interval(avail_lunch, (start, end))
 
             # Now see if any lunch time remains...
             has_lunch = False
@@ -87,7 +84,7 @@ def build_no_lunch_d (st_sched_d):
     return no_lunch_d
 
 if __name__ == '__main__':
-    schedule_d = md.unpickle_data('student_schedule_d.pkl')
+    schedule_d = artifacts.load_dict(artifacts.STUDENT_SCHEDULE_FILE)
     no_lunch_d = build_no_lunch_d(schedule_d)
     md.pickle_data('no_lunch_d.pkl', no_lunch_d)
 
@@ -10,7 +10,7 @@ the schedule is in terms of round trips to Allston and schedules without lunch.
 """
 
 import warnings
-import sys, csv, string
+import sys, os, csv, string
 import make_name_dicts as md
 import class_time as ct
 from allston_course_selector import will_be_allston_course_canonical_cn
@@ -148,6 +148,57 @@ def build_enrollment_d(cin, sched_d):
         
 
     
+    return _enrollment_d_from_scheds(scheds_d)
+
+def build_enrollment_d_from_store(store, sched_d):
+    """
+    Same as build_enrollment_d, but reading the enrollment data from an enrollment_store.enrollment_store.
+    """
+    import enrollment_store
+
+    # Get rid of unprintable characters in the headers
+    h = [''.join(filter(lambda x: x in string.printable, t)) for t in store.headers]
+    required_cols = [["HUID"], ["TERM"], ["SUBJECT"], ["CATALOG"]]
+    cols = col_index("enrollment data file", h, required_cols, [])
+
+    # ignore summer term
+    keep = store.value_mask(cols["TERM"], lambda term: 'Summer' not in term)
+
+    # Work out the canonical course name once per distinct course, rather than once per row
+    (course_ids, courses) = store.distinct([cols["SUBJECT"], cols["CATALOG"]], keep)
+    cns = [sct.canonical_course_name(subj, cat) for (subj, cat) in courses]
+    cns = [cn if cn in sched_d else None for cn in cns]
+
+    # Build a dictionary from (HUID, term) to course schedules.
+    (sched_ids, _) = store.distinct([cols["HUID"], cols["TERM"]], keep)
+    scheds_d = { }
+    for (sched_id, sched_course_ids) in enrollment_store.group_by(sched_ids, course_ids):
+        s = {cns[c] for c in sched_course_ids.tolist() if cns[c] is not None}
+        if s:
+            scheds_d[sched_id] = s
+
+    return _enrollment_d_from_scheds(scheds_d)
+
+def load_enrollment_d(path, sched_d):
+    """
+    Build the enrollment dictionary (see build_enrollment_d) from path, which is either an enrollment CSV file or
+    a store directory created by enrollment_store.py.
+    """
+    if os.path.isdir(path):
+        import enrollment_store
+        if enrollment_store.is_store(path):
+            return build_enrollment_d_from_store(enrollment_store.enrollment_store(path), sched_d)
+
+    fin = open(path, 'r')
+    cin = csv.reader(fin)
+    enroll_d = build_enrollment_d(cin, sched_d)
+    fin.close()
+    return enroll_d
+
+def _enrollment_d_from_scheds(scheds_d):
+    """
+    Given a dictionary from (HUID, term) to sets of canonical course names, return the enrollment dictionary (see build_enrollment_d).
+    """
     # Now convert it to a dictionary from frozen set of canonical course names (i.e., courses taken in a term) to ints (counting how many students had that set of courses)
     enrollments_d = {}
     for s in scheds_d.values():
@@ -203,6 +254,98 @@ def num_allston_courses(cns):
 
     return allston_count
 
+class enrollment_index(object):
+    """
+    An index over enrollment data (see build_enrollment_d), so that the sets of courses that involve a
+    given course can be found without scanning all of the enrollment data. Each distinct set of courses is
+    given an integer id. For each id, the index records the frozen set of courses (sets), the number of students
+    that took that set (counts), and the number of its courses that will be in Allston (num_allston).
+    It also maps each canonical course name to the sorted list of ids of the sets that contain it.
+    """
+    def __init__(self, enroll_d):
+        self.sets = []
+        self.counts = []
+        self.num_allston = []
+        self.ids = {}
+        self.course_sets = {}
+
+        for fs, count in enroll_d.items():
+            i = len(self.sets)
+            self.ids[fs] = i
+            self.sets.append(fs)
+            self.counts.append(count)
+            self.num_allston.append(num_allston_courses(fs))
+            for cn in fs:
+                if cn not in self.course_sets:
+                    self.course_sets[cn] = []
+                self.course_sets[cn].append(i)
+
+    def __len__(self):
+        return len(self.sets)
+
+    def sets_with_course(self, cn):
+        """
+        Return the (sorted) list of ids of the sets that contain course cn.
+        """
+        return self.course_sets.get(cn, [])
+
+    def sets_with_any(self, cns):
+        """
+        Return the sorted list of ids of the sets that contain at least one of the courses in cns.
+        """
+        ids = set()
+        for cn in cns:
+            ids.update(self.course_sets.get(cn, []))
+        return sorted(ids)
+
+    def sets_with_all(self, cns):
+        """
+        Return the sorted list of ids of the sets that contain all of the courses in cns.
+        """
+        ids = None
+        for cn in sorted(cns, key=lambda cn: len(self.course_sets.get(cn, []))):
+            if ids is None:
+                ids = set(self.course_sets.get(cn, []))
+            else:
+                ids.intersection_update(self.course_sets.get(cn, []))
+            if not ids:
+                break
+        return sorted(ids) if ids else []
+
+def build_student_schedule_days(fs, sched_d):
+    """
+    Build the schedule for a single frozen set of canonical course names fs (see build_student_schedules).
+    Returns a pair (ffs, days) where ffs is the frozen set of the courses of fs that were found in sched_d,
+    and days is a dictionary from day (string, "M", "T", "W", "Th", "F") to a sorted list of tuples (start, end, location, cn).
+    """
+    days = {}
+
+    for dn in sct.DAYNAMES:
+        days[dn] = [ ]
+
+    found_courses = []
+
+    for cn in fs:
+        # cn is a course name
+        # sched_d[cn] is a list of sct.course_time objects
+        if cn in sched_d:
+            found_courses.append(cn)
+        else:
+            #XXX!@! warnings.warn("Did not find course %s in the schedule file"%cn)
+            continue
+
+        location = "Allston" if will_be_allston_course_canonical_cn(cn) else "Cambridge"
+        for ct in sched_d[cn]:
+            for i in range(len(sct.DAYNAMES)):
+                if ct.days[i]:
+                    # This course has times on sct.DAYNAMES[i]
+                    days[sct.DAYNAMES[i]].append((ct.time_start, ct.time_end, location, cn))
+
+    for dn in days:
+        days[dn].sort()
+
+    return (frozenset(found_courses), days)
+
 def build_student_schedules(enroll_d, sched_d):
     """
     Given a dictionary from frozen set of canonical course names (i.e., courses taken in a term),
@@ -215,37 +358,22 @@ def build_student_schedules(enroll_d, sched_d):
     ss_d = {}
     for fs in enroll_d:
         # fs is a set of canonical course names
-
-        days = {}
-        
-        for dn in sct.DAYNAMES:
-            days[dn] = [ ]
-
-        found_courses = []
-
-        for cn in fs:
-            # cn is a course name
-            # sched_d[cn] is a list of sct.course_time objects
-            if cn in sched_d:
-                found_courses.append(cn)
-            else:
-                #XXX!@! warnings.warn("Did not find course %s in the schedule file"%cn)
-                continue
-                
-            location = "Allston" if will_be_allston_course_canonical_cn(cn) else "Cambridge"
-            for ct in sched_d[cn]:
-                for i in range(len(sct.DAYNAMES)):
-                    if ct.days[i]:
-                        # This course has times on sct.DAYNAMES[i]
-                        days[sct.DAYNAMES[i]].append((ct.time_start, ct.time_end, location, cn))
-                        # be inefficient and sort the days array every time we add to it...
-                        days[sct.DAYNAMES[i]].sort()
-
-        ffs = frozenset(found_courses)
+        (ffs, days) = build_student_schedule_days(fs, sched_d)
         ss_d[ffs] = days
         
     return ss_d
 
+def _conflict_description(cn1, cn2, weight, sched_d):
+    return "  %-12s and %-12s conflict (weight %3s)! %s and %s"%(cn1,cn2,weight,";".join(str(e) for e in sched_d[cn1]),";".join(str(e) for e in sched_d[cn2]))
+
+def _print_conflicts(conflict_output_d):
+    """
+    Print the conflicts in conflict_output_d (a dictionary from conflict description to weight), least bad first.
+    """
+    print("Conflicts")
+    for s in sorted(conflict_output_d.keys(), key= lambda k: conflict_output_d[k]):
+        print(s)
+
 def compute_conflict_score(conflicts_d, sched_d, courses_to_count=None,print_conflicts=True,large_courses={}):
     score = 0
   
@@ -270,19 +398,51 @@ def compute_conflict_score(conflicts_d, sched_d, courses_to_count=None,print_con
             
             # Let's see if cn1 and cn2 conflict
             if weight > 0 and sct.courses_conflict(sched_d[cn1], sched_d[cn2]):
-                s = "  %-12s and %-12s conflict (weight %3s)! %s and %s"%(cn1,cn2,weight,";".join(str(e) for e in sched_d[cn1]),";".join(str(e) for e in sched_d[cn2]))
+                s = _conflict_description(cn1, cn2, weight, sched_d)
                 conflict_output_d[s] = int(weight)
                 score += float(weight)
 
     # sort and print conflicts
     if print_conflicts:
-        print("Conflicts")
-        for s in sorted(conflict_output_d.keys(), key= lambda k: conflict_output_d[k]):
-            print(s)
+        _print_conflicts(conflict_output_d)
     
     return score
             
 
+def count_round_trips_for_schedule(days):
+    """
+    Count the round trips to Allston for the schedule of a single set of courses.
+    :param days: a dictionary from day to list of tuples (start, end, location, cn), as built by build_student_schedule_days
+    :return: a triple (day_counts, week_count, blame), where day_counts is a dictionary from day to the number of
+             round trips on that day, week_count is the number of round trips in the week, and blame is a list
+             of frozen sets of the Allston courses on each day with more than one round trip.
+    """
+    day_counts = {}
+    week_count = 0
+    blame = []
+    for dn in days:
+        lst = days[dn]
+        # lst is a list of tuples indicating location
+
+        day_count = 0
+        current_loc = "Cambridge"
+        for (start, end, loc, cn) in lst:
+            if loc != current_loc:
+                current_loc = loc
+                if loc == "Allston":
+                    # count a trip to Allston as a round trip (since they need to return eventually to Cambridge)
+                    day_count += 1
+                    week_count += 1
+
+        if day_count > 1:
+            # More than one round trip to Allston in a day :(
+            # Blame the Allston courses on that day.
+            blame.append(frozenset({cn for (start, end, loc, cn) in lst if loc == "Allston" }))
+
+        day_counts[dn] = day_count
+
+    return (day_counts, week_count, blame)
+
 def count_round_trips(student_schedule_d, enroll_d):
     """
     Given a dictionary of student schedules (see build_student_schedules), returns a dictionary with keys "M", "T", etc., and "week".
@@ -294,35 +454,19 @@ def count_round_trips(student_schedule_d, enroll_d):
     ret_d['week'] = {i:0 for i in range(8)}
 
     multi_round_trip_blame = {}
-    too_few_courses = 0
     
     for fs in student_schedule_d:
         
         num_students = enroll_d.get(fs,0)
-        week_count = 0
-        for dn in student_schedule_d[fs]:
-            lst = student_schedule_d[fs][dn]
-            # lst is a list of tuples indicating location
-
-            day_count = 0
-            current_loc = "Cambridge"
-            for (start, end, loc, cn) in lst:
-                if loc != current_loc:
-                    current_loc = loc
-                    if loc == "Allston":
-                        # count a trip to Allston as a round trip (since they need to return eventually to Cambridge)
-                        day_count += 1
-                        week_count += 1
-
-            if day_count > 1:
-                # More than one round trip to Allston in a day :(
-                # Blame the Allston courses on that day.
-                allston_courses = frozenset({cn for (start, end, loc, cn) in lst if loc == "Allston" })
-                if allston_courses not in multi_round_trip_blame:
-                    multi_round_trip_blame[allston_courses] = num_students
-                else:
-                    multi_round_trip_blame[allston_courses] += num_students
-                    
+        (day_counts, week_count, blame) = count_round_trips_for_schedule(student_schedule_d[fs])
+
+        for allston_courses in blame:
+            if allston_courses not in multi_round_trip_blame:
+                multi_round_trip_blame[allston_courses] = num_students
+            else:
+                multi_round_trip_blame[allston_courses] += num_students
+
+        for dn, day_count in day_counts.items():
             if day_count not in ret_d[dn]:
                 ret_d[dn][day_count] = 0
                 
@@ -334,119 +478,132 @@ def count_round_trips(student_schedule_d, enroll_d):
 
     return (ret_d, multi_round_trip_blame)
 
-def count_no_lunches(student_schedule_d, enroll_d, only_allston=False, due_to_allston=False):
+
+LUNCH_START = 11*60 # 11AM
+LUNCH_END = 14*60 # 2PM
+LUNCH_DURATION = 30 # 30 minutes for lunch
+
+def _subtract_interval(inter_l, inter):
     """
-    Given a dictionary of student schedules (see build_student_schedules), returns a dictionary with integer keys (number of days) to number of students with no time for lunch on that many days,
-    i.e. no 30 minute break between 
+    An interval is a pair on integers (a,b) such that a < b.
+    inter_l is a list of intervals such
+    that for (a,b)=inter_l[i] and (c,d)=inter_l[i+1], we have
+    b < c. Argument inter is a pair such that we want to remove the interval
+    inter from the list of intervals.
+
+    For example, if inter_l = [(10,20),(30,40)]  and inter = (15,35), the result
+    will be a list [(10,15),(35,40)], i.e., the list now is intervals that do not
+    intersect with inter.
     """
-    ret_d = {i:0 for i in range(8)}
+    (x,y) = inter
+    out = []
+    for (a,b) in inter_l:
+        if y <= a or x >= b:
+            # no intersection!
+            out.append((a,b))
+            continue
 
-    lunch_start = 11*60 # 11AM
-    lunch_end = 14*60 # 2PM
-    lunch_duration = 30 # 30 minutes for lunch
+        if  a < x:
+            out.append((a,x))
 
-    def subtract_interval(inter_l, inter):
-        """
-        An interval is a pair on integers (a,b) such that a < b.
-        inter_l is a list of intervals such
-        that for (a,b)=inter_l[i] and (c,d)=inter_l[i+1], we have
-        b < c. Argument inter is a pair such that we want to remove the interval
-        inter from the list of intervals.
-        
-        For example, if inter_l = [(10,20),(30,40)]  and inter = (15,35), the result
-        will be a list [(10,15),(35,40)], i.e., the list now is intervals that do not
-        intersect with inter.
-        """
-        (x,y) = inter
-        out = []
-        for (a,b) in inter_l:
-            if y <= a or x >= b:
-                # no intersection!
-                out.append((a,b))
-                continue
+        if y < b:
+            out.append((y,b))
 
-            if  a < x:                
-                out.append((a,x))
-                
-            if y < b:                
-                out.append((y,b))
+    return out
 
-        return out
+# Dictionary from "hh:mm" time to minutes after midnight, for _subtract_from_lunch
+_minutes_d = {}
 
+def _minutes(t):
+    m = _minutes_d.get(t)
+    if m is None:
+        (h, mi) = ct.time_to_hm(t)
+        m = _minutes_d[t] = h*60 + mi
+    return m
 
-    def subtract_from_lunch(inter_l, start_time, end_time):
-        (start_h, start_m) = ct.time_to_hm(start_time)
-        (end_h, end_m) = ct.time_to_hm(end_time)
-        inter = (start_h*60 + start_m, end_h*60 + end_m)
-        
-        assert inter[0] <= inter[1]
-        
-        return subtract_interval(inter_l, inter)
-    
-    def has_time_for_lunch(inter_l):
-        for (a,b) in inter_l:
-            if lunch_duration <= (b-a):
-                return True
-        return False
-    
-    too_few_courses = 0
+def _subtract_from_lunch(inter_l, start_time, end_time):
+    inter = (_minutes(start_time), _minutes(end_time))
 
-    lunch_blame = {}
-    
-    for fs in student_schedule_d:
-        
-        num_students = enroll_d.get(fs,0)
-        no_lunch_days = 0
+    assert inter[0] <= inter[1]
+
+    return _subtract_interval(inter_l, inter)
+
+def _has_time_for_lunch(inter_l):
+    for (a,b) in inter_l:
+        if LUNCH_DURATION <= (b-a):
+            return True
+    return False
 
-        camb_cns = []
-        alls_cns = []
-        for cn in fs:
-            if will_be_allston_course_canonical_cn(cn):
-                alls_cns.append(cn)
+def count_no_lunches_for_schedule(fs, days, only_allston=False, due_to_allston=False):
+    """
+    Count the days without time for lunch for the schedule of a single set of courses fs.
+    :param days: a dictionary from day to list of tuples (start, end, location, cn), as built by build_student_schedule_days
+    :return: None if the schedule should not be counted (i.e., only_allston is set and fs has no Allston courses),
+             otherwise a pair (no_lunch_days, blame), where blame is a list of frozen sets of the Allston courses
+             that took away lunch on each day.
+    """
+    if only_allston and not any(will_be_allston_course_canonical_cn(cn) for cn in fs):
+        # check to make sure the courses include at least one allston course_time
+        return None
+
+    no_lunch_days = 0
+    blame = []
+    for dn in days:
+        avail_lunch = [(LUNCH_START, LUNCH_END)]
+
+        lst = days[dn]
+        # lst is a list of tuples indicating times and location
+
+        # Remove cambridge times
+        for (start, end, loc, cn) in lst:
+            if loc == "Cambridge":
+                avail_lunch = _subtract_from_lunch(avail_lunch, start, end)
             else:
-                camb_cns.append(cn)
+                assert loc == "Allston"
 
+        # Now see if any lunch time remains...
 
-        if only_allston and len(alls_cns) == 0:
-            # check to make sure the courses include at least one allston course_time
+        if not _has_time_for_lunch(avail_lunch):
+            if not due_to_allston:
+                no_lunch_days += 1
             continue
 
-        for dn in student_schedule_d[fs]:
-            avail_lunch = [(lunch_start, lunch_end)]
-            
-            lst = student_schedule_d[fs][dn]
-            # lst is a list of tuples indicating times and location
+        assert _has_time_for_lunch(avail_lunch)
 
-            # Remove cambridge times
-            for (start, end, loc, cn) in lst:
-                if loc == "Cambridge":
-                    avail_lunch = subtract_from_lunch(avail_lunch, start, end)
-                else:
-                    assert loc == "Allston"
+        # Now remove Allston times
+        blame_courses = set()
+        for (start, end, loc, cn) in lst:
+            if loc == "Allston":
+                new_avail_lunch = _subtract_from_lunch(avail_lunch, start, end)
+                if avail_lunch != new_avail_lunch:
+                    blame_courses.add(cn)
+                avail_lunch = new_avail_lunch
 
-            # Now see if any lunch time remains...
+        if not _has_time_for_lunch(avail_lunch):
+            no_lunch_days += 1
+            blame.append(frozenset(blame_courses))
 
-            if not has_time_for_lunch(avail_lunch):
-                if not due_to_allston:
-                    no_lunch_days += 1
-                continue
+    return (no_lunch_days, blame)
 
-            assert has_time_for_lunch(avail_lunch)
+def count_no_lunches(student_schedule_d, enroll_d, only_allston=False, due_to_allston=False):
+    """
+    Given a dictionary of student schedules (see build_student_schedules), returns a dictionary with integer keys (number of days) to number of students with no time for lunch on that many days,
+    i.e. no 30 minute break between 
+    """
+    ret_d = {i:0 for i in range(8)}
 
-            # Now remove Allston times
-            blame_courses = set()
-            for (start, end, loc, cn) in lst:
-                if loc == "Allston":
-                    new_avail_lunch = subtract_from_lunch(avail_lunch, start, end)
-                    if avail_lunch != new_avail_lunch:
-                        blame_courses.add(cn)
-                    avail_lunch = new_avail_lunch
-                    
-            if not has_time_for_lunch(avail_lunch):
-                no_lunch_days += 1
-                fsblame = frozenset(blame_courses)
-                lunch_blame[fsblame] = num_students + lunch_blame.get(fsblame, 0)
+    lunch_blame = {}
+    
+    for fs in student_schedule_d:
+        
+        num_students = enroll_d.get(fs,0)
+        res = count_no_lunches_for_schedule(fs, student_schedule_d[fs], only_allston, due_to_allston)
+        if res is None:
+            continue
 
+        (no_lunch_days, blame) = res
+        for fsblame in blame:
+            lunch_blame[fsblame] = num_students + lunch_blame.get(fsblame, 0)
 
         ret_d[no_lunch_days] += num_students
 
@@ -470,7 +627,11 @@ def simple_score(d):
             5.4*nl[5] + 4.3*nl[4] + 3.2*nl[3] + 2.1 * nl[2] + nl[1] + sum([day[1] for day in d['transport_days'].values()]),
             )
 
-def build_schedule_score(sched_d, conflicts_d, enroll_d, courses_to_count = None, print_conflicts=True, large_courses={}):
+def build_schedule_score(sched_d, conflicts_d, enroll_d, courses_to_count = None, print_conflicts=True, large_courses={}, backend="python"):
+    # backend is "python" or "numpy". The numpy backend (see schedule_score_numpy.py) gives the same
+    # results, but is much faster for large enrollments.
+    assert backend in ("python", "numpy"), backend
+
     # Now get the times for the schedules.
     times_d = build_student_schedules(enroll_d, sched_d)
 
@@ -478,17 +639,26 @@ def build_schedule_score(sched_d, conflicts_d, enroll_d, courses_to_count = None
     # Now compute the conflict score for the schedule
     conflict_score = compute_conflict_score(conflicts_d, sched_d, courses_to_count, print_conflicts,large_courses=large_courses)
     
+    if backend == "numpy":
+        import schedule_score_numpy
+        enc = schedule_score_numpy.encoded_student_schedules(times_d, enroll_d)
+        count_rt = lambda: enc.count_round_trips()
+        count_nl = lambda **kwargs: enc.count_no_lunches(**kwargs)
+    else:
+        count_rt = lambda: count_round_trips(times_d, enroll_d)
+        count_nl = lambda **kwargs: count_no_lunches(times_d, enroll_d, **kwargs)
+
     # Now compute the number of round trips
-    (rt_d, rt_blame) = count_round_trips(times_d, enroll_d)
+    (rt_d, rt_blame) = count_rt()
 
     total_round_trips = 0
     for key, value in rt_d['week'].items():
         total_round_trips += (key * value)
         
     # Now compute the number of no lunch days
-    (nl_d, _) = count_no_lunches(times_d, enroll_d)
-    (nl_all_d, _) = count_no_lunches(times_d, enroll_d, only_allston=True)
-    (nl_due_to_all_d, lunch_blame) = count_no_lunches(times_d, enroll_d, only_allston=True, due_to_allston=True)
+    (nl_d, _) = count_nl()
+    (nl_all_d, _) = count_nl(only_allston=True)
+    (nl_due_to_all_d, lunch_blame) = count_nl(only_allston=True, due_to_allston=True)
 
     ret = {}
     ret['conflict_score'] = conflict_score
@@ -505,9 +675,254 @@ def build_schedule_score(sched_d, conflicts_d, enroll_d, courses_to_count = None
     
     return (ret, rt_blame, lunch_blame)
 
+
+class _tally(object):
+    """
+    A dictionary of counts that also tracks how many contributions each key has, so that a key can be
+    removed again once nothing contributes to it. Keys given to the constructor are always present.
+    """
+    def __init__(self, keys=()):
+        self.counts = {k: 0 for k in keys}
+        self.refs = {k: 1 for k in keys}
+
+    def add(self, key, n, ref=1):
+        if key not in self.counts:
+            self.counts[key] = 0
+            self.refs[key] = 0
+        self.counts[key] += n
+        self.refs[key] += ref
+        if self.refs[key] == 0:
+            del self.counts[key]
+            del self.refs[key]
+
+class schedule_scorer(object):
+    """
+    Computes the same score as build_schedule_score, but keeps enough state around that the score can
+    be updated cheaply when a few courses move to new times. For each student schedule (i.e., each
+    set of courses in enroll_d) the scorer keeps the day schedule and its contribution to the
+    round trip and no lunch counts. Updating a course only recomputes the student schedules and
+    the conflict pairs that contain that course.
+    """
+    def __init__(self, sched_d, conflicts_d, enroll_d, courses_to_count=None, large_courses={}):
+        self.sched_d = dict(sched_d)
+
+        # The conflict pairs (cn1, cn2) that count towards the conflict score (see compute_conflict_score),
+        # mapped to their weight, and the pairs that each course is in.
+        self.conflict_pairs = {}
+        self.course_conflict_pairs = {}
+        for cn1 in conflicts_d:
+            for cn2 in conflicts_d[cn1]:
+                if not (cn1 < cn2):
+                    continue
+                weight = conflicts_d[cn1][cn2]
+                if cn1 not in self.sched_d or cn2 not in self.sched_d or not (weight > 0):
+                    continue
+                if courses_to_count and not (cn1 in courses_to_count or cn2 in courses_to_count) and not (cn1 in large_courses and cn2 in large_courses):
+                    continue
+                self.conflict_pairs[(cn1, cn2)] = weight
+                self.course_conflict_pairs.setdefault(cn1, []).append((cn1, cn2))
+                self.course_conflict_pairs.setdefault(cn2, []).append((cn1, cn2))
+
+        # The set of conflict pairs that currently conflict
+        self.conflicting = set()
+        for p in self.conflict_pairs:
+            self._update_conflict(p)
+
+        self.round_trips = {dn: _tally(range(3)) for dn in sct.DAYNAMES}
+        self.round_trips['week'] = _tally(range(8))
+        self.rt_blame = _tally()
+        self.no_lunch = _tally(range(8))
+        self.no_lunch_allston_students = _tally(range(8))
+        self.no_lunch_due_to_allston = _tally(range(8))
+        self.lunch_blame = _tally()
+
+        # Index the student schedules (i.e., the frozen sets of courses found in the schedule) so that
+        # we can find the ones that contain a given course. times[i] is the day schedule
+        # (see build_student_schedules) of the set with id i.
+        times_d = {}
+        for fs in enroll_d:
+            (ffs, days) = build_student_schedule_days(fs, self.sched_d)
+            times_d[ffs] = days
+
+        self.enroll_index = enrollment_index({ffs : enroll_d.get(ffs, 0) for ffs in times_d})
+        self.times = [times_d[ffs] for ffs in self.enroll_index.sets]
+
+        # contributions[i] is a list of (tally, key) that the set with id i contributes its students to.
+        self.contributions = [None] * len(self.enroll_index)
+        for i in range(len(self.enroll_index)):
+            self._add_contributions(i)
+
+        # What try_courses changed, so that rollback can undo it (see _update)
+        self.trial = None
+
+    def _update_conflict(self, p):
+        (cn1, cn2) = p
+        if sct.courses_conflict(self.sched_d[cn1], self.sched_d[cn2]):
+            self.conflicting.add(p)
+        else:
+            self.conflicting.discard(p)
+
+    def _add_contributions(self, i):
+        (ffs, days) = (self.enroll_index.sets[i], self.times[i])
+        contrib = []
+
+        (day_counts, week_count, blame) = count_round_trips_for_schedule(days)
+        for dn, day_count in day_counts.items():
+            contrib.append((self.round_trips[dn], day_count))
+        contrib.append((self.round_trips['week'], week_count))
+        for allston_courses in blame:
+            contrib.append((self.rt_blame, allston_courses))
+
+        (no_lunch_days, blame) = count_no_lunches_for_schedule(ffs, days)
+        contrib.append((self.no_lunch, no_lunch_days))
+        if any(will_be_allston_course_canonical_cn(cn) for cn in ffs):
+            # the same count as for all students (see count_no_lunches_for_schedule)
+            contrib.append((self.no_lunch_allston_students, no_lunch_days))
+            (no_lunch_days, blame) = count_no_lunches_for_schedule(ffs, days, True, True)
+            contrib.append((self.no_lunch_due_to_allston, no_lunch_days))
+            for fsblame in blame:
+                contrib.append((self.lunch_blame, fsblame))
+
+        num_students = self.enroll_index.counts[i]
+        for (t, key) in contrib:
+            t.add(key, num_students)
+        self.contributions[i] = contrib
+
+    def _remove_contributions(self, i):
+        num_students = self.enroll_index.counts[i]
+        for (t, key) in self.contributions[i]:
+            t.add(key, -num_students, ref=-1)
+        self.contributions[i] = None
+
+    def _update(self, changes_d, undo=None):
+        """
+        Update the schedule with new times for some courses (see update_courses). If undo is a triple
+        (sched_d, conflicting, sets), the old times of the courses, whether each updated conflict pair conflicted,
+        and a triple (id, times, contributions) for each updated set are recorded in it.
+        """
+        changed = []
+        for cn, cts in changes_d.items():
+            assert cn in self.sched_d, "Course %s is not in the schedule being scored"%cn
+            if self.sched_d[cn] == cts:
+                continue
+            if undo is not None:
+                undo[0][cn] = self.sched_d[cn]
+            self.sched_d[cn] = cts
+            changed.append(cn)
+
+        pairs = set()
+        for cn in changed:
+            pairs.update(self.course_conflict_pairs.get(cn, []))
+
+        for p in pairs:
+            if undo is not None:
+                undo[1][p] = p in self.conflicting
+            self._update_conflict(p)
+
+        for i in self.enroll_index.sets_with_any(changed):
+            if undo is not None:
+                undo[2].append((i, self.times[i], self.contributions[i]))
+            self._remove_contributions(i)
+            (_, self.times[i]) = build_student_schedule_days(self.enroll_index.sets[i], self.sched_d)
+            self._add_contributions(i)
+
+    def update_courses(self, changes_d):
+        """
+        Update the schedule with new times for some courses.
+        :param changes_d: dictionary from canonical course name to the new list of sct.course_time objects for that course.
+                          Every course must already be in the schedule the scorer was built with.
+        """
+        assert self.trial is None, "Call commit or rollback after try_courses"
+        self._update(changes_d)
+
+    def try_courses(self, changes_d):
+        """
+        Same as update_courses, but the changes can be undone cheaply by rollback, which puts back the old
+        contributions of the student schedules rather than recomputing them. Call commit to keep the changes.
+        """
+        assert self.trial is None, "Call commit or rollback after try_courses"
+        self.trial = ({}, {}, [])
+        self._update(changes_d, self.trial)
+
+    def commit(self):
+        """
+        Keep the changes of try_courses.
+        """
+        assert self.trial is not None
+        self.trial = None
+
+    def rollback(self):
+        """
+        Undo the changes of try_courses.
+        """
+        (sched_d, conflicting, sets) = self.trial
+        self.trial = None
+        self.sched_d.update(sched_d)
+        for (p, was_conflicting) in conflicting.items():
+            if was_conflicting:
+                self.conflicting.add(p)
+            else:
+                self.conflicting.discard(p)
+        for (i, times, contrib) in sets:
+            self._remove_contributions(i)
+            self.times[i] = times
+            num_students = self.enroll_index.counts[i]
+            for (t, key) in contrib:
+                t.add(key, num_students)
+            self.contributions[i] = contrib
+
+    def update_course(self, cn, cts):
+        """
+        Move course cn to the times cts (a list of sct.course_time objects).
+        """
+        self.update_courses({cn: cts})
+
+    def hurt_sets(self):
+        """
+        The sets of courses that the current schedule hurts, i.e., that contribute to the blame returned by score:
+        those with days with more than one round trip to Allston, or days without lunch due to Allston courses.
+        Returns a dictionary from the frozen set of courses (only the courses found in the schedule, see
+        build_student_schedule_days) to its number of such days.
+        """
+        hurt = {}
+        for (i, contrib) in enumerate(self.contributions):
+            n = sum(1 for (t, key) in contrib if t is self.rt_blame or t is self.lunch_blame)
+            if n:
+                hurt[self.enroll_index.sets[i]] = n
+        return hurt
+
+    def score(self, print_conflicts=False):
+        """
+        Return the score of the current schedule, in the same form as build_schedule_score.
+        """
+        conflict_score = 0
+        conflict_output_d = {}
+        for (cn1, cn2) in self.conflicting:
+            weight = self.conflict_pairs[(cn1, cn2)]
+            if print_conflicts:
+                conflict_output_d[_conflict_description(cn1, cn2, weight, self.sched_d)] = int(weight)
+            conflict_score += float(weight)
+
+        if print_conflicts:
+            _print_conflicts(conflict_output_d)
+
+        ret = {}
+        ret['conflict_score'] = conflict_score
+        ret['transport_days'] = {dn: dict(self.round_trips[dn].counts) for dn in sct.DAYNAMES}
+        ret['transport_weeks'] = dict(self.round_trips['week'].counts)
+        ret['total_round_trips'] = sum(key * value for key, value in ret['transport_weeks'].items())
+        ret['no_lunch'] = dict(self.no_lunch.counts)
+        ret['no_lunch_allston_students'] = dict(self.no_lunch_allston_students.counts)
+        ret['no_lunch_due_to_allston'] = dict(self.no_lunch_due_to_allston.counts)
+
+        ret['simple_score'] = simple_score(ret)
+
+        return (ret, dict(self.rt_blame.counts), dict(self.lunch_blame.counts))
+
 if __name__ == '__main__':
     def usage():
         print('Usage: build_schedule_score_d.py <schedule.csv> <bad_course_conflicts.csv> <multi-year-enrollment-data.csv>')
+        print('  The enrollment data may also be a store directory created by enrollment_store.py')
         sys.exit(1)
         
     if len(sys.argv) != 4:
@@ -539,10 +954,7 @@ if __name__ == '__main__':
 
     
     # Build the student enrollment dictionary
-    fin = open(enrollment_file, 'r')
-    cin = csv.reader(fin)
-    enroll_d = build_enrollment_d(cin, sched_d)
-    fin.close()
+    enroll_d = load_enrollment_d(enrollment_file, sched_d)
 
     (ret, rt_blame, lunch_blame) = build_schedule_score(sched_d, conflicts_d, enroll_d)
 
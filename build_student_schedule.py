@@ -13,7 +13,8 @@ travel from cambridge to allson or back, and when those transits happen.
 
 import class_time as cs
 import make_name_dicts as md
-import sys, csv
+import artifacts
+import sys, os, csv
 
 def build_sched(csv_in, student_set, class_time_d):
     """
@@ -45,10 +46,37 @@ def build_sched(csv_in, student_set, class_time_d):
 
     return ret_d
 
+def build_sched_from_store(store, student_set, class_time_d):
+    """
+    Same as build_sched, but reading the enrollments from an enrollment_store.enrollment_store. Only the rows of the
+    students in student_set are decoded.
+    """
+    rows = store.value_mask(8, lambda student: student in student_set).nonzero()[0]
+    return build_sched(store.rows(rows), student_set, class_time_d)
+
+def build_sched_from_file(path, student_set, class_time_d):
+    """
+    Same as build_sched, reading the enrollments from path, which is either a CSV file of the format supplied by the
+    registrar or a store directory created by enrollment_store.py.
+    """
+    if os.path.isdir(path):
+        import enrollment_store
+        if enrollment_store.is_store(path):
+            return build_sched_from_store(enrollment_store.enrollment_store(path), student_set, class_time_d)
+
+    fin = open(path, 'r')
+    cin = csv.reader(fin)
+    h = next(cin)
+
+    ret_d = build_sched(cin, student_set, class_time_d)
+    fin.close()
+    return ret_d
+
 if __name__ == '__main__':
 
     def usage():
         print('Usage: build_student_schedule <enrollments.csv>')
+        print('  The enrollments may also be a store directory created by enrollment_store.py')
         sys.exit(1)
 
     if len(sys.argv) < 2 or len(sys.argv) > 2:
@@ -63,12 +91,7 @@ if __name__ == '__main__':
 
 
     
-    fin = open(enrollements_filename, 'r')
-    cin = csv.reader(fin)
-    h = next(cin)
+    student_schedule_d = build_sched_from_file(enrollements_filename, seas_student_set, class_time_d)
 
-    student_schedule_d = build_sched(cin, seas_student_set, class_time_d)
-
-    md.pickle_data('student_schedule_d.pkl', student_schedule_d)
-    fin.close()
+    artifacts.save_dict(artifacts.STUDENT_SCHEDULE_FILE, 'student_sched', student_schedule_d)
 
@@ -13,6 +13,7 @@ program build_transition_time_d.py that can be used to determine the totals for
 """
 
 import make_name_dicts as md
+import artifacts
 import class_time as ct
 import sys
 
@@ -32,7 +33,7 @@ def build_trans_d (st_sched_d):
 
 if __name__ == '__main__':
 
-    schedule_d = md.unpickle_data('student_schedule_d.pkl')
+    schedule_d = artifacts.load_dict(artifacts.STUDENT_SCHEDULE_FILE)
     transition_d = build_trans_d(schedule_d)
-    md.pickle_data('transition_d.pkl', transition_d)
+    artifacts.save_dict(artifacts.TRANSITION_FILE, 'transition', transition_d)
 
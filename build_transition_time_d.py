@@ -18,6 +18,7 @@ build_transition_d.py
 
 import sys
 import make_name_dicts as md
+import artifacts
 import class_time as ct
 
 def build_trans_times(transition_d):
@@ -46,6 +47,6 @@ def build_trans_times(transition_d):
     return trans_time_d
 
 if __name__ == '__main__':
-    trans_d = md.unpickle_data('transition_d.pkl')
+    trans_d = artifacts.load_dict(artifacts.TRANSITION_FILE)
     trans_time_d = build_trans_times(trans_d)
     md.pickle_data('trans_time_d_l.pkl', trans_time_d)
\ No newline at end of file
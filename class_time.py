@@ -10,6 +10,7 @@ on assuming that the past will reflect the future.
 """
 from enum import Enum
 import warnings
+import array
 
 class days(Enum):
     Monday = 0
@@ -266,6 +267,8 @@ class sched_entry(object):
     building the schedule for each student; for each day of the week the class meets, one of these objects will appear
     in the schedule
     """
+    __slots__ = ('class_num', 'start_t', 'end_t', 'where')
+
     def __init__(self, class_num, start_t, end_t, where):
         """
         Create a schedule entry object
@@ -289,7 +292,9 @@ class sched_entry(object):
             self.start_t == other.start_t and \
             self.end_t == other.end_t and \
             self.where == other.where
-    
+
+    def __hash__(self):
+        return hash((self.class_num, self.start_t, self.end_t, self.where))
     
     def as_interval(self):
         """
@@ -330,42 +335,121 @@ class sched_entry(object):
 
         return True
 
+def time_to_minutes(t):
+    """
+    Convert a time "hh:mm" (24 hour clock) to the number of minutes after midnight, or -1 if t is "" (no time).
+    """
+    if t == "":
+        return -1
+    (h, m) = time_to_hm(t)
+    return h*60 + m
+
+def minutes_to_time(m):
+    """
+    The inverse of time_to_minutes.
+    """
+    if m < 0:
+        return ""
+    return "%02d:%02d"%(m // 60, m % 60)
+
 class student_sched(object):
     """
     A class that represents a student's schedule over a particular term. Includes the student huid as identifier, a
-    set of all the classes the student is taking, and a list of lists of sched_entry objects for each day of the
-    week.
+    list of the classes the student is taking, and the times the classes meet on each day of the week.
+
+    So that the schedules of many students can be held at once, a schedule is stored compactly. The classes are
+    numbered (in class_nums) within the schedule, and each meeting of a class on a day is an entry of ENTRY_FIELDS
+    integers in the array entries: the day, the number of the class, the start and end times in minutes after
+    midnight (-1 if the class has no time), and 1 if the class is in Allston (0 for Cambridge). Use day_entries to
+    read them; the days attribute gives the schedule as lists of sched_entry objects.
     """
+    __slots__ = ('student_num', 'class_nums', 'entries', '_class_ids', '_entry_keys')
+
+    ENTRY_FIELDS = 5
+
     def __init__(self, student_num):
         """
         Create a student schedule object, empty except for the student number
         :param student_num: the student id for the student
         """
         self.student_num = student_num
-        self.days = [[],[],[],[],[],[],[]]
+        self.class_nums = []
+        self.entries = array.array('h')
+        # Indexes of the class numbers and entries, for add_course. They are rebuilt when needed, and not saved.
+        self._class_ids = None
+        self._entry_keys = None
+
+    def __getstate__(self):
+        return (self.student_num, self.class_nums, self.entries)
+
+    def __setstate__(self, state):
+        (self.student_num, self.class_nums, self.entries) = state
+        self._class_ids = None
+        self._entry_keys = None
+
+    def _build_index(self):
+        self._class_ids = {cn: i for (i, cn) in enumerate(self.class_nums)}
+        f = self.ENTRY_FIELDS
+        self._entry_keys = set(tuple(self.entries[j:j+f]) for j in range(0, len(self.entries), f))
 
     def add_course(self, course):
         """
         Add a course to a student_sched. Entries
-        will be placed in all of the days that the course meets in the days array
-        :param course: a sched_entry object for the course
+        will be placed in all of the days that the course meets
+        :param course: a course_time object for the course
         :return: None
         """
-        entry = sched_entry(course.class_num, course.time_start, course.time_end, course.where)
+        if self._class_ids is None:
+            self._build_index()
+
+        if course.class_num not in self._class_ids:
+            self._class_ids[course.class_num] = len(self.class_nums)
+            self.class_nums.append(course.class_num)
+        class_id = self._class_ids[course.class_num]
+        start = time_to_minutes(course.time_start)
+        end = time_to_minutes(course.time_end)
+        in_allston = 1 if course.where == 'a' else 0
 
         for i in range(0,7):
             if course.days[i] == True:
-                if entry not in self.days[i]:
-                    self.days[i].append(entry)
+                entry = (i, class_id, start, end, in_allston)
+                if entry not in self._entry_keys:
+                    self._entry_keys.add(entry)
+                    self.entries.extend(entry)
 
     def order_classes(self):
         """
         Sort a day in a student schedule by the start time of the classes
         :return: None
         """
+        f = self.ENTRY_FIELDS
+        es = [tuple(self.entries[j:j+f]) for j in range(0, len(self.entries), f)]
+        es.sort(key=lambda e: (e[0], e[2]))
+        self.entries = array.array('h', [x for e in es for x in e])
+
+    def day_entries(self, day):
+        """
+        Generates the classes the student has on day, as tuples (class id, start, end, in_allston), where the class
+        number is class_nums[class id], start and end are minutes after midnight (or -1 if the class has no time), and
+        in_allston is 1 if the class is in Allston and 0 if it is in Cambridge.
+        """
+        e = self.entries
+        f = self.ENTRY_FIELDS
+        for j in range(0, len(e), f):
+            if e[j] == day:
+                yield (e[j+1], e[j+2], e[j+3], e[j+4])
+
+    @property
+    def days(self):
+        """
+        The schedule as a list, for each day of the week, of lists of sched_entry objects.
+        """
+        ret = [[],[],[],[],[],[],[]]
         for i in range(0,7):
-            if len(self.days) > 1:
-                self.days[i].sort(key = lambda x:x.start_t)
+            for (class_id, start, end, in_allston) in self.day_entries(i):
+                ret[i].append(sched_entry(self.class_nums[class_id], minutes_to_time(start), minutes_to_time(end),
+                                          'a' if in_allston else 'c'))
+        return ret
 
 class tr_time(object):
     def __init__(self, tr_to, tr_when):
@@ -389,13 +473,11 @@ class transition(object):
         """
         self.trans_time = [{}, {}, {}, {}, {}, {}, {}]
         for i in range(0,7):
-            day = s_sched.days[i]
             where = 'c'
-            for j in range(0,len(day)):
-                if day[j].where != where:
-                    where = day[j].where
-                    s_time = day[j].start_t
-                    self.trans_time[i][s_time] = where
+            for (class_id, start, end, in_allston) in s_sched.day_entries(i):
+                if ('a' if in_allston else 'c') != where:
+                    where = 'a' if in_allston else 'c'
+                    self.trans_time[i][minutes_to_time(start)] = where
 
     def get_trans_times(self, on_day):
         return self.trans_time[on_day]
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A NumPy engine for build_course_pair_stats_d in build_course_pair_stats_d.py. The courses and terms of all of
+the student careers are numbered, and the careers are encoded as arrays of course and term numbers. The pairs of
+courses taken by each student are then generated, and counted, with array operations (students with the same
+number of courses are handled together), rather than with Python work for every pair of every student. The
+results are the same course_pair_stats and course_stats values as build_course_pair_stats_d.
+
+Run as a script, it times the two against each other.
+"""
+
+import warnings
+import sys, csv, os, random, datetime
+from collections import defaultdict
+import numpy as np
+import build_course_pair_stats_d as cps
+from allston_course_selector import will_be_allston_course_subj_catalog
+
+# Generate the pairs of this many students' courses at a time, to bound the memory used
+MAX_PAIRS_PER_CHUNK = 1 << 22
+
+# Each pair of courses taken by a student is given a code, from the order in which the student took them
+# (before, same term, after) and how many terms apart (0 to 3, or 4 for more than 3).
+_NUM_DISTANCES = 5
+_NUM_CODES = 3 * _NUM_DISTANCES
+
+class encoded_careers(object):
+    """
+    Array encoding of a dictionary of careers (see build_course_pair_stats_d.build_career_sched).
+    The courses are numbered in order of their names, so that comparing course numbers compares names.
+    """
+    def __init__(self, st_sched_d):
+        course_ids = {}
+        term_ids = {}
+        courses = []
+        terms = []
+        lengths = []
+        for car in st_sched_d.values():
+            lengths.append(len(car.courses_d))
+            for (cn, term) in car.courses_d.items():
+                if cn not in course_ids:
+                    course_ids[cn] = len(course_ids)
+                courses.append(course_ids[cn])
+                if term not in term_ids:
+                    term_ids[term] = len(term_ids)
+                terms.append(term_ids[term])
+
+        # Renumber the courses in order of name
+        self.course_names = sorted(course_ids)
+        rank = np.zeros(len(course_ids), dtype=np.int64)
+        rank[[course_ids[cn] for cn in self.course_names]] = np.arange(len(self.course_names))
+
+        self.terms = list(term_ids)
+        self.term_numbers = np.array([cps.TERM_REGISTRY.number(t) for t in self.terms], dtype=np.int64)
+
+        self.course = rank[np.array(courses, dtype=np.int64)]
+        self.term = np.array(terms, dtype=np.int64)
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths)))[:-1]
+
+    def _pair_code_counts(self):
+        """
+        Returns arrays (keys, counts), where each key is (lo * number of courses + hi) * _NUM_CODES + code, for a pair
+        of courses lo < hi taken by a student, and the code of the pair for that student, and counts is the number of
+        students with that key.
+        """
+        num_courses = len(self.course_names)
+        key_l = []
+        count_l = []
+        for k in np.unique(self.lengths):
+            if k < 2:
+                continue
+            (iu, ju) = np.triu_indices(k, 1)
+            students = np.nonzero(self.lengths == k)[0]
+            per_chunk = max(1, MAX_PAIRS_PER_CHUNK // len(iu))
+            for start in range(0, len(students), per_chunk):
+                # The positions of the courses of the students in this chunk, one row per student
+                pos = self.offsets[students[start:start+per_chunk]][:, None] + np.arange(k)
+                c = self.course[pos]
+                t = self.term_numbers[self.term[pos]]
+
+                (c1, c2) = (c[:, iu].ravel(), c[:, ju].ravel())
+                (t1, t2) = (t[:, iu].ravel(), t[:, ju].ravel())
+                swap = c2 < c1
+                lo = np.where(swap, c2, c1)
+                hi = np.where(swap, c1, c2)
+                diff = np.where(swap, t2 - t1, t1 - t2)
+
+                code = (np.sign(diff) + 1) * _NUM_DISTANCES + np.minimum(np.abs(diff), _NUM_DISTANCES - 1)
+                (keys, counts) = np.unique((lo * num_courses + hi) * _NUM_CODES + code, return_counts=True)
+                key_l.append(keys)
+                count_l.append(counts)
+
+        if len(key_l) == 0:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+        (keys, inv) = np.unique(np.concatenate(key_l), return_inverse=True)
+        counts = np.bincount(inv, weights=np.concatenate(count_l)).astype(np.int64)
+        return (keys, counts)
+
+    def course_pair_stats_d(self):
+        """
+        The dictionary course_pair_stats_d returned by build_course_pair_stats_d.
+        """
+        num_courses = len(self.course_names)
+        (keys, counts) = self._pair_code_counts()
+        (pairs, inv) = np.unique(keys // _NUM_CODES, return_inverse=True)
+        code = keys % _NUM_CODES
+        order = code // _NUM_DISTANCES
+        distance = code % _NUM_DISTANCES
+
+        def total(selected):
+            return np.bincount(inv, weights=np.where(selected, counts, 0), minlength=len(pairs)).astype(np.int64).tolist()
+
+        columns = zip((pairs // num_courses).tolist(), (pairs % num_courses).tolist(),
+                      total(True), total(order == 1), total(order == 0), total(order == 2),
+                      total(distance <= 1), total(distance <= 2), total(distance <= 3))
+
+        in_allston = [will_be_allston_course_subj_catalog(*cps.parse_canonical_course_name(cn)) for cn in self.course_names]
+
+        course_pair_stats_d = {}
+        for (lo, hi, num_students, same, before, after, within_one, within_two, within_three) in columns:
+            (cn1, cn2) = (self.course_names[lo], self.course_names[hi])
+            # Bypass __init__, which checks the course names, since they were checked when the careers were built
+            v = cps.course_pair_stats.__new__(cps.course_pair_stats)
+            (v.cn1, v.cn2) = (cn1, cn2)
+            (v.cn1_in_allston, v.cn2_in_allston) = (in_allston[lo], in_allston[hi])
+            v.in_allston = v.cn1_in_allston or v.cn2_in_allston
+            (v.num_students, v.num_same_term, v.num_before, v.num_after) = (num_students, same, before, after)
+            (v.num_within_one, v.num_within_two, v.num_within_three) = (within_one, within_two, within_three)
+            course_pair_stats_d[(cn1, cn2)] = v
+
+        return course_pair_stats_d
+
+    def course_stats_d(self):
+        """
+        The dictionary course_stats_d returned by build_course_pair_stats_d.
+        """
+        num_terms = len(self.terms)
+        (keys, counts) = np.unique(self.course * num_terms + self.term, return_counts=True)
+
+        course_stats_d = {}
+        for (key, n) in zip(keys.tolist(), counts.tolist()):
+            (c, t) = divmod(key, num_terms)
+            cn = self.course_names[c]
+            if cn not in course_stats_d:
+                v = cps.course_stats.__new__(cps.course_stats)
+                v.cn = cn
+                (v.num_students, v.num_fall, v.num_spring) = (0, 0, 0)
+                v.term_enrollment = defaultdict(int)
+                course_stats_d[cn] = v
+
+            v = course_stats_d[cn]
+            term = self.terms[t]
+            v.num_students += n
+            if self.term_numbers[t] % 2 == 1:
+                v.num_fall += n
+            else:
+                v.num_spring += n
+            v.term_enrollment[term] += n
+
+        return course_stats_d
+
+def build_course_pair_stats_d(st_sched_d):
+    """
+    Same as build_course_pair_stats_d.build_course_pair_stats_d.
+    """
+    enc = encoded_careers(st_sched_d)
+    return (enc.course_pair_stats_d(), enc.course_stats_d())
+
+def synthetic_careers(num_students, num_courses=2000, first_year=2010, num_years=10, courses_per_term=4, seed=0):
+    """
+    Generate a dictionary of careers of random students, for timing. Each student takes courses_per_term courses
+    (chosen with a skew towards popular courses) in each of the eight terms after a random start.
+    """
+    r = random.Random(seed)
+    subjects = ["COMPSCI", "ECON", "MATH", "STAT", "GOV", "HIST", "APMTH", "ES", "PHYSICS", "CHEM"]
+    names = sorted(set(cps.cross_list_canonical("%s %s"%(subjects[i % len(subjects)], 100 + i)) for i in range(num_courses)))
+    weights = [1.0 / (i + 1) for i in range(len(names))]
+
+    st_sched_d = {}
+    for s in range(num_students):
+        huid = "S%d"%s
+        start = r.randrange(num_years * 2 - 8 + 1)
+        car = cps.career(huid, None, "")
+        for n in range(start, start + 8):
+            term = "%d %s"%(first_year + n // 2, "Fall" if n % 2 == 1 else "Spring")
+            for cn in r.choices(names, weights, k=courses_per_term):
+                car.add_course(cn, term)
+        st_sched_d[huid] = car
+    return st_sched_d
+
+def _same_stats(d1, d2):
+    if d1.keys() != d2.keys():
+        return False
+    return all(vars(d1[k]) == vars(d2[k]) for k in d1)
+
+if __name__ == '__main__':
+    def usage():
+        print('Usage: course_pair_stats_numpy.py [<multi-year-enrollments.csv> | -synthetic NUM_STUDENTS]')
+        print('  Times the pure Python and NumPy course pair counts against each other.')
+        print('  The enrollments may also be a store directory created by enrollment_store.py')
+        print('  -synthetic generates random careers for NUM_STUDENTS students')
+        sys.exit(1)
+
+    def brief_warning(message, category, filename, lineno, line=None):
+        return "Warning: %s\n"%message
+
+    warnings.formatwarning = brief_warning
+
+    args = list(sys.argv[1:])
+    if len(args) == 2 and args[0] == "-synthetic":
+        st_sched_d = synthetic_careers(int(args[1]))
+    elif len(args) == 1:
+        st_sched_d = cps.build_career_sched_from_file(args[0])
+    else:
+        usage()
+
+    starttime = datetime.datetime.now()
+    python_res = cps.build_course_pair_stats_d(st_sched_d)
+    python_time = (datetime.datetime.now() - starttime).total_seconds()
+
+    starttime = datetime.datetime.now()
+    numpy_res = build_course_pair_stats_d(st_sched_d)
+    numpy_time = (datetime.datetime.now() - starttime).total_seconds()
+
+    print("%d careers, %d pairs of courses"%(len(st_sched_d), len(python_res[0])))
+    print("Python: %.3f seconds"%python_time)
+    print("NumPy:  %.3f seconds"%numpy_time)
+    print("Speedup: %.1fx"%(python_time / numpy_time if numpy_time > 0 else float('inf')))
+    match = _same_stats(python_res[0], numpy_res[0]) and _same_stats(python_res[1], numpy_res[1])
+    print("Results %s"%("match" if match else "DIFFER"))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Solver backends for the schedulers (schedule_allston_courses.py and schedule_courses.py).
+
+The default backend is CBC, through pywraplp. The "cpsat" backend uses the OR-tools CP-SAT solver: cpsat_solver
+provides the part of the pywraplp.Solver interface that the schedulers use (IntVar, Constraint, Objective, Solve,
+SetHint, ...), so that the same code builds the model for either backend. It also provides native boolean
+constraints (AddConjunction and AddDisjunction), which makeConjunction and makeDisjunction use in place of big-M
+linear constraints, and it searches with several workers in parallel.
+"""
+
+from ortools.linear_solver import pywraplp
+from ortools.sat.python import cp_model
+
+BACKENDS = ("cbc", "cpsat")
+
+# Number of parallel search workers used by CP-SAT
+NUM_WORKERS = 8
+
+# CP-SAT needs finite bounds; variables and constraints with an infinite bound use these instead
+INT_VAR_BOUND = 1 << 30
+
+_STATUS = {
+    cp_model.OPTIMAL : pywraplp.Solver.OPTIMAL,
+    cp_model.FEASIBLE : pywraplp.Solver.FEASIBLE,
+    cp_model.INFEASIBLE : pywraplp.Solver.INFEASIBLE,
+    cp_model.MODEL_INVALID : pywraplp.Solver.MODEL_INVALID,
+    cp_model.UNKNOWN : pywraplp.Solver.NOT_SOLVED,
+}
+
+def new_solver(name, backend="cbc"):
+    """
+    Create a solver for the named backend (one of BACKENDS).
+    """
+    if backend == "cbc":
+        return pywraplp.Solver(name, pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+
+    assert backend == "cpsat", "Unknown solver backend %s"%backend
+    return cpsat_solver(name)
+
+def is_cpsat(solver):
+    return isinstance(solver, cpsat_solver)
+
+def solution_gap(solver):
+    """
+    The relative MIP gap of the solver's solution: the difference between its objective value and the best
+    bound on the objective value, as a fraction of the objective value. Close to 0 for an optimal solution.
+    """
+    obj = solver.Objective()
+    (value, bound) = (obj.Value(), obj.BestBound())
+    return abs(value - bound) / max(abs(value), 1e-9)
+
+def _bound(b):
+    if b >= INT_VAR_BOUND:
+        return INT_VAR_BOUND
+    if b <= -INT_VAR_BOUND:
+        return -INT_VAR_BOUND
+    assert b == int(b), "CP-SAT needs integer bounds, not %s"%b
+    return int(b)
+
+class cpsat_variable(object):
+    """
+    A variable of a cpsat_solver, behaving like a pywraplp variable.
+    """
+    __slots__ = ('solver', 'var')
+
+    def __init__(self, solver, var):
+        self.solver = solver
+        self.var = var
+
+    def name(self):
+        return self.var.name
+
+    def solution_value(self):
+        return float(self.solver.cp_solver.value(self.var))
+
+class cpsat_constraint(object):
+    """
+    A linear constraint lb <= sum of coefficient * variable <= ub of a cpsat_solver, behaving like a pywraplp constraint.
+    The constraint is added to the CP-SAT model the next time the solver is run. After that, its bounds can
+    still be changed, but its coefficients can't.
+    """
+    def __init__(self, lb, ub):
+        self.lb = lb
+        self.ub = ub
+        self.coefs = {}
+        self.ct = None
+
+    def SetCoefficient(self, v, coef):
+        assert self.ct is None, "The coefficients of a CP-SAT constraint can't be changed once it has been solved"
+        assert coef == int(coef), "CP-SAT needs integer coefficients, not %s"%coef
+        self.coefs[v] = int(coef)
+
+    def SetBounds(self, lb, ub):
+        self.lb = lb
+        self.ub = ub
+        if self.ct is not None:
+            domain = self.ct.proto.linear.domain
+            domain[0] = _bound(lb)
+            domain[1] = _bound(ub)
+
+    def SetLb(self, lb):
+        self.SetBounds(lb, self.ub)
+
+    def SetUb(self, ub):
+        self.SetBounds(self.lb, ub)
+
+    def activity(self):
+        return sum(c * v.solution_value() for (v, c) in self.coefs.items())
+
+class cpsat_objective(object):
+    """
+    The objective of a cpsat_solver, behaving like a pywraplp objective. Coefficients may be fractional.
+    """
+    def __init__(self, solver):
+        self.solver = solver
+        self.coefs = {}
+        self.minimize = True
+
+    def SetCoefficient(self, v, coef):
+        self.coefs[v] = coef
+
+    def SetMinimization(self):
+        self.minimize = True
+
+    def SetMaximization(self):
+        self.minimize = False
+
+    def Value(self):
+        return self.solver.cp_solver.objective_value
+
+    def BestBound(self):
+        return self.solver.cp_solver.best_objective_bound
+
+class cpsat_solver(object):
+    """
+    A CP-SAT model and solver with the interface of a pywraplp.Solver (as used by the schedulers).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.model = cp_model.CpModel()
+        self.cp_solver = cp_model.CpSolver()
+        self.num_workers = NUM_WORKERS
+        self.time_limit_ms = None
+        self.variables = []
+        self.constraints = []
+        # Constraints not yet added to self.model
+        self.pending = []
+        # Triples (is_conjunction, v, xs) of the boolean constraints, for VerifySolution
+        self.bool_constraints = []
+        self.objective = cpsat_objective(self)
+
+    def infinity(self):
+        return float('inf')
+
+    def IntVar(self, lb, ub, name):
+        if lb == 0 and ub == 1:
+            var = self.model.new_bool_var(name)
+        else:
+            var = self.model.new_int_var(_bound(lb), _bound(ub), name)
+        v = cpsat_variable(self, var)
+        self.variables.append(v)
+        return v
+
+    def Constraint(self, lb, ub):
+        c = cpsat_constraint(lb, ub)
+        self.constraints.append(c)
+        self.pending.append(c)
+        return c
+
+    def AddConjunction(self, v, conjuncts):
+        """
+        v is 1 if and only if all of the 0-1 variables conjuncts are 1.
+        """
+        xs = [x.var for x in conjuncts]
+        self.model.add_bool_and(xs).only_enforce_if(v.var)
+        self.model.add_bool_or([~x for x in xs]).only_enforce_if(~v.var)
+        self.bool_constraints.append((True, v, list(conjuncts)))
+
+    def AddDisjunction(self, v, disjuncts):
+        """
+        v is 1 if and only if at least one of the 0-1 variables disjuncts is 1.
+        """
+        xs = [x.var for x in disjuncts]
+        self.model.add_bool_or(xs).only_enforce_if(v.var)
+        self.model.add_bool_and([~x for x in xs]).only_enforce_if(~v.var)
+        self.bool_constraints.append((False, v, list(disjuncts)))
+
+    def Objective(self):
+        return self.objective
+
+    def NumVariables(self):
+        return len(self.variables)
+
+    def NumConstraints(self):
+        return len(self.constraints) + len(self.bool_constraints)
+
+    def SetTimeLimit(self, ms):
+        self.time_limit_ms = ms
+
+    def SetHint(self, variables, values):
+        self.model.clear_hints()
+        for (v, x) in zip(variables, values):
+            self.model.add_hint(v.var, int(round(x)))
+
+    def Solve(self):
+        for c in self.pending:
+            expr = cp_model.LinearExpr.weighted_sum([v.var for v in c.coefs], list(c.coefs.values()))
+            c.ct = self.model.add_linear_constraint(expr, _bound(c.lb), _bound(c.ub))
+        self.pending = []
+
+        obj = self.objective
+        expr = cp_model.LinearExpr.weighted_sum([v.var for v in obj.coefs], list(obj.coefs.values()))
+        if obj.minimize:
+            self.model.minimize(expr)
+        else:
+            self.model.maximize(expr)
+
+        self.cp_solver = cp_model.CpSolver()
+        self.cp_solver.parameters.num_workers = self.num_workers
+        if self.time_limit_ms is not None:
+            self.cp_solver.parameters.max_time_in_seconds = self.time_limit_ms / 1000.0
+        return _STATUS[self.cp_solver.solve(self.model)]
+
+    def VerifySolution(self, tolerance, log_errors):
+        """
+        Check the solution against the constraints.
+        """
+        ok = True
+        for c in self.constraints:
+            a = c.activity()
+            if a < c.lb - tolerance or a > c.ub + tolerance:
+                ok = False
+                if log_errors:
+                    print("Constraint violated: %s not in [%s, %s]"%(a, c.lb, c.ub))
+        for (is_conjunction, v, xs) in self.bool_constraints:
+            vals = [x.solution_value() for x in xs]
+            expected = all(vals) if is_conjunction else any(vals)
+            if bool(v.solution_value()) != expected:
+                ok = False
+                if log_errors:
+                    print("Boolean constraint on %s violated"%v.name())
+        return ok
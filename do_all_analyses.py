@@ -7,46 +7,93 @@ Created on Monday March 18, 2019
 
 Run all of the analyses on data files. Must be given the course_times.csv and enrollments.csv files.
 
+The analyses are run in this process as the stages of a pipeline (see pipeline.py), so the results of each are
+passed to the next without being re-read, and analyses whose inputs haven't changed since the last run are skipped.
+
 It assumes that all python files are in the same directory as this file, and will create all data files in the
 same directory as the course_times.csv file.
 """
 import os
 import sys
-
-def run_command(cmd_dir, cmd, args):
-    args_str = " ".join(args)
-    print ('\n' + ('-' * 50))
-    print ('|')
-    print ('|  Running "%s %s"'%(cmd, args_str))
-    print ('|')
-    ret = os.system("%s%s%s %s"%(cmd_dir,os.sep,cmd, args_str))
-
-    if ret != 0:
-        raise Exception()
+import warnings
+import pipeline
+import split_classes_students as scs
+import build_course_times as bct
+import build_student_schedule as bss
+import build_transition_d as btd
+import build_transition_time_d as bttd
+import make_csv_transitions as mct
+import build_conflicts_d as bcd
+import make_csv_conflicts as mcc
+import build_no_lunch_d as bnl
+
+def build_pipeline(course_times_filename, enrollments_filename, convert_to_allston):
+    """
+    Build the pipeline of all the analyses. The stages are the same as the stand-alone programs, and write the
+    same files.
+    """
+    p = pipeline.pipeline()
+    p.add_file('enrollments', enrollments_filename)
+    p.add_file('course_times', course_times_filename)
+
+    p.add_stage(pipeline.stage("split_classes_students", scs.split_classes_students, ['enrollments'],
+                               [('Allston_class_set.pkl', 'pickle'), ('SEAS_student_set.pkl', 'pickle'), ('all_seas_student_classes_set.pkl', 'pickle')],
+                               modules=['split_classes_students', 'allston_course_selector', 'enrollment_store']))
+    p.add_stage(pipeline.stage("build_course_times", lambda filename: bct.build_ct_d_from_file(filename, convert_to_allston), ['course_times'],
+                               [('class_time_d.pkl', 'pickle')],
+                               modules=['build_course_times', 'class_time', 'allston_course_selector'],
+                               params=convert_to_allston))
+
+    p.add_stage(pipeline.stage("build_student_schedule", bss.build_sched_from_file, ['enrollments', 'SEAS_student_set.pkl', 'class_time_d.pkl'],
+                               [('student_schedule_d.art', 'student_sched')],
+                               modules=['build_student_schedule', 'class_time', 'enrollment_store', 'artifacts']))
+    p.add_stage(pipeline.stage("build_transition_d", btd.build_trans_d, ['student_schedule_d.art'],
+                               [('transition_d.art', 'transition')],
+                               modules=['build_transition_d', 'class_time', 'artifacts']))
+    p.add_stage(pipeline.stage("build_transition_time_d", bttd.build_trans_times, ['transition_d.art'],
+                               [('trans_time_d_l.pkl', 'pickle')],
+                               modules=['build_transition_time_d', 'class_time']))
+    p.add_stage(pipeline.stage("make_csv_transitions", mct.write_trans_csv_file, ['trans_time_d_l.pkl'],
+                               [('transitions.csv', 'file')],
+                               modules=['make_csv_transitions', 'display_trans']))
+
+    p.add_stage(pipeline.stage("build_conflicts_d", bcd.build_conflicts_d, ['student_schedule_d.art'],
+                               [('conflicts_d.art', 'int')],
+                               modules=['build_conflicts_d', 'class_time', 'artifacts']))
+    p.add_stage(pipeline.stage("make_csv_conflicts", mcc.write_conflicts_csv_file, ['conflicts_d.art', 'course_times'],
+                               [('conflicts.csv', 'file')],
+                               modules=['make_csv_conflicts']))
+
+    p.add_stage(pipeline.stage("build_no_lunch_d", bnl.build_no_lunch_d, ['student_schedule_d.art'],
+                               [('no_lunch_d.pkl', 'pickle')],
+                               modules=['build_no_lunch_d', 'class_time', 'artifacts']))
+    return p
 
 if __name__ == '__main__':
 
     def usage():
-        print('Usage: python do_all_analyses.py [--convert-to-allston] course_times.csv enrollments.csv')
+        print('Usage: python do_all_analyses.py [--convert-to-allston] [--force] course_times.csv enrollments.csv')
         print('   All files will be created in the same directory as the course_times.csv file.')
+        print('   Analyses whose inputs have not changed since the last run are skipped, unless --force is given.')
         sys.exit(2)
 
-
-    if len(sys.argv) < 3 or len(sys.argv) > 4:
-        usage()
-
     convert_to_allston = False
-    course_times_file = sys.argv[1]
-    enrollments_file = sys.argv[2]
-
-    if sys.argv[1].startswith("-"):
-        if sys.argv[1] == "--convert-to-allston":
+    force = False
+    args = sys.argv[1:]
+    while len(args) > 0 and args[0].startswith("-"):
+        if args[0] == "--convert-to-allston":
             convert_to_allston = True
-            course_times_file = sys.argv[2]
-            enrollments_file = sys.argv[3]
+        elif args[0] == "--force":
+            force = True
         else:
             usage()
-        
+        args = args[1:]
+
+    if len(args) != 2:
+        usage()
+
+    course_times_file = args[0]
+    enrollments_file = args[1]
 
     if enrollments_file.find("course") >= 0:
         # probably a mistake
@@ -57,7 +104,7 @@ if __name__ == '__main__':
         print("Can't find file %s"%course_times_file)
         usage()
 
-    if not os.path.isfile(enrollments_file):
+    if not os.path.exists(enrollments_file):
         print("Can't find file %s"%enrollments_file)
         usage()
         
@@ -83,37 +130,33 @@ if __name__ == '__main__':
         print("Can't find file %s after changing directory!"%course_times_filename)
         exit(2)
 
-    if not os.path.isfile(enrollments_filename):
+    if not os.path.exists(enrollments_filename):
         print("Can't find file %s after changing directory!"%enrollments_filename)
         exit(2)
     
     
     # Now run all the analyses!
 
-    try:
-        run_command(cmd_dir,"split_classes_students.py", [enrollments_filename])
+    def brief_warning(message, category, filename, lineno, line=None):
+        return "Warning: %s\n"%message
 
-        if convert_to_allston:
-            run_command(cmd_dir,"build_course_times.py", ["--convert-to-allston", course_times_filename])
-        else:
-            run_command(cmd_dir,"build_course_times.py", [course_times_filename])
+    warnings.formatwarning = brief_warning
 
+    def report(msg):
+        print ('\n' + ('-' * 50))
+        print ('|')
+        print ('|  %s'%msg)
+        print ('|')
 
-        run_command(cmd_dir,"build_student_schedule.py", [enrollments_filename])
-        run_command(cmd_dir,"build_transition_d.py", [])
-        run_command(cmd_dir,"build_transition_time_d.py", [])
-        run_command(cmd_dir,"make_csv_transitions.py", ["transitions.csv"])
+    try:
+        p = build_pipeline(course_times_filename, enrollments_filename, convert_to_allston)
+        p.run(force=force, report=report)
 
-        run_command(cmd_dir,"build_conflicts_d.py", [])
-        run_command(cmd_dir,"make_csv_conflicts.py", [course_times_filename, "conflicts.csv"])
+        # Alpha: put in call to create a suitable presentation of data?
 
-        run_command(cmd_dir,"build_no_lunch_d.py", [])    
+    except Exception as e:
+        print ("\n\nError encountered, skipping remaining analyses: %s"%e)
 
-        # Alpha: put in call to create a suitable presentation of data?
-        
-    except:
-        print ("\n\nError encountered, skipping remaining analyses...")
-        
     print ("\n\nRestoring original working directory...")
     os.chdir(orig_wd)
     
\ No newline at end of file
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A columnar, binary store for enrollment files supplied by the registrar, so that the CSV file only needs
+to be parsed once. Each column of the CSV file is interned: the distinct strings of the column are stored once,
+and each row holds an integer id into them. The ids of each column are saved with numpy.save, and loaded
+memory-mapped, so that a stage only reads the columns it uses.
+
+A store is a directory containing columns.json (the headers and number of rows) and, for column i,
+col<i>.npy (the ids, one per row) and col<i>_values.npy (the distinct strings).
+
+Run as a script to convert an enrollment CSV file into a store. All of the programs that read enrollment
+files accept either the CSV file or the store directory.
+"""
+
+import sys, os, csv, json
+import numpy as np
+
+COLUMNS_FILE = "columns.json"
+
+def _ids_file(store_dir, i):
+    return os.path.join(store_dir, "col%s.npy"%i)
+
+def _values_file(store_dir, i):
+    return os.path.join(store_dir, "col%s_values.npy"%i)
+
+def ingest(cin, store_dir):
+    """
+    Convert an enrollment file into a store.
+    :param cin: a csv.reader of the enrollment file, including the header row
+    :param store_dir: the directory to create the store in. It is created if needed, and an existing store in it is overwritten
+    :return: the number of rows stored
+    """
+    headers = next(cin)
+
+    # For each column, a dictionary from string to id, and the list of ids of the rows
+    intern_ds = [{} for h in headers]
+    ids = [[] for h in headers]
+    num_rows = 0
+    for l in cin:
+        if len(l) < len(headers):
+            # short rows (e.g., blank lines at the end of the file) are padded with empty strings
+            l = l + [''] * (len(headers) - len(l))
+        for i in range(len(headers)):
+            d = intern_ds[i]
+            v = l[i]
+            if v not in d:
+                d[v] = len(d)
+            ids[i].append(d[v])
+        num_rows += 1
+
+    os.makedirs(store_dir, exist_ok=True)
+    for i in range(len(headers)):
+        np.save(_ids_file(store_dir, i), np.array(ids[i], dtype=np.int32))
+        values = sorted(intern_ds[i], key=intern_ds[i].get)
+        np.save(_values_file(store_dir, i), np.array(values, dtype=str))
+
+    with open(os.path.join(store_dir, COLUMNS_FILE), 'w') as fout:
+        json.dump({"headers": headers, "rows": num_rows}, fout)
+
+    return num_rows
+
+def is_store(path):
+    """
+    Is path a store directory (rather than, e.g., a CSV file)?
+    """
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, COLUMNS_FILE))
+
+class enrollment_store(object):
+    """
+    A store created by ingest. Columns can be referred to by index or by header name.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, COLUMNS_FILE), 'r') as fin:
+            d = json.load(fin)
+        self.headers = d["headers"]
+        self.num_rows = d["rows"]
+        self._ids = {}
+        self._values = {}
+
+    def __len__(self):
+        return self.num_rows
+
+    def column_index(self, col):
+        """
+        The index of column col, which is either an index or a header name.
+        """
+        if isinstance(col, int):
+            assert 0 <= col < len(self.headers), "No column %s in %s"%(col, self.store_dir)
+            return col
+        assert col in self.headers, "Expected to find column name %s in %s, but only had %s"%(col, self.store_dir, self.headers)
+        return self.headers.index(col)
+
+    def ids(self, col):
+        """
+        The (memory-mapped) array of ids of column col, one per row.
+        """
+        i = self.column_index(col)
+        if i not in self._ids:
+            self._ids[i] = np.load(_ids_file(self.store_dir, i), mmap_mode='r')
+        return self._ids[i]
+
+    def values(self, col):
+        """
+        The list of distinct strings of column col, indexed by id.
+        """
+        i = self.column_index(col)
+        if i not in self._values:
+            self._values[i] = np.load(_values_file(self.store_dir, i)).tolist()
+        return self._values[i]
+
+    def value_mask(self, col, pred):
+        """
+        Returns a boolean array, one entry per row, that is true for the rows where pred is true of the string in column col.
+        pred is called once per distinct string, not once per row.
+        """
+        ok = np.array([bool(pred(v)) for v in self.values(col)], dtype=bool)
+        return ok[self.ids(col)] if len(ok) else np.zeros(self.num_rows, dtype=bool)
+
+    def distinct(self, cols, mask=None):
+        """
+        Returns a pair (ids, values) for the combinations of strings in the columns cols, for all rows (or the rows
+        selected by the boolean array mask). ids is an array with one entry per row, in row order, identifying the combination
+        of strings in that row, and values is the list of tuples of strings, indexed by those ids.
+        """
+        cols = [self.column_index(c) for c in cols]
+        arrs = [np.asarray(self.ids(c)) if mask is None else self.ids(c)[mask] for c in cols]
+        if arrs[0].size == 0:
+            return (np.zeros(0, dtype=np.int64), [])
+
+        (uniq, inverse) = np.unique(np.stack(arrs, axis=1), axis=0, return_inverse=True)
+        vals = [self.values(c) for c in cols]
+        return (inverse.reshape(-1), [tuple(v[x] for (v, x) in zip(vals, u)) for u in uniq.tolist()])
+
+    def rows(self, rows=None):
+        """
+        Generate the rows (or just the rows with the given indices), as lists of strings, like a csv.reader.
+        """
+        cols = [self.ids(i) if rows is None else self.ids(i)[rows] for i in range(len(self.headers))]
+        vals = [self.values(i) for i in range(len(self.headers))]
+        for r in zip(*[c.tolist() for c in cols]):
+            yield [v[x] for (v, x) in zip(vals, r)]
+
+    def reader(self):
+        """
+        Generate the headers, then the rows, i.e., a replacement for csv.reader on the original file.
+        """
+        yield list(self.headers)
+        for l in self.rows():
+            yield l
+
+def group_by(key_ids, value_ids):
+    """
+    Given two arrays of the same length, generate pairs (key, values), one for each distinct key in key_ids (in
+    increasing order), where values is the array of the entries of value_ids at the positions of that key, in order.
+    """
+    order = np.argsort(key_ids, kind='stable')
+    keys = key_ids[order]
+    values = value_ids[order]
+    bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = [0] + bounds.tolist()
+    ends = bounds.tolist() + [len(keys)]
+    for (s, e) in zip(starts, ends):
+        if s < e:
+            yield (int(keys[s]), values[s:e])
+
+def open_enrollments(path):
+    """
+    Returns a generator of the rows (starting with the header row) of the enrollment file path, which is either a CSV
+    file or a store directory.
+    """
+    if is_store(path):
+        for l in enrollment_store(path).reader():
+            yield l
+        return
+
+    with open(path, 'r') as fin:
+        for l in csv.reader(fin):
+            yield l
+
+if __name__ == '__main__':
+    def usage():
+        print('Usage: enrollment_store.py <enrollments.csv> <store_dir>')
+        print('  Converts the enrollment file into a store in directory store_dir, which can be used')
+        print('  in place of the enrollment file by the other programs.')
+        sys.exit(1)
+
+    if len(sys.argv) != 3:
+        usage()
+
+    with open(sys.argv[1], 'r') as fin:
+        n = ingest(csv.reader(fin), sys.argv[2])
+
+    print("Stored %s rows of %s in %s"%(n, sys.argv[1], sys.argv[2]))
@@ -7,6 +7,7 @@ Created on March 6 2020
 
 Code and data to handle specifics of Harvard courses
 """
+import csv
 
 
 # #########################
@@ -222,13 +223,42 @@ cross_listed_courses = [
    ['TDM 1246', 'WOMGEN 1246'],
 ]
 
-_non_canon = set(c for l in [cl[1:] for cl in cross_listed_courses] for c in l)
-def cross_list_canonical(cn):
+def _build_cross_list_index():
+    """
+    Build the dictionary from each course name in cross_listed_courses to the pair (canonical course name,
+    is canonical). The canonical name is the first course of the first cross-listing that contains the course, and
+    a course is canonical unless it is a non-first course of some cross-listing.
+    """
+    global _cross_list_d
+    canonical_d = {}
+    non_canon = set()
     for cl in cross_listed_courses:
-        if cn in cl:
-            return cl[0]
+        for c in cl:
+            canonical_d.setdefault(c, cl[0])
+        non_canon.update(cl[1:])
+    _cross_list_d = {c: (canon, c not in non_canon) for (c, canon) in canonical_d.items()}
+
+def load_cross_listings(filename, replace=False):
+    """
+    Read cross-listings from a CSV file, with one cross-listing per row, the canonical course first (e.g.,
+    "STAT 160,STAT 260"). They are added after the existing ones (so the existing ones take precedence for a course
+    in both), or replace them if replace is true.
+    """
+    global cross_listed_courses
+    with open(filename, 'r', newline='') as fin:
+        rows = [[c.strip() for c in l if c.strip() != ""] for l in csv.reader(fin)]
+    rows = [l for l in rows if len(l) > 0]
+    cross_listed_courses = rows if replace else cross_listed_courses + rows
+    _build_cross_list_index()
 
-    return cn
+def cross_list_canonical(cn):
+    res = _cross_list_d.get(cn)
+    if res is None:
+        return cn
+    return res[0]
 
 def is_cross_list_canonical(cn):
-    return cn not in _non_canon
\ No newline at end of file
+    res = _cross_list_d.get(cn)
+    return res is None or res[1]
+
+_build_cross_list_index()
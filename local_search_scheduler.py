@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A simulated annealing scheduler for the course scheduling problems of schedule_allston_courses.py and
+schedule_courses.py. It finds a schedule in seconds, without a MIP solver, either to be used on its own or to
+give the solver a starting point (see their -local-search and -warm-start options).
+
+A schedule_problem is the objective of a scheduler's model (from Course.createObjective and add_area_constraints,
+without the student schedule constraints of solver versions 1 and 2) as a function of the meeting time of each
+course. It is built by the scheduler's build_local_search_problem. The cost of moving one course to a new meeting
+time is computed from the courses it has bad conflicts with and its areas only, so each step of the search is cheap.
+"""
+
+import math, random, datetime
+import schedule_slots as ss
+
+# Default number of moves tried by local_search
+NUM_ITERATIONS = 200000
+
+# The search cools from a temperature set by sampling random moves down to FINAL_TEMPERATURE, which is small
+# compared to the smallest weights of the objective, so the search ends greedily.
+FINAL_TEMPERATURE = 1.0
+
+# Number of random moves sampled to set the starting temperature
+NUM_TEMPERATURE_SAMPLES = 200
+
+class schedule_problem(object):
+    """
+    The objective of a scheduler's model, for local_search.
+      courses is a dictionary from canonical course name to the scheduler's Course object (see below).
+      conflicts_d and sched_d are the bad conflicts and the fixed schedule, and fixed_conflicts is an
+        ss.fixed_conflict_index for sched_d.
+      params is the scheduler's PARAMS.
+      areas is the scheduler's AREAS, and area_slot_weight(cn, asl) is the weight add_area_constraints gives
+        course cn for actual slot asl, or None.
+      meeting_times_conflict(mt1, mt2) is true if two scheduled courses at meeting times mt1 and mt2 conflict.
+    The Course objects provide meeting_times and slot_weight(asl), the weight createObjective gives the actual slot
+    asl, or None.
+    """
+    def __init__(self, courses, conflicts_d, sched_d, fixed_conflicts, params, areas, area_slot_weight, meeting_times_conflict):
+        self.names = sorted(courses)
+        index = {cn : i for (i, cn) in enumerate(self.names)}
+        self.meeting_times = [list(courses[cn].meeting_times) for cn in self.names]
+
+        # Number the distinct meeting times, and record which pairs conflict
+        mt_ids = {}
+        for mts in self.meeting_times:
+            for mt in mts:
+                if mt not in mt_ids:
+                    mt_ids[mt] = len(mt_ids)
+        distinct = sorted(mt_ids, key=mt_ids.get)
+        self.mt_ids = [[mt_ids[mt] for mt in mts] for mts in self.meeting_times]
+        self.conflict = [[1 if meeting_times_conflict(mt1, mt2) else 0 for mt2 in distinct] for mt1 in distinct]
+
+        # unary[i][k] is the cost of course i at its k-th meeting time, on its own: the weights of its
+        # actual slots, and its bad conflicts with the courses of the fixed schedule
+        self.unary = []
+        for (i, cn) in enumerate(self.names):
+            course = courses[cn]
+            costs = []
+            for mt in self.meeting_times[i]:
+                cost = 0
+                for asl in mt:
+                    w = area_slot_weight(cn, asl)
+                    if w is None:
+                        w = course.slot_weight(asl)
+                    cost += w or 0
+                for other in conflicts_d.get(cn, []):
+                    if other in courses or other not in sched_d:
+                        continue
+                    conflicting_slots = fixed_conflicts.conflicting_slots(other)
+                    if any(asl in conflicting_slots for asl in mt):
+                        cost += params['WEIGHT_BAD_CONFLICT_FACTOR'] * int(conflicts_d[cn][other])
+                costs.append(cost)
+            self.unary.append(costs)
+
+        # neighbors[i] is a list of pairs (j, weight) of the scheduled courses j that course i has a bad conflict with
+        self.neighbors = [[] for cn in self.names]
+        for (i, cn) in enumerate(self.names):
+            for other in conflicts_d.get(cn, []):
+                if other in courses and cn < other:
+                    w = params['WEIGHT_BAD_CONFLICT_FACTOR'] * int(conflicts_d[cn][other])
+                    j = index[other]
+                    self.neighbors[i].append((j, w))
+                    self.neighbors[j].append((i, w))
+
+        # Each area spreads its courses over days of the week and times of day. For each meeting time of each
+        # course, area_keys[i][k] is a pair (day pattern, start slot): day pattern is 1 for TuTh and -1 for MWF
+        # meetings (0 if the meeting time doesn't count), and start slot is 1 to 5, or 0 if it doesn't count.
+        self.area_weight = params['WEIGHT_DIFF_NUM_COURSES_DAY_OF_WEEK']
+        self.course_areas = [[a for (a, area) in enumerate(areas) if cn.startswith(area)] for cn in self.names]
+        self.area_keys = []
+        for mts in self.meeting_times:
+            keys = []
+            for mt in mts:
+                (days, start) = (0, 0)
+                if ss.meeting_frequency(mt) in (2,3):
+                    days = 1 if ss.meeting_time_is_tu_th(mt) else -1
+                    if ss.meeting_time_starts_between_9_and_4(mt):
+                        start = ss.start_time_slot(mt)
+                keys.append((days, start))
+            self.area_keys.append(keys)
+        self.num_areas = len(areas)
+
+    def area_cost(self, counts):
+        """
+        The cost of an area with counts [TuTh - MWF, courses starting in slot 1, ..., slot 5]. As in
+        add_area_constraints, the difference between the numbers of courses at two times of day bounds the same
+        variable as the difference between TuTh and MWF courses.
+        """
+        slots = counts[1:]
+        return self.area_weight * max(abs(counts[0]), max(slots) - min(slots))
+
+class _search_state(object):
+    """
+    An assignment of meeting times to the courses of a schedule_problem, with its cost and area counts.
+    """
+    def __init__(self, problem, assignment):
+        self.problem = problem
+        self.assignment = list(assignment)
+        self.area_counts = [[0] * 6 for a in range(problem.num_areas)]
+        for (i, k) in enumerate(self.assignment):
+            self._count(i, k, 1)
+        self.cost = self.total_cost()
+
+    def _count(self, i, k, n):
+        (days, start) = self.problem.area_keys[i][k]
+        for a in self.problem.course_areas[i]:
+            counts = self.area_counts[a]
+            counts[0] += days * n
+            if start:
+                counts[start] += n
+
+    def total_cost(self):
+        p = self.problem
+        cost = 0
+        for (i, k) in enumerate(self.assignment):
+            cost += p.unary[i][k]
+            mi = p.mt_ids[i][k]
+            for (j, w) in p.neighbors[i]:
+                if i < j:
+                    cost += w * p.conflict[mi][p.mt_ids[j][self.assignment[j]]]
+        cost += sum(p.area_cost(counts) for counts in self.area_counts)
+        return cost
+
+    def delta(self, i, k):
+        """
+        The change in cost of moving course i to its k-th meeting time.
+        """
+        p = self.problem
+        a = self.assignment[i]
+        d = p.unary[i][k] - p.unary[i][a]
+        (row_new, row_old) = (p.conflict[p.mt_ids[i][k]], p.conflict[p.mt_ids[i][a]])
+        for (j, w) in p.neighbors[i]:
+            mj = p.mt_ids[j][self.assignment[j]]
+            d += w * (row_new[mj] - row_old[mj])
+
+        if p.course_areas[i] and p.area_keys[i][a] != p.area_keys[i][k]:
+            ((days_old, start_old), (days_new, start_new)) = (p.area_keys[i][a], p.area_keys[i][k])
+            for ar in p.course_areas[i]:
+                counts = list(self.area_counts[ar])
+                d -= p.area_cost(counts)
+                counts[0] += days_new - days_old
+                if start_old:
+                    counts[start_old] -= 1
+                if start_new:
+                    counts[start_new] += 1
+                d += p.area_cost(counts)
+        return d
+
+    def move(self, i, k, d):
+        self._count(i, self.assignment[i], -1)
+        self._count(i, k, 1)
+        self.assignment[i] = k
+        self.cost += d
+
+def local_search(problem, initial=None, num_iterations=None, seed=0):
+    """
+    Find a schedule for problem (a schedule_problem) by simulated annealing, followed by moving single courses
+    while that improves the cost. initial is an optional dictionary from course name to meeting time (e.g., a
+    solution to improve); courses not in it start at a random meeting time.
+    Returns a pair (courses_to_mt_d, cost) of the dictionary from course name to meeting time of the best schedule
+    found and its cost, which is the objective value the scheduler's model gives that schedule.
+    """
+    if num_iterations is None:
+        num_iterations = NUM_ITERATIONS
+    rand = random.Random(seed)
+    initial = initial or {}
+    assignment = []
+    for (i, cn) in enumerate(problem.names):
+        mts = problem.meeting_times[i]
+        assignment.append(mts.index(initial[cn]) if cn in initial else rand.randrange(len(mts)))
+    state = _search_state(problem, assignment)
+
+    movable = [i for i in range(len(problem.names)) if len(problem.meeting_times[i]) > 1]
+    if not movable:
+        return (dict(zip(problem.names, (problem.meeting_times[i][k] for (i, k) in enumerate(state.assignment)))), state.cost)
+
+    def random_move():
+        i = rand.choice(movable)
+        k = rand.randrange(len(problem.meeting_times[i]) - 1)
+        if k >= state.assignment[i]:
+            k += 1
+        return (i, k)
+
+    # Start hot enough to accept a typical uphill move
+    uphill = sorted(d for d in (state.delta(*random_move()) for s in range(NUM_TEMPERATURE_SAMPLES)) if d > 0)
+    temperature = max(uphill[len(uphill) // 2] if uphill else FINAL_TEMPERATURE, FINAL_TEMPERATURE)
+    cooling = (FINAL_TEMPERATURE / temperature) ** (1.0 / max(num_iterations, 1))
+
+    best = (state.cost, list(state.assignment))
+    for it in range(num_iterations):
+        (i, k) = random_move()
+        d = state.delta(i, k)
+        if d <= 0 or rand.random() < math.exp(-d / temperature):
+            state.move(i, k, d)
+            if state.cost < best[0]:
+                best = (state.cost, list(state.assignment))
+        temperature *= cooling
+
+    # Polish the best schedule: move single courses to their best meeting time until none improves
+    state = _search_state(problem, best[1])
+    improved = True
+    while improved:
+        improved = False
+        for i in movable:
+            (d, k) = min((state.delta(i, k), k) for k in range(len(problem.meeting_times[i])))
+            if d < 0:
+                state.move(i, k, d)
+                improved = True
+
+    courses_to_mt_d = {cn : problem.meeting_times[i][k] for (i, (cn, k)) in enumerate(zip(problem.names, state.assignment))}
+    return (courses_to_mt_d, state.cost)
+
+def timed_local_search(problem, initial=None, num_iterations=None, seed=0):
+    """
+    local_search, printing the cost of the schedule found and how long it took.
+    """
+    starttime = datetime.datetime.now()
+    (courses_to_mt_d, cost) = local_search(problem, initial, num_iterations, seed)
+    print("Local search found a schedule with objective value %s in %s seconds"%(cost, (datetime.datetime.now() - starttime).total_seconds()))
+    return (courses_to_mt_d, cost)
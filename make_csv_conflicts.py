@@ -13,6 +13,7 @@ import pickle, csv, sys
 
 import display_trans as dt
 import make_name_dicts as md
+import artifacts
 import operator as op
 
 def write_conflicts_csv(conflicts_d, c_in, csv_out):
@@ -57,6 +58,16 @@ def write_conflicts_csv(conflicts_d, c_in, csv_out):
     # Go through each
     for (c1, c2), count in conflicts_d.items():
         csv_out.writerow([c1, c2, count])
+def write_conflicts_csv_file(conflicts_d, course_times_filename, out_filename='conflicts.csv'):
+    """
+    Same as write_conflicts_csv, reading the course time info from the file course_times_filename and writing the
+    csv file out_filename.
+    """
+    with open(out_filename, 'w') as out_file, open(course_times_filename, 'r') as fin:
+        c_in = csv.reader(fin)
+        # discard the headers
+        h = next(c_in)
+        write_conflicts_csv(conflicts_d, c_in, csv.writer(out_file))
 
 if __name__ == '__main__':
     def usage():
@@ -81,7 +92,7 @@ if __name__ == '__main__':
         h = next(c_in)
 
 
-    conflicts_d = md.unpickle_data('conflicts_d.pkl')
+    conflicts_d = artifacts.load_dict(artifacts.CONFLICTS_FILE)
     c_out = csv.writer(out_file)
     write_conflicts_csv(conflicts_d, c_in, c_out)
     if c_in:
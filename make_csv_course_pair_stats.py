@@ -5,12 +5,13 @@ Created on 2019-04-04
 
 @author chong
 
-Using course_pair_stats_d.pkl, created by build_course_pair_stats_d.py, produce a csv file
+Using course_pair_stats_d.art, created by build_course_pair_stats_d.py, produce a csv file
 listing pairs of courses and statistics about how many students take them.
 """
 import pickle, csv, sys
 
 import make_name_dicts as md
+import artifacts
 import operator as op
 from collections import OrderedDict
 from build_course_pair_stats_d import course_pair_stats, course_stats, parse_canonical_course_name
@@ -193,8 +194,9 @@ if __name__ == '__main__':
     out_file = open(outfilename, 'w')
 
 
-    (course_pair_stats_d, course_stats_d) = md.unpickle_data('course_pair_stats_d.pkl')
-    c_out = csv.writer(out_file)
-    write_course_pair_stats_csv(course_pair_stats_d, course_stats_d, schedules, c_out)
+    with artifacts.artifact(artifacts.COURSE_PAIR_STATS_FILE) as art:
+        (course_pair_stats_d, course_stats_d) = (art.table('course_pair_stats_d'), art.table('course_stats_d'))
+        c_out = csv.writer(out_file)
+        write_course_pair_stats_csv(course_pair_stats_d, course_stats_d, schedules, c_out)
         
     out_file.close()
@@ -5,19 +5,19 @@ Created on 2019-04-04
 
 @author chong
 
-Using course_pair_stats_d.pkl, created by build_course_pair_stats_d.py, produce a csv file
+Using course_pair_stats_d.art, created by build_course_pair_stats_d.py, produce a csv file
 listing large courses.
 """
 import pickle, csv, sys
 
 import make_name_dicts as md
+import artifacts
 import operator as op
-from build_course_pair_stats_d import course_pair_stats, course_stats, parse_canonical_course_name, term_cmp
+from build_course_pair_stats_d import course_pair_stats, course_stats, parse_canonical_course_name, TERM_REGISTRY
 from allston_course_selector import will_be_allston_course_canonical_cn
 from harvard_course_info import is_cross_list_canonical
 
 
-from functools import cmp_to_key
 
 def write_large_courses_csv(course_pair_stats_d, course_stats_d, csv_out):
     # Get the list of terms.
@@ -27,7 +27,7 @@ def write_large_courses_csv(course_pair_stats_d, course_stats_d, csv_out):
 
     # sort the list of terms
     term_keys = list(term_keys)
-    term_keys.sort(key=cmp_to_key(term_cmp), reverse=True)
+    term_keys.sort(key=TERM_REGISTRY.ordinal, reverse=True)
 
 
     header_l =[ 'Course' , 'Allston' ] + term_keys
@@ -56,8 +56,9 @@ if __name__ == '__main__':
     out_file = open(sys.argv[1], 'w')
 
 
-    (course_pair_stats_d, course_stats_d) = md.unpickle_data('course_pair_stats_d.pkl')
+    # Only the course stats are needed, so the course pair stats aren't read
+    course_stats_d = artifacts.load_dict(artifacts.COURSE_PAIR_STATS_FILE, 'course_stats_d')
     c_out = csv.writer(out_file)
-    write_large_courses_csv(course_pair_stats_d, course_stats_d, c_out)
+    write_large_courses_csv(None, course_stats_d, c_out)
         
     out_file.close()
@@ -32,6 +32,12 @@ def write_trans_csv(trans_d_l, csv_out):
             csv_out.writerow([time_l[j], a_l[j], c_l[j]])
         csv_out.writerow([''])
 
+def write_trans_csv_file(trans_d_l, out_filename='transitions.csv'):
+    """
+    Same as write_trans_csv, writing the csv file out_filename.
+    """
+    with open(out_filename, 'w') as out_file:
+        write_trans_csv(trans_d_l, csv.writer(out_file))
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
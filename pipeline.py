@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs a sequence of analysis stages in a single process, passing the results of each stage to later stages in memory.
+Each stage's results are also saved to files (the same files that the stand-alone programs write), and a manifest
+records a hash of everything each stage's results depend on: the contents of the input data files, the source of the
+modules the stage uses, its parameters, and (for results of earlier stages) the hashes of those stages. A stage whose
+hash matches the manifest, and whose files are present, is skipped, and its results are read from its files if a
+later stage needs them. So, e.g., after editing allston_course_selector.py only the stages that use it, and the
+stages that depend on them, are run again.
+"""
+
+import os, json, hashlib, importlib.util
+import make_name_dicts as md
+
+MANIFEST_FILE = '.pipeline_manifest.json'
+
+def _hash_bytes(h, path):
+    with open(path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(1 << 20), b''):
+            h.update(chunk)
+
+def hash_path(path):
+    """
+    Hash of the contents of a file, or of all the files in a directory (e.g., an enrollment store).
+    """
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode('utf-8'))
+            _hash_bytes(h, os.path.join(path, name))
+    else:
+        _hash_bytes(h, path)
+    return h.hexdigest()
+
+def hash_modules(modules):
+    """
+    Hash of the source of the named modules.
+    """
+    h = hashlib.sha256()
+    for m in modules:
+        h.update(m.encode('utf-8'))
+        _hash_bytes(h, importlib.util.find_spec(m).origin)
+    return h.hexdigest()
+
+class stage(object):
+    """
+    A stage of a pipeline.
+    func is called with the values of the inputs, in order, and returns a tuple of the values of the outputs, in order.
+    inputs is a list of names of data files (see pipeline.add_file) or of outputs of earlier stages.
+    outputs is a list of pairs (filename, kind), where kind says how the output is saved to filename:
+      "pickle" uses make_name_dicts.pickle_data, a codec name of artifacts.py saves an artifact file, and
+      "file" means func writes the file itself (its value is ignored).
+    modules is a list of the names of the modules whose source the results depend on.
+    params is a JSON-serializable value of any other parameters the results depend on.
+    """
+    def __init__(self, name, func, inputs, outputs, modules=(), params=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.modules = list(modules)
+        self.params = params
+
+def _save(filename, kind, value):
+    if kind == "file":
+        return
+    if kind == "pickle":
+        md.pickle_data(filename, value)
+        return
+    import artifacts
+    artifacts.save_dict(filename, kind, value)
+
+def _load(filename, kind):
+    assert kind != "file", "%s is written by its stage, and can't be used as an input"%filename
+    if kind == "pickle":
+        return md.unpickle_data(filename)
+    import artifacts
+    return artifacts.load_dict(filename)
+
+class pipeline(object):
+    """
+    A sequence of stages, run in the order they were added. Files are relative to the current directory.
+    """
+    def __init__(self, manifest_file=MANIFEST_FILE):
+        self.manifest_file = manifest_file
+        self.files = {}
+        self.stages = []
+
+    def add_file(self, name, path):
+        """
+        Add a data file (or directory) that stages can use as an input. The stage is given path as the value of the input.
+        """
+        self.files[name] = path
+
+    def add_stage(self, st):
+        self.stages.append(st)
+
+    def run(self, force=False, report=print):
+        """
+        Run the stages whose inputs have changed since the last run (or all of them, if force is true).
+        Returns the list of names of the stages that were run.
+        """
+        manifest = {}
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file, 'r') as fin:
+                manifest = json.load(fin)
+
+        # Hashes and (once known) values of the data files and outputs
+        hashes = {name: hash_path(path) for name, path in self.files.items()}
+        values = dict(self.files)
+        kinds = {}
+
+        def value(name):
+            if name not in values:
+                values[name] = _load(name, kinds[name])
+            return values[name]
+
+        ran = []
+        for st in self.stages:
+            for i in st.inputs:
+                assert i in hashes, "Stage %s uses %s, which is not a data file or an output of an earlier stage"%(st.name, i)
+
+            key = hashlib.sha256(json.dumps([st.name, [hashes[i] for i in st.inputs], hash_modules(st.modules), st.params]).encode('utf-8')).hexdigest()
+
+            up_to_date = manifest.get(st.name) == key and all(os.path.exists(f) for (f, kind) in st.outputs)
+            if up_to_date and not force:
+                report("Skipping %s: inputs unchanged"%st.name)
+            else:
+                report("Running %s"%st.name)
+                res = st.func(*[value(i) for i in st.inputs])
+                if len(st.outputs) == 1 and not isinstance(res, tuple):
+                    res = (res,)
+                for ((f, kind), v) in zip(st.outputs, res):
+                    _save(f, kind, v)
+                    values[f] = v
+
+                # Record the stage as done straight away, so that it isn't repeated if a later stage fails
+                manifest[st.name] = key
+                with open(self.manifest_file, 'w') as fout:
+                    json.dump(manifest, fout, indent=1, sort_keys=True)
+                ran.append(st.name)
+
+            for (f, kind) in st.outputs:
+                hashes[f] = key
+                kinds[f] = kind
+
+        return ran
@@ -11,15 +11,19 @@ Create an Allston schedule that minimizes bad course conflicts.
 import warnings
 import sys, csv, math, datetime
 import class_time as ct
+import allston_course_selector
 from allston_course_selector import will_be_allston_course_subj_catalog
 from harvard_course_info import cross_list_canonical, is_cross_list_canonical, non_FAS_instructor
 import schedule_slots as ss
 from ortools.linear_solver import pywraplp
+import cpsat_backend
+import local_search_scheduler
 import scheduling_course_time as sct
 import build_schedule_score as schedule_score
 import build_allston_graphs
 import json
 import random
+import multiprocessing
 
 
 # Note that this file implements three different versions of the solver, controlled by the following variable.
@@ -27,6 +31,28 @@ import random
 SOLVER_VERSION = 3
 assert SOLVER_VERSION in [1,2,3]
 
+# The solver backend (see cpsat_backend.BACKENDS): "cbc" (the default) or "cpsat"
+SOLVER_BACKEND = "cbc"
+
+# If true, a call to the solver that reaches its time limit keeps the feasible (but not proven optimal) solution
+# it has found, rather than being treated as timed out, so that the time spent on it isn't wasted.
+# See also cpsat_backend.solution_gap.
+KEEP_FEASIBLE_SOLUTIONS = False
+
+# If true, solver version 1 adds the student schedule constraints lazily (see solve_schedule_lazy_v1), rather than
+# adding them for the MAX_STUDENT_SCHEDULES largest sets of courses up front.
+LAZY_STUDENT_CONSTRAINTS = False
+
+# If LOCAL_SEARCH_ONLY is true, the schedule is found by local_search_scheduler (in seconds) rather than by the
+# solver. If LOCAL_SEARCH_WARM_START is true, the solver is given the schedule found by local_search_scheduler
+# as a starting point.
+LOCAL_SEARCH_ONLY = False
+LOCAL_SEARCH_WARM_START = False
+
+# If true, version 3 of the solver improves its first solution by large neighborhood search (see solve_schedule_lns),
+# rather than by searching the solutions with added no-good constraints.
+LNS_SEARCH = False
+
 # Weights that control the objective function
 MAJOR_UNIT = 1000000
 MINOR_UNIT = 100
@@ -48,12 +74,28 @@ PARAMS =  {
     'WEIGHT_NO_LUNCH_PER_STUDENT' : 0.0001,
     'WEIGHT_PER_STUDENT_TRIP_TO_ALLSTON' : 0.0005,
     'MAX_STUDENT_SCHEDULES' : 1000,
+    # v1 lazy constraint generation: stop when the sets of courses that the solution hurts (and that aren't in the
+    # model yet) have fewer than LAZY_MIN_NEW_STUDENTS students, when LAZY_MAX_ROUNDS_WITHOUT_IMPROVEMENT rounds in a
+    # row don't improve the best score, after LAZY_MAX_ROUNDS rounds, or once the rounds have taken
+    # LAZY_TIME_LIMIT_MS milliseconds. Each round adds constraints for at most LAZY_MAX_SETS_PER_ROUND sets of
+    # courses, and stops adding them once the model has LAZY_MAX_GROWTH_PER_ROUND times more variables.
+    'LAZY_MIN_NEW_STUDENTS' : 20,
+    'LAZY_MAX_ROUNDS_WITHOUT_IMPROVEMENT' : 2,
+    'LAZY_MAX_ROUNDS' : 10,
+    'LAZY_TIME_LIMIT_MS' : 5 * 60 * 1000,
+    'LAZY_MAX_SETS_PER_ROUND' : 50,
+    'LAZY_MAX_GROWTH_PER_ROUND' : 0.5,
 
     # v2 params
     'MAX_COURSE_PAIRS' : 20,
     'WEIGHT_COMMON_COURSE_PAIR_ADJACENT_IN_ALLSTON': -2,
     'WEIGHT_COMMON_COURSE_PAIR_ALMOST_ADJACENT_IN_ALLSTON': -1,
     'WEIGHT_COMMON_COURSE_PAIR_DIFF_CAMPUS_DIFF_DAYS': -2,
+
+    # v3 large neighborhood search: each move re-optimizes at most LNS_NEIGHBORHOOD_SIZE courses, with a solver
+    # time limit of LNS_MOVE_TIME_LIMIT_MS milliseconds
+    'LNS_NEIGHBORHOOD_SIZE' : 6,
+    'LNS_MOVE_TIME_LIMIT_MS' : 1000,
 }
 
 
@@ -63,6 +105,10 @@ def makeDisjunction(solver, v, disjuncts):
     one of the variables in disjuncts is 1. (All variables in
     disjuncts and v should be 0-1 valued variables.
     """
+    if cpsat_backend.is_cpsat(solver):
+        solver.AddDisjunction(v, disjuncts)
+        return
+
     cn = solver.Constraint(0, (len(disjuncts) - 1))
     cn.SetCoefficient(v, len(disjuncts))
     for x in disjuncts:
@@ -74,11 +120,19 @@ def makeConjunction(solver, v, conjuncts):
     all of the variables in disjuncts is 1. (All variables in
     conjuncts and v should be 0-1 valued variables.
     """
+    if cpsat_backend.is_cpsat(solver):
+        solver.AddConjunction(v, conjuncts)
+        return
+
     cn = solver.Constraint(0, (len(conjuncts) - 1))
     cn.SetCoefficient(v, -len(conjuncts))
     for x in conjuncts:
         cn.SetCoefficient(x, 1)
 
+def _gap_history(gap):
+    # Description of a non-optimal solution's gap, for the history of a Solution
+    return "" if gap is None or gap < 1e-6 else "; feasible, gap %.2f%%"%(100 * gap)
+
 
 
 class Course:
@@ -149,34 +203,46 @@ class Course:
                 cn.SetCoefficient(sx, 1)
 
 
-    def createObjective(self, solver, objective, conflict_vars_d, sched_d, conflicts_d, courses):
+    def slot_weight(self, asl):
+        """
+        The weight of actual slot asl for this course in the objective function, or None.
+        """
+        weight = None
+        # Put a little pressure on to not use slots 6 or 7
+        if asl[1] == "6":
+            weight = PARAMS['WEIGHT_AVOID_SLOT_6']
+        if asl[1] == "7":
+            weight = PARAMS['WEIGHT_AVOID_SLOT_7']
+
+        if asl[0]=="T" and asl[1] in ["4", "5"]:
+            if self.name in non_FAS_instructor:
+                # for non-FAS faculty, favor teaching on Tuesday 3pm-5pm
+                if asl[1] == "4":
+                    weight = PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5']
+                else:
+                    weight = PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5']*3
+            else:
+                # avoid teaching on Tuesday 3pm-5pm for FAS instructors
+                weight = PARAMS['WEIGHT_AVOID_COURSES_TU_3_TO_5']
+
+        if asl[0]=="F":
+            # avoid Friday teaching, to mimic faculty preferences
+            weight = PARAMS['WEIGHT_AVOID_COURSES_FRIDAY']
+        return weight
+
+    def createObjective(self, solver, objective, conflict_vars_d, sched_d, conflicts_d, courses, fixed_conflicts=None):
         """
         Create/add to objective function for this course
+        fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
         """
+        if fixed_conflicts is None:
+            fixed_conflicts = ss.fixed_conflict_index(sched_d)
 
 
-        # Put a little pressure on to not use slots 6 or 7
         for asl in self.vars_actualslots:
-            if asl[1] == "6":
-                objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_SLOT_6']) 
-            if asl[1] == "7":
-                objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_SLOT_7']) 
-
-            if asl[0]=="T" and asl[1] in ["4", "5"]:
-                if self.name in non_FAS_instructor:
-                    # for non-FAS faculty, favor teaching on Tuesday 3pm-5pm
-                    if asl[1] == "4":
-                        objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5'])
-                    else:                        
-                        objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5']*3)
-                else:
-                    # avoid teaching on Tuesday 3pm-5pm for FAS instructors
-                    objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_COURSES_TU_3_TO_5'])
-
-            if asl[0]=="F":
-                # avoid Friday teaching, to mimic faculty preferences
-                objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_COURSES_FRIDAY']) 
-            
+            weight = self.slot_weight(asl)
+            if weight is not None:
+                objective.SetCoefficient(self.vars_actualslots[asl], weight)
         
         
         # Add to objective function for bad course conflicts
@@ -205,13 +271,8 @@ class Course:
             if other not in courses:
                 # the other course already has a fixed schedule.
                 # Go through each actual slot and see if it intersects with other course
-                disjuncts = []
-                for s in self.vars_actualslots:
-                    my_course_time = ss.meeting_time_to_course_time([s])
-                    
-                    if sct.courses_conflict([my_course_time], sched_d[other]):
-                        # slots s conflicts with the time for other
-                        disjuncts.append(self.vars_actualslots[s])
+                conflicting_slots = fixed_conflicts.conflicting_slots(other)
+                disjuncts = [self.vars_actualslots[s] for s in self.vars_actualslots if s in conflicting_slots]
 
                 if len(disjuncts) > 0:
                     makeDisjunction(solver, v_conflicts, disjuncts)
@@ -241,21 +302,30 @@ class Course:
                 return s
         return None
 
+# The areas that add_area_constraints spreads out
+AREAS = ("APCOMP","APMTH","BE","COMPSCI","ENG-SCI","ESE")
+
+def _area_slot_weight(cn, asl):
+    """
+    The weight that add_area_constraints gives actual slot asl of course cn in the objective function (replacing
+    the weight from Course.createObjective), or None.
+    """
+    # For COMPSCI, avoid Friday lunch (faculty meeting) and Thursday seminar
+    if cn.startswith("COMPSCI") and asl in ["F3a","R5a"]:
+        return PARAMS['WEIGHT_AVOID_CS_COURSES_IN_FAC_LUNCH_OR_COLLOQ']
+    return None
+
 def add_area_constraints(solver, objective, courses):
     """
     Add constraints to spread each area out over days of week and times of day
     """
-    areas = ("APCOMP","APMTH","BE","COMPSCI","ENG-SCI","ESE")
-
-    # For COMPSCI, avoid Friday lunch (faculty meeting) and Thursday seminar
     for c in courses:
-        if not c.startswith("COMPSCI"):
-            continue
-        for avoid in ["F3a","R5a"]:
-            if avoid in courses[c].vars_actualslots:
-                objective.SetCoefficient(courses[c].vars_actualslots[avoid], PARAMS['WEIGHT_AVOID_CS_COURSES_IN_FAC_LUNCH_OR_COLLOQ']) 
+        for asl in courses[c].vars_actualslots:
+            weight = _area_slot_weight(c, asl)
+            if weight is not None:
+                objective.SetCoefficient(courses[c].vars_actualslots[asl], weight)
     
-    for area in areas:
+    for area in AREAS:
         v_day_of_week_diff = solver.IntVar(0, solver.infinity(), area + " diff between TuTh and MWF courses")
         objective.SetCoefficient(v_day_of_week_diff, PARAMS['WEIGHT_DIFF_NUM_COURSES_DAY_OF_WEEK']) 
         
@@ -302,8 +372,50 @@ def add_area_constraints(solver, objective, courses):
 
 
 
-def add_constraints_for_one_student_schedule_day(solver, objective, courses, enroll_d, sched_d, fs, tu_thu):
-    # Go through the courses in fs and figure out the important times (i.e., start and end times of the student's courses)
+def _is_appropriate_day(days, tu_thu):
+    # days is a sequence of the day indexes (0 for Monday, see ss.meeting_time_days) of the days something meets.
+    # It can't be a sequence of booleans: True == 1, so any meeting day would count as Tuesday.
+    is_tu_or_thu = 1 in days or 3 in days
+    return is_tu_or_thu if tu_thu else (not is_tu_or_thu)
+
+def student_day_projection(courses, sched_d, fs, tu_thu):
+    """
+    The projection of the set of courses fs onto the TuTh (if tu_thu is true) or MWF day pattern: the pair
+    (allston_courses, cambridge_times) of the sorted tuple of the courses of fs that are being scheduled (i.e., are
+    in courses) and could meet on those days, and the sorted tuple of the distinct (start, end) times, in minutes, of the
+    other courses of fs on those days. Returns None if none of the courses being scheduled could meet on those days.
+    Sets of courses with the same projection get the same constraints from add_constraints_for_day_projection.
+    """
+    allston_courses = []
+    cambridge_times = set()
+    for cn in fs:
+        if cn in courses:
+            # cn is in Allston
+            if any(_is_appropriate_day(ss.meeting_time_days(mt), tu_thu) for mt in courses[cn].vars_meeting_time):
+                allston_courses.append(cn)
+        else:
+            # cn is in Cambridge
+            assert cn in sched_d
+            # sched_d[cn] is a list of course_time objects
+            for cto in sched_d[cn]:
+                if _is_appropriate_day([i for i in range(len(cto.days)) if cto.days[i]], tu_thu):
+                    cambridge_times.add(cto.time_as_interval())
+
+    if not allston_courses:
+        # no courses in allston on this day!
+        return None
+
+    return (tuple(sorted(allston_courses)), tuple(sorted(cambridge_times)))
+
+def add_constraints_for_day_projection(solver, objective, courses, projection, tu_thu, num_students, name):
+    """
+    Add the variables and constraints for the round trips and lunch, on the TuTh (if tu_thu is true) or MWF day
+    pattern, of num_students students with the courses of projection (see student_day_projection).
+    name (e.g., the set of courses) is used in the names of the variables.
+    Returns the list of pairs (v, coef) of the terms of the objective function that were added, where coef is
+    the coefficient per student.
+    """
+    # Go through the courses and figure out the important times (i.e., start and end times of the student's courses)
     # For each such time t:
     #     in_cambridge[t] is 0-1 variable and 1 iff the student needs to be in Cambridge at time t
     #     in_allston[t] is 0-1 variable and 1 iff the student needs to be in Allston at time t
@@ -328,56 +440,36 @@ def add_constraints_for_one_student_schedule_day(solver, objective, courses, enr
     lunch_end = 14*60 # 2PM
     lunch_duration = 30 # 30 minutes for lunch
 
-    allston_course_on_day = False
-    
+    (allston_courses, cambridge_times) = projection
+
     times = set()
 
     dayname = "TuThu" if tu_thu else "MWF"
     def is_appropriate_day(mt):
-        days = [ss.DAYS_OF_WEEK.index(slot[0]) for slot in mt]
-        is_tu_or_thu = 1 in days or 3 in days
-        return is_tu_or_thu if tu_thu else (not is_tu_or_thu)
-    def is_appropriate_day_cto(cto):
-        is_tu_or_thu = cto.days[1] or cto.days[3]
-        return is_tu_or_thu if tu_thu else (not is_tu_or_thu)
+        return _is_appropriate_day(ss.meeting_time_days(mt), tu_thu)
 
-        
-    for cn in fs:
-        if cn in courses:
-            # cn is in Allston
-            for mt in courses[cn].vars_meeting_time:
-                if not is_appropriate_day(mt):
-                    # wrong day!
-                    continue
-                course_time = ss.meeting_time_to_course_time(mt)
-                (start, end) = ct.time_as_interval(course_time.time_start, course_time.time_end)
-                times.add(start)
-                times.add(end)
-                allston_course_on_day = True
-                
-        else:
-            # cn is in Cambridge
-            assert cn in sched_d
-            # sched_d[cn] is a list of course_time objects
-            for cto in sched_d[cn]:
-                if not is_appropriate_day_cto(cto):
-                    # wrong day!
-                    continue
-                (start, end) = ct.time_as_interval(cto.time_start, cto.time_end)
-                times.add(start)
-                times.add(end)
+    for cn in allston_courses:
+        for mt in courses[cn].vars_meeting_time:
+            if not is_appropriate_day(mt):
+                # wrong day!
+                continue
+            (start, end) = ss.meeting_time_interval(mt)
+            times.add(start)
+            times.add(end)
 
-    if not allston_course_on_day:
-        # no courses in allston on this day!
-        return
+    for (start, end) in cambridge_times:
+        times.add(start)
+        times.add(end)
 
     times.add(0)
     times = sorted(list(times))
 
+    terms = []
+
     v_in_cambridge = [False for i in range(len(times))]
-    v_in_allston = [solver.IntVar(0, 1, "%s: must be in allston at %s on day %s"%(fs,times[i],dayname)) if i > 0 else None for i in range(len(times))]
-    v_location = [solver.IntVar(0, 1, "%s: location at %s on day %s"%(fs,times[i],dayname)) for i in range(len(times))]
-    v_is_scheduled = [solver.IntVar(0, 1, "%s: is scheduled at %s on day %s"%(fs,times[i],dayname)) if i > 0 else None for i in range(len(times))]
+    v_in_allston = [solver.IntVar(0, 1, "%s: must be in allston at %s on day %s"%(name,times[i],dayname)) if i > 0 else None for i in range(len(times))]
+    v_location = [solver.IntVar(0, 1, "%s: location at %s on day %s"%(name,times[i],dayname)) for i in range(len(times))]
+    v_is_scheduled = [solver.IntVar(0, 1, "%s: is scheduled at %s on day %s"%(name,times[i],dayname)) if i > 0 else None for i in range(len(times))]
 
     # force student to be in Cambridge at the start of the day
     v_in_cambridge[0] = True
@@ -393,12 +485,12 @@ def add_constraints_for_one_student_schedule_day(solver, objective, courses, enr
 
     # Set up objective function to minimize transitions to Allston
     for t in range(1,len(times)):
-        v_trans_to_allston = solver.IntVar(0, 1, "%s: transition to allston at %s on day %s"%(fs,times[t],dayname))
+        v_trans_to_allston = solver.IntVar(0, 1, "%s: transition to allston at %s on day %s"%(name,times[t],dayname))
         cnst = solver.Constraint(0, solver.infinity())
         cnst.SetCoefficient(v_location[t-1], 1)
         cnst.SetCoefficient(v_location[t], -1)
         cnst.SetCoefficient(v_trans_to_allston, 1)
-        objective.SetCoefficient(v_trans_to_allston, PARAMS['WEIGHT_PER_STUDENT_TRIP_TO_ALLSTON'] * int(enroll_d[fs]))
+        terms.append((v_trans_to_allston, PARAMS['WEIGHT_PER_STUDENT_TRIP_TO_ALLSTON']))
 
 
     # Set up objective function to allow students to have lunch
@@ -408,109 +500,168 @@ def add_constraints_for_one_student_schedule_day(solver, objective, courses, enr
         if lunch_start <= times[t] and times[t] < lunch_end:
             lunch_schedule_vars.append(v_is_scheduled[t])
         
-    no_lunch = solver.IntVar(0, 1, "%s: no lunch on day %s"%(fs,dayname))
+    no_lunch = solver.IntVar(0, 1, "%s: no lunch on day %s"%(name,dayname))
     makeConjunction(solver, no_lunch, lunch_schedule_vars)
-    objective.SetCoefficient(no_lunch, PARAMS['WEIGHT_NO_LUNCH_PER_STUDENT'] * int(enroll_d[fs])) 
+    terms.append((no_lunch, PARAMS['WEIGHT_NO_LUNCH_PER_STUDENT']))
 
+    for (v, coef) in terms:
+        objective.SetCoefficient(v, coef * num_students)
 
-    # Now go through the courses in fs and set up the constraints on v_in_allston, v_in_cambridge, and v_is_scheduled
-    for cn in fs:
-        if cn in courses:
-            # cn is in Allston
-            # Add the appropriate constraints
-            for asl in courses[cn].vars_actualslots:
-                if not is_appropriate_day([asl]):
-                    # wrong day!
-                    continue
 
-                (asl_start, asl_end) = ct.time_as_interval(ss.slot_start_time(asl), ss.slot_end_time(asl))
-
-                for t in range(1,len(times)):
-                    # does the time represented by asl contain the time times[t]?
-                    # if so, constrain v_in_allston[t] to be true if var_actual_slots is true
-                    if asl_start <= times[t] and times[t] < asl_end:
-                        # if courses[cn].vars_actualslots[asl] then  v_in_allston[t]
-                        cnst = solver.Constraint(0, solver.infinity())
-                        cnst.SetCoefficient(courses[cn].vars_actualslots[asl], -1)
-                        cnst.SetCoefficient(v_in_allston[t], 1)
-
-                        # if courses[cn].vars_actualslots[asl] then  v_is_scheduled[t]
-                        cnst = solver.Constraint(0, solver.infinity())
-                        cnst.SetCoefficient(courses[cn].vars_actualslots[asl], -1)
-                        cnst.SetCoefficient(v_is_scheduled[t], 1)
-        else:
-            # cn is in Cambridge
-            assert cn in sched_d
-            # sched_d[cn] is a list of course_time objects
-            for cto in sched_d[cn]:
-                if not is_appropriate_day_cto(cto):
-                    # wrong day!
-                    continue
-                (cto_start, cto_end) = cto.time_as_interval()
-                for t in range(1,len(times)):
-                    # does the time represented by cto contain the time times[t]?
-                    # if so, constrain v_in_cambridge[t] to be true
-                    if cto_start <= times[t] and times[t] < cto_end:
-                        if not v_in_cambridge[t]:
-                            v_in_cambridge[t] = True
-                            cnst = solver.Constraint(1,1)
-                            cnst.SetCoefficient(v_is_scheduled[t], 1)                        
-                                        
-def add_student_schedule_constraints_v1(solver, objective, courses, enroll_d, sched_d):
+    # Now go through the courses and set up the constraints on v_in_allston, v_in_cambridge, and v_is_scheduled
+    for cn in allston_courses:
+        # cn is in Allston
+        # Add the appropriate constraints
+        for asl in courses[cn].vars_actualslots:
+            if not is_appropriate_day([asl]):
+                # wrong day!
+                continue
+
+            (asl_start, asl_end) = ss.slot_interval(asl)
+
+            for t in range(1,len(times)):
+                # does the time represented by asl contain the time times[t]?
+                # if so, constrain v_in_allston[t] to be true if var_actual_slots is true
+                if asl_start <= times[t] and times[t] < asl_end:
+                    # if courses[cn].vars_actualslots[asl] then  v_in_allston[t]
+                    cnst = solver.Constraint(0, solver.infinity())
+                    cnst.SetCoefficient(courses[cn].vars_actualslots[asl], -1)
+                    cnst.SetCoefficient(v_in_allston[t], 1)
+
+                    # if courses[cn].vars_actualslots[asl] then  v_is_scheduled[t]
+                    cnst = solver.Constraint(0, solver.infinity())
+                    cnst.SetCoefficient(courses[cn].vars_actualslots[asl], -1)
+                    cnst.SetCoefficient(v_is_scheduled[t], 1)
+
+    # The Cambridge courses
+    for (cto_start, cto_end) in cambridge_times:
+        for t in range(1,len(times)):
+            # does the time represented by cto contain the time times[t]?
+            # if so, constrain v_in_cambridge[t] to be true
+            if cto_start <= times[t] and times[t] < cto_end:
+                if not v_in_cambridge[t]:
+                    v_in_cambridge[t] = True
+                    cnst = solver.Constraint(1,1)
+                    cnst.SetCoefficient(v_is_scheduled[t], 1)                        
+
+    return terms
+
+def add_constraints_for_one_student_schedule_day(solver, objective, courses, enroll_d, sched_d, fs, tu_thu):
+    """
+    Add the variables and constraints for the round trips and lunch of the students with the set of courses fs,
+    on the TuTh (if tu_thu is true) or MWF day pattern.
+    """
+    projection = student_day_projection(courses, sched_d, fs, tu_thu)
+    if projection is None:
+        return
+    add_constraints_for_day_projection(solver, objective, courses, projection, tu_thu, int(enroll_d[fs]), fs)
+
+class StudentDayPatterns(object):
+    """
+    The variables and constraints for student schedules of solver version 1, with one family of them (see
+    add_constraints_for_day_projection) for each distinct projection of the sets of courses onto the MWF and TuTh day
+    patterns (see student_day_projection). Sets of courses with the same projection share its family, whose
+    objective terms are weighted by their total number of students, which keeps the model much smaller than
+    one family per set of courses.
+    """
+    def __init__(self, solver, objective, courses, sched_d):
+        self.solver = solver
+        self.objective = objective
+        self.courses = courses
+        self.sched_d = sched_d
+        # Dictionary from (tu_thu, projection) to the pair [number of students, objective terms] of its family
+        self.families = {}
+
+    def projections(self, fs):
+        """
+        The list of keys (tu_thu, projection) of the day patterns of the set of courses fs.
+        """
+        keys = []
+        for tu_thu in [True, False]: # just do MWF and TR, that's good enough
+            projection = student_day_projection(self.courses, self.sched_d, fs, tu_thu)
+            if projection is not None:
+                keys.append((tu_thu, projection))
+        return keys
+
+    def is_new(self, keys):
+        """
+        Would adding a set of courses with projections keys add a new family of variables?
+        """
+        return any(k not in self.families for k in keys)
+
+    def add(self, keys, fs, num_students):
+        """
+        Add num_students students with the set of courses fs, whose projections are keys (see projections).
+        """
+        for key in keys:
+            family = self.families.get(key)
+            if family is None:
+                (tu_thu, projection) = key
+                terms = add_constraints_for_day_projection(self.solver, self.objective, self.courses, projection, tu_thu, num_students, fs)
+                self.families[key] = [num_students, terms]
+            else:
+                family[0] += num_students
+                for (v, coef) in family[1]:
+                    self.objective.SetCoefficient(v, coef * family[0])
+
+def add_student_schedule_constraints_v1(solver, objective, courses, enroll_d, sched_d, enroll_index=None):
     """
     Add constraints to minimize round trips, no lunch days, etc. Do this by directly adding constraints
     for each student.
     This approach doesn't actually scale, so it can't be used except for very small numbers of enrolled students.
+    Sets of courses that look the same on a day pattern share their constraints (see StudentDayPatterns), and
+    MAX_STUDENT_SCHEDULES limits the number of sets that add new constraints; sets whose constraints are already
+    there are always added.
+    enroll_index is an optional schedule_score.enrollment_index for enroll_d.
     """
     assert SOLVER_VERSION == 1
     # enroll_d is a dictionary from frozen set of canonical course
     # names (i.e., courses taken in a term) to ints (counting how many
     # students had that set of courses)
+    if enroll_index is None:
+        enroll_index = schedule_score.enrollment_index(enroll_d)
 
     count = 0
+    patterns = StudentDayPatterns(solver, objective, courses, sched_d)
 
-    # go through them in decreasing order of enrollment weight
-    for fs in sorted(enroll_d.keys(), key=lambda k: -enroll_d[k]):
+    # Only sets with at least one of the courses we are scheduling (i.e., that will be in Allston) matter.
+    # Go through them in decreasing order of enrollment weight
+    for fs_id in sorted(enroll_index.sets_with_any(courses), key=lambda k: -enroll_index.counts[k]):
+        fs = enroll_index.sets[fs_id]
         # fs is a set of courses
         if len(fs) < schedule_score.MIN_COURSES:
             # Not enough courses
             continue
 
-        # Make sure at least one of the courses will be in Allston
-        in_allston_course_count = 0
-        for cn in fs:
-            in_allston_course_count += (1 if cn in courses else 0)
-
-        if in_allston_course_count == 0:
-            continue
-
-
-        count += 1
-        if count > PARAMS['MAX_STUDENT_SCHEDULES']:
-            continue
+        keys = patterns.projections(fs)
+        if patterns.is_new(keys):
+            count += 1
+            if count > PARAMS['MAX_STUDENT_SCHEDULES']:
+                continue
 
         #print("  Adding student schedule constraints for %s with weight %s"%(fs,enroll_d[fs]))
-        # Go through each day of the week
-        #!@!for day in range(5):
-        for day in [True, False]: # just do MWF and TR, that's good enough
-            add_constraints_for_one_student_schedule_day(solver, objective, courses, enroll_d, sched_d, fs, day)
+        patterns.add(keys, fs, int(enroll_d[fs]))
 
 
-    print("Total student schedules: %s"%count)
+    print("Total student schedules: %s, with %s distinct day patterns"%(count, len(patterns.families)))
 
-def add_student_schedule_constraints_v2(solver, objective, courses, enroll_d, sched_d):
+def add_student_schedule_constraints_v2(solver, objective, courses, enroll_d, sched_d, enroll_index=None):
     """
     Add constraints to minimize round trips, no lunch days, etc. Do this by looking at common course pairs taken by students
     and adding constraints to encourage common Allston pairs to be in adjacent or nearly adjacent meeting times.
+    enroll_index is an optional schedule_score.enrollment_index for enroll_d.
     """
     assert SOLVER_VERSION == 2
     # enroll_d is a dictionary from frozen set of canonical course
     # names (i.e., courses taken in a term) to ints (counting how many
     # students had that set of courses)
+    if enroll_index is None:
+        enroll_index = schedule_score.enrollment_index(enroll_d)
 
-    # find popular pairs of courses
+    # find popular pairs of courses. Only sets with at least one course we are scheduling have pairs we care about.
     pair_count = { }
-    for fs in enroll_d:
+    for fs_id in enroll_index.sets_with_any(courses):
+        fs = enroll_index.sets[fs_id]
         ls = sorted(list(fs))
         for i in range(len(ls)):
             for j in range(i+1,len(ls)):
@@ -520,9 +671,9 @@ def add_student_schedule_constraints_v2(solver, objective, courses, enroll_d, sc
                 
                 p = frozenset((ls[i],ls[j]))
                 if p not in pair_count:
-                    pair_count[p] = enroll_d[fs]
+                    pair_count[p] = enroll_index.counts[fs_id]
                 else:
-                    pair_count[p] += enroll_d[fs]
+                    pair_count[p] += enroll_index.counts[fs_id]
 
     count = 0
     for p in sorted(pair_count.keys(), key=lambda k: -pair_count[k]):
@@ -561,7 +712,7 @@ def add_student_schedule_constraints_v2(solver, objective, courses, enroll_d, sc
                 # give a bonus if mt1 is all on different days to cn2
                 cts = sched_d[cn2]
                 days_intersect = False
-                for ind in [ss.DAYS_OF_WEEK.index(s[0]) for s in mt1]:
+                for ind in ss.meeting_time_days(mt1):
                     for ct in cts:
                         if ct.days[ind]:
                             days_intersect = True
@@ -601,16 +752,32 @@ def build_to_schedule_d(csv_in):
                                 
     return to_schedule_d
 
-def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = None, loop_count = None):
+def build_local_search_problem(conflicts_d, sched_d, courses_to_schedule_d, fixed_conflicts = None):
     """
-    Performs one call to the solver to find a schedule.
-    loop_count should be unique
+    The objective of the scheduling problem of build_schedule_model (without the student schedule constraints of
+    solver versions 1 and 2), as a local_search_scheduler.schedule_problem.
+    fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
+    """
+    courses = {cn : Course(cn, courses_to_schedule_d[cn][0], courses_to_schedule_d[cn][1]) for cn in courses_to_schedule_d}
+    if fixed_conflicts is None:
+        fixed_conflicts = ss.fixed_conflict_index(sched_d)
+
+    # Two scheduled courses conflict if they use the same actual slot (see Course.createObjective)
+    def meeting_times_conflict(mt1, mt2):
+        return not set(mt1).isdisjoint(mt2)
+
+    return local_search_scheduler.schedule_problem(courses, conflicts_d, sched_d, fixed_conflicts, PARAMS, AREAS, _area_slot_weight, meeting_times_conflict)
+
+def build_schedule_model(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, enroll_index = None, fixed_conflicts = None, student_constraints = True):
+    """
+    Create the solver, and the variables, constraints and objective of the scheduling problem (without any
+    constraints from previous solutions). Returns a triple (solver, courses, conflict_vars_d).
+    enroll_index is an optional schedule_score.enrollment_index for enroll_d, used by solver versions 1 and 2.
+    fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
+    If student_constraints is false, the constraints for student schedules of solver versions 1 and 2 are left out.
     """
     # Create the solver
-    solver = pywraplp.Solver('CourseSchedule',
-    #                         pywraplp.Solver.GLOP_LINEAR_PROGRAMMING)
-    #                        pywraplp.Solver.BOP_INTEGER_PROGRAMMING)
-                             pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+    solver = cpsat_backend.new_solver('CourseSchedule', SOLVER_BACKEND)
 
     courses = {}
     # Let each constraint create its variables and constraints
@@ -624,20 +791,50 @@ def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, c
     objective.SetMinimization()
 
     conflict_vars_d = {}
+    if fixed_conflicts is None:
+        fixed_conflicts = ss.fixed_conflict_index(sched_d)
     
     for cname in courses:
-        courses[cname].createObjective(solver, objective, conflict_vars_d, sched_d, conflicts_d, courses)
+        courses[cname].createObjective(solver, objective, conflict_vars_d, sched_d, conflicts_d, courses, fixed_conflicts)
 
 
     add_area_constraints(solver, objective, courses)
 
     if SOLVER_VERSION == 1:
-        add_student_schedule_constraints_v1(solver, objective, courses, enroll_d, sched_d)
+        if student_constraints:
+            add_student_schedule_constraints_v1(solver, objective, courses, enroll_d, sched_d, enroll_index)
     elif SOLVER_VERSION == 2:
-        add_student_schedule_constraints_v2(solver, objective, courses, enroll_d, sched_d)
+        if student_constraints:
+            add_student_schedule_constraints_v2(solver, objective, courses, enroll_d, sched_d, enroll_index)
     else:
         assert SOLVER_VERSION == 3
 
+    return (solver, courses, conflict_vars_d)
+
+def set_solution_hint(solver, courses, hint):
+    """
+    Give the solver the dictionary hint from course name to meeting time as a starting point.
+    """
+    vars = []
+    values = []
+    for cn, mt in hint.items():
+        for s, x in courses[cn].vars_meeting_time.items():
+            vars.append(x)
+            values.append(1.0 if s == mt else 0.0)
+    solver.SetHint(vars, values)
+
+def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = None, loop_count = None, enroll_index = None, fixed_conflicts = None, hint = None):
+    """
+    Performs one call to the solver to find a schedule.
+    loop_count should be unique
+    enroll_index is an optional schedule_score.enrollment_index for enroll_d, used by solver versions 1 and 2.
+    fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
+    hint is an optional dictionary from course name to meeting time, given to the solver as a starting point.
+    """
+    (solver, courses, conflict_vars_d) = build_schedule_model(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, enroll_index, fixed_conflicts)
+    if hint is not None:
+        set_solution_hint(solver, courses, hint)
+
     if constraints:
         for cs in constraints:
             # cs is a list of pairs (cn, mt) of canonical course name cn and meeting time mt
@@ -649,14 +846,121 @@ def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, c
                 cnst = solver.Constraint(0, 0)
                 cnst.SetCoefficient(v, 1)
 
-        
+    return solve_schedule_model(solver, courses, conflict_vars_d, conflicts_d, courses_to_schedule_d)
+
+def _hurt_enrollment_sets(enroll_index, courses, scorer, added):
+    """
+    The ids of the sets of courses of enroll_index that the schedule of scorer (a schedule_score.schedule_scorer)
+    hurts (see schedule_scorer.hurt_sets), and that aren't in added and have at least one course in courses.
+    Returns a dictionary from id to the number of days the schedule hurts the set.
+    """
+    ids = {}
+    for (ffs, days) in scorer.hurt_sets().items():
+        for i in enroll_index.sets_with_all(ffs):
+            fs = enroll_index.sets[i]
+            if i in added or len(fs) < schedule_score.MIN_COURSES or not any(cn in courses for cn in fs):
+                continue
+            # the scorer only knows the courses of fs that are in the schedule
+            if frozenset(cn for cn in fs if cn in scorer.sched_d) == ffs:
+                ids[i] = days
+    return ids
+
+def solve_schedule_lazy_v1(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, enroll_index = None, fixed_conflicts = None, hint = None):
+    """
+    Solver version 1 with lazy (cutting plane) generation of the student schedule constraints.
+    The model is first solved with just the conflict and area terms. The solution is scored, and the constraints
+    of add_constraints_for_day_projection are added for the sets of courses that the solution hurts (the ones the
+    scorer counts round trips or missed lunches for), starting with the most students times days hurt, and the
+    model is solved again. This is repeated until the sets hurt have too few students to matter, the score stops
+    improving, or the time runs out (see the LAZY_ PARAMS). A round that reaches the time limit still counts its
+    best solution. Unlike add_student_schedule_constraints_v1, any of the sets of courses in enroll_d may end up in
+    the model, not just the MAX_STUDENT_SCHEDULES largest.
+    hint is an optional dictionary from course name to meeting time, given to the solver as a starting point.
+    Returns the dictionary from course name to meeting time of the solution with the best score (later rounds
+    can score worse, since the scorer counts things the model doesn't), or None if the first round found no solution.
+    """
+    assert SOLVER_VERSION == 1
+    if enroll_index is None:
+        enroll_index = schedule_score.enrollment_index(enroll_d)
+
+    (solver, courses, conflict_vars_d) = build_schedule_model(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, enroll_index, fixed_conflicts, student_constraints = False)
+    patterns = StudentDayPatterns(solver, solver.Objective(), courses, sched_d)
+    if hint is not None:
+        set_solution_hint(solver, courses, hint)
+
+    scorer = None
+    best = None
+    added = set()
+    rnd = 0
+    rounds_without_improvement = 0
+    deadline = datetime.datetime.now() + datetime.timedelta(milliseconds = PARAMS['LAZY_TIME_LIMIT_MS'])
+    while True:
+        remaining_ms = int((deadline - datetime.datetime.now()).total_seconds() * 1000)
+        if remaining_ms <= 0:
+            print("Lazy rounds reached their time limit")
+            break
+        res = solve_schedule_model(solver, courses, conflict_vars_d, conflicts_d, courses_to_schedule_d, time_limit_ms = remaining_ms, keep_feasible = True)
+        if res is None:
+            break
+        rnd += 1
+
+        courses_to_mt_d = {cn : courses[cn].solution_meeting_time() for cn in courses}
+        if scorer is None:
+            scorer = schedule_score.schedule_scorer(make_sched_d_from_solution(sched_d, courses_to_mt_d), conflicts_d, enroll_d)
+        else:
+            scorer.update_courses({cn : [ss.meeting_time_to_course_time(mt)] for (cn, mt) in courses_to_mt_d.items()})
+        (score, _, _) = scorer.score()
+        print("Lazy round %s: score %s"%(rnd, score['simple_score']))
+
+        if best is None or score['simple_score'] < best[0]:
+            best = (score['simple_score'], courses_to_mt_d)
+            rounds_without_improvement = 0
+        else:
+            rounds_without_improvement += 1
+        if rnd >= PARAMS['LAZY_MAX_ROUNDS'] or rounds_without_improvement >= PARAMS['LAZY_MAX_ROUNDS_WITHOUT_IMPROVEMENT'] or datetime.datetime.now() >= deadline:
+            break
+
+        hurt = _hurt_enrollment_sets(enroll_index, courses, scorer, added)
+        hurt_students = sum(enroll_index.counts[i] for i in hurt)
+        if hurt_students < PARAMS['LAZY_MIN_NEW_STUDENTS']:
+            print("Only %s more students are hurt by the solution"%hurt_students)
+            break
+
+        # Add the sets hurt the most, until the model has grown enough for one round. Sets whose day patterns are
+        # already in the model don't make it grow.
+        max_variables = solver.NumVariables() * (1 + PARAMS['LAZY_MAX_GROWTH_PER_ROUND'])
+        new_ids = sorted(hurt, key=lambda i: (-enroll_index.counts[i] * hurt[i], sorted(enroll_index.sets[i])))[:PARAMS['LAZY_MAX_SETS_PER_ROUND']]
+        num_added = 0
+        for i in new_ids:
+            if num_added > 0 and solver.NumVariables() >= max_variables:
+                break
+            added.add(i)
+            num_added += 1
+            fs = enroll_index.sets[i]
+            patterns.add(patterns.projections(fs), fs, int(enroll_d[fs]))
+        print("Added constraints for %s of %s student schedules the solution hurts (%s students)"%(num_added, len(hurt), hurt_students))
+
+    if best is None:
+        return None
+    print("Best lazy solution: score %s"%(best[0],))
+    return best[1]
+
+def solve_schedule_model(solver, courses, conflict_vars_d, conflicts_d, courses_to_schedule_d, time_limit_ms = None, verbose = True, keep_feasible = None):
+    """
+    Solve a model built by build_schedule_model. Returns the pair (solver, courses), or None if the solver timed out.
+    time_limit_ms is the time limit of the solver, by default none for versions 1 and 2 and 10 seconds for version 3.
+    If verbose is false, the result status and time of the solver aren't printed.
+    keep_feasible overrides KEEP_FEASIBLE_SOLUTIONS.
+    """
     if SOLVER_VERSION in [1,2]:
         print('Number of courses to schedule =', len(courses_to_schedule_d))
         print('Number of variables =', solver.NumVariables())
         print('Number of constraints =', solver.NumConstraints())
         print("Starting to solve....")
 
-    if SOLVER_VERSION == 3:
+    if time_limit_ms is not None:
+        solver.SetTimeLimit(time_limit_ms)
+    elif SOLVER_VERSION == 3:
         solver.SetTimeLimit(10 * 1000) # 10 second time limit
 
     starttime = datetime.datetime.now()
@@ -664,15 +968,17 @@ def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, c
     endtime = datetime.datetime.now()
 
     # The problem has an optimal solution.
-    if SOLVER_VERSION in [1,2,3]:
+    if SOLVER_VERSION in [1,2,3] and verbose:
         print ("Result status: %s"%result_status)
         print ("Time: %s seconds"%((endtime-starttime).total_seconds()))
 
-    if result_status == pywraplp.Solver.FEASIBLE:
+    if keep_feasible is None:
+        keep_feasible = KEEP_FEASIBLE_SOLUTIONS
+    if result_status == pywraplp.Solver.NOT_SOLVED or (result_status == pywraplp.Solver.FEASIBLE and not keep_feasible):
         # we timed out!
         return None
     
-    assert result_status == pywraplp.Solver.OPTIMAL
+    assert result_status in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE)
 
         
     # The solution looks legit (when using solvers other than
@@ -705,26 +1011,94 @@ def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, c
 
     return (solver, courses)
 
+class ScheduleModel(object):
+    """
+    A model of the scheduling problem that is built once and then solved repeatedly with different
+    sets of constraints from previous solutions (see Solution.child_constraints), instead of building
+    a new model for each call to the solver.
+    """
+    def __init__(self, conflicts_d, sched_d, courses_to_schedule_d, enroll_d, enroll_index = None, fixed_conflicts = None):
+        self.conflicts_d = conflicts_d
+        self.courses_to_schedule_d = courses_to_schedule_d
+        (self.solver, self.courses, self.conflict_vars_d) = build_schedule_model(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, enroll_index, fixed_conflicts)
+
+        # Dictionary from tuple of pairs (cn, mt) to the constraint that rules out the conjunction of them.
+        self.no_good_constraints = {}
+
+        # Dictionary from pair (cn, mt) to the constraint that, when switched on, fixes course cn to meeting time mt.
+        self.fix_constraints = {}
+
+    def solve(self, constraints = None, hint = None, fixed = None, time_limit_ms = None, verbose = True):
+        """
+        Performs one call to the solver, with the constraints constraints (a list of lists of pairs (cn, mt)).
+        Constraints from earlier calls that are not in constraints are relaxed rather than removed,
+        so they can be switched back on cheaply.
+        hint is an optional dictionary from course name to meeting time (e.g., the solution of the parent),
+        given to the solver as a starting point.
+        fixed is an optional dictionary from course name to meeting time of courses that must keep those meeting
+        times (see solve_schedule_lns). Like the constraints, the ones from earlier calls are relaxed.
+        time_limit_ms and verbose are passed to solve_schedule_model.
+        Returns the pair (solver, courses), or None if the solver timed out.
+        """
+        active = set()
+        for cs in (constraints or []):
+            if not cs:
+                continue
+            key = tuple(cs)
+            if key not in self.no_good_constraints:
+                # At most len(cs)-1 of the meeting times in cs can be chosen, i.e., not all of them.
+                cnst = self.solver.Constraint(0, len(cs) - 1)
+                for (cn, mt) in cs:
+                    cnst.SetCoefficient(self.courses[cn].vars_meeting_time[mt], 1)
+                self.no_good_constraints[key] = cnst
+            active.add(key)
+
+        for key, cnst in self.no_good_constraints.items():
+            cnst.SetUb(len(key) - 1 if key in active else len(key))
+
+        fixed = fixed or {}
+        for (cn, mt) in fixed.items():
+            if (cn, mt) not in self.fix_constraints:
+                cnst = self.solver.Constraint(0, 1)
+                cnst.SetCoefficient(self.courses[cn].vars_meeting_time[mt], 1)
+                self.fix_constraints[(cn, mt)] = cnst
+
+        for (cn, mt), cnst in self.fix_constraints.items():
+            cnst.SetLb(1 if fixed.get(cn) == mt else 0)
+
+        if hint is not None:
+            set_solution_hint(self.solver, self.courses, hint)
+
+        return solve_schedule_model(self.solver, self.courses, self.conflict_vars_d, self.conflicts_d, self.courses_to_schedule_d, time_limit_ms, verbose)
+
 class Solution(object):
     """
     Represents a solution, and provides enough info to try new "child solutions"
     i.e., solutions with additional constraints to avoid problematic course scheduling
     """
-    def __init__(self, courses, constraints, sched_d, conflicts_d, enroll_d, parent=None, was_rand=False,history=""):
+    def __init__(self, courses_to_mt_d, constraints, sched_d, conflicts_d, enroll_d, parent=None, was_rand=False,history="",scorer=None,gap=None):
         self.parent = parent
         self.was_rand = was_rand
         self.history = history
-        self.courses_to_mt_d = {cn : courses[cn].solution_meeting_time() for cn in courses}
-        (self.score, rt_blame, lunch_blame) = schedule_score.build_schedule_score(make_sched_d_from_solution(sched_d, self.courses_to_mt_d), conflicts_d, enroll_d)
+        # The MIP gap of the solver's solution (see cpsat_backend.solution_gap), if known
+        self.gap = gap
+        self.courses_to_mt_d = courses_to_mt_d
+        if scorer is not None:
+            # Only rescore the student schedules affected by the courses that moved
+            scorer.update_courses({cn : [ss.meeting_time_to_course_time(mt)] for (cn, mt) in self.courses_to_mt_d.items()})
+            (self.score, rt_blame, lunch_blame) = scorer.score(print_conflicts=True)
+        else:
+            (self.score, rt_blame, lunch_blame) = schedule_score.build_schedule_score(make_sched_d_from_solution(sched_d, self.courses_to_mt_d), conflicts_d, enroll_d)
         self.simple_score = self.score['simple_score']
         self.constraints = constraints
 
-        bad_rt_courses = sorted(list(rt_blame.keys()), key=lambda k:rt_blame[k], reverse = True)
+        bad_rt_courses = sorted(list(rt_blame.keys()), key=lambda k:(rt_blame[k], sorted(k)), reverse = True)
         # bad_rt_courses is a list of sets of courses that caused multiple Allston round trips, sorted with the worst first.
+        # Ties are broken by course name, so the order does not depend on how the blame was computed.
         # Just take a few of them
         bad_rt_courses = bad_rt_courses[:3]
 
-        bad_lunch_courses = sorted(list(lunch_blame.keys()), key=lambda k:lunch_blame[k], reverse = True)
+        bad_lunch_courses = sorted(list(lunch_blame.keys()), key=lambda k:(lunch_blame[k], sorted(k)), reverse = True)
         # bad_lunch_courses is a list of sets of courses that caused students to miss lunch, sorted with the worst first.
         # Just take a few of them
         bad_lunch_courses = bad_lunch_courses[:3]
@@ -741,64 +1115,289 @@ class Solution(object):
         self.child_constraints = cc
 
 
-def solve_schedule(conflicts_d, sched_d, courses_to_schedule_d, enroll_d):
-    (solver,courses) = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d)
+# The problem data for the child solves run in worker processes (see solve_schedule), set by _init_child_worker,
+# and the worker's ScheduleModel, if it reuses one.
+_child_worker_data = None
+_child_worker_model = None
+
+def _child_worker_settings():
+    """
+    The settings of this process that the child solves depend on, for _init_child_worker. Worker processes that
+    are started rather than forked (the spawn start method) would otherwise use the defaults.
+    """
+    return {
+        'SOLVER_BACKEND' : SOLVER_BACKEND,
+        'KEEP_FEASIBLE_SOLUTIONS' : KEEP_FEASIBLE_SOLUTIONS,
+        'NUM_WORKERS' : cpsat_backend.NUM_WORKERS,
+        'POLICY' : allston_course_selector.get_policy(),
+    }
+
+def _init_child_worker(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, persistent=False, fixed_conflicts=None, settings=None):
+    global _child_worker_data, _child_worker_model, SOLVER_BACKEND, KEEP_FEASIBLE_SOLUTIONS
+    if settings is not None:
+        SOLVER_BACKEND = settings['SOLVER_BACKEND']
+        KEEP_FEASIBLE_SOLUTIONS = settings['KEEP_FEASIBLE_SOLUTIONS']
+        cpsat_backend.NUM_WORKERS = settings['NUM_WORKERS']
+        allston_course_selector.set_policy(settings['POLICY'])
+    if fixed_conflicts is None:
+        fixed_conflicts = ss.fixed_conflict_index(sched_d)
+    _child_worker_data = (conflicts_d, sched_d, courses_to_schedule_d, enroll_d, persistent, fixed_conflicts)
+    _child_worker_model = None
+
+def _solve_child(args):
+    """
+    Solve one child solution in a worker process. args is a triple (child_cs, loop_count, hint), where
+    hint is the dictionary from course name to meeting time of the parent solution.
+    Returns a pair (courses_to_mt_d, gap) of the dictionary from course name to meeting time of the solution and its
+    MIP gap (see cpsat_backend.solution_gap), or None if the solver timed out.
+    (The solver and Course objects can't be sent back to the parent process.)
+    """
+    global _child_worker_model
+    (child_cs, loop_count, hint) = args
+    (conflicts_d, sched_d, courses_to_schedule_d, enroll_d, persistent, fixed_conflicts) = _child_worker_data
+    if persistent:
+        if _child_worker_model is None:
+            _child_worker_model = ScheduleModel(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, fixed_conflicts = fixed_conflicts)
+        res = _child_worker_model.solve(constraints = child_cs, hint = hint)
+    else:
+        res = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = child_cs, loop_count = loop_count, fixed_conflicts = fixed_conflicts)
+    if res is None:
+        return None
+    (solver,courses) = res
+    return ({cn : courses[cn].solution_meeting_time() for cn in courses}, cpsat_backend.solution_gap(solver))
+
+# The kinds of neighborhood re-optimized by solve_schedule_lns
+LNS_NEIGHBORHOODS = ("department", "enrollment", "blame")
+
+def _grow_neighborhood(seed, courses, enroll_index, size, rand):
+    """
+    Extend the courses seed to a neighborhood of at most size of the courses being scheduled, by repeatedly adding a
+    course that is taken together with the courses already in the neighborhood, chosen at random in proportion
+    to the number of students who take them together.
+    """
+    hood = [cn for cn in seed if cn in courses][:size]
+    while len(hood) < size:
+        shared = {}
+        for i in enroll_index.sets_with_any(hood):
+            for cn in enroll_index.sets[i]:
+                if cn in courses and cn not in hood:
+                    shared[cn] = shared.get(cn, 0) + enroll_index.counts[i]
+        if not shared:
+            break
+        candidates = sorted(shared)
+        hood.append(rand.choices(candidates, [shared[cn] for cn in candidates])[0])
+    return hood
+
+def _lns_neighborhood(kind, courses, courses_to_mt_d, enroll_index, rt_blame, lunch_blame, rand):
+    """
+    Choose the courses to re-optimize in one move of solve_schedule_lns, and the meeting times that the move must
+    not keep them all at. Returns a pair (hood, no_good) of a list of course names and a list of pairs (cn, mt).
+    kind is one of LNS_NEIGHBORHOODS:
+      department: courses of the same subject
+      enrollment: the courses of a set of courses taken together by students
+      blame: the courses of a set that the scorer blames for round trips or missed lunches. The move must not
+             keep the blamed combination of meeting times.
+    Each is then grown with courses that students take together with them (see _grow_neighborhood).
+    """
+    size = PARAMS['LNS_NEIGHBORHOOD_SIZE']
+    names = sorted(courses)
+
+    blamed = [k for k in sorted(list(rt_blame) + list(lunch_blame), key=sorted) if any(cn in courses for cn in k)]
+    if kind == "blame" and not blamed:
+        kind = "enrollment"
+    ids = enroll_index.sets_with_any(names)
+    if kind == "enrollment" and not ids:
+        kind = "department"
+
+    if kind == "department":
+        subject = sct.parse_canonical_course_name(rand.choice(names))[0]
+        same = [cn for cn in names if sct.parse_canonical_course_name(cn)[0] == subject]
+        seed = rand.sample(same, min(size, len(same)))
+    elif kind == "enrollment":
+        fs = enroll_index.sets[rand.choices(ids, [enroll_index.counts[i] for i in ids])[0]]
+        seed = sorted(cn for cn in fs if cn in courses)
+        rand.shuffle(seed)
+    else:
+        assert kind == "blame", kind
+        blame = dict(rt_blame)
+        for k, n in lunch_blame.items():
+            blame[k] = blame.get(k, 0) + n
+        seed = sorted(cn for cn in rand.choices(blamed, [blame[k] for k in blamed])[0] if cn in courses)
+
+    hood = _grow_neighborhood(seed, courses, enroll_index, size, rand)
+    if kind == "blame":
+        no_good = [(cn, courses_to_mt_d[cn]) for cn in seed if cn in hood]
+    else:
+        no_good = [(cn, courses_to_mt_d[cn]) for cn in hood]
+    return (hood, no_good)
+
+def solve_schedule_lns(model, courses_to_mt_d, scorer, enroll_index, time_limit, seed=0):
+    """
+    Improve the solution courses_to_mt_d of version 3 of the solver by large neighborhood search.
+    Each move fixes all but a few of the courses (a neighborhood, see _lns_neighborhood) to their meeting times in
+    the best solution so far, forbids the neighborhood from keeping its current meeting times, and re-optimizes the
+    neighborhood with model (a ScheduleModel). The new solution replaces the best one if the scorer (a
+    schedule_score.schedule_scorer for the schedule with courses_to_mt_d) gives it a better simple score.
+    The subproblems are small, so many more moves fit in time_limit (a datetime.timedelta) than full solves.
+    Returns the dictionary from course name to meeting time of the best solution.
+    """
+    rand = random.Random(seed)
+    best_mt_d = dict(courses_to_mt_d)
+    (score, rt_blame, lunch_blame) = scorer.score()
+    best_score = score['simple_score']
+
+    moves = {kind : 0 for kind in LNS_NEIGHBORHOODS}
+    improvements = {kind : 0 for kind in LNS_NEIGHBORHOODS}
+    num_moves = 0
+    start = datetime.datetime.now()
+    while datetime.datetime.now() - start < time_limit:
+        kind = LNS_NEIGHBORHOODS[num_moves % len(LNS_NEIGHBORHOODS)]
+        num_moves += 1
+        (hood, no_good) = _lns_neighborhood(kind, model.courses, best_mt_d, enroll_index, rt_blame, lunch_blame, rand)
+        if not no_good:
+            continue
+        moves[kind] += 1
+
+        fixed = {cn : mt for (cn, mt) in best_mt_d.items() if cn not in hood}
+        res = model.solve(constraints = [no_good], hint = best_mt_d, fixed = fixed, time_limit_ms = PARAMS['LNS_MOVE_TIME_LIMIT_MS'], verbose = False)
+        if res is None:
+            # we timed out
+            continue
+
+        (solver, courses) = res
+        changes = {cn : courses[cn].solution_meeting_time() for cn in hood}
+        changes = {cn : mt for (cn, mt) in changes.items() if mt != best_mt_d[cn]}
+        if not changes:
+            continue
+        scorer.try_courses({cn : [ss.meeting_time_to_course_time(mt)] for (cn, mt) in changes.items()})
+        (score, new_rt_blame, new_lunch_blame) = scorer.score()
+        if score['simple_score'] < best_score:
+            scorer.commit()
+            best_mt_d.update(changes)
+            (best_score, rt_blame, lunch_blame) = (score['simple_score'], new_rt_blame, new_lunch_blame)
+            improvements[kind] += 1
+            print("LNS move %s (%s neighborhood %s) is new best: score %s"%(num_moves, kind, ", ".join(sorted(hood)), best_score))
+        else:
+            # Put the scorer back to the best solution
+            scorer.rollback()
+
+    print("LNS made %s moves in %s"%(sum(moves.values()), datetime.datetime.now() - start))
+    for kind in LNS_NEIGHBORHOODS:
+        print("  %s neighborhoods: %s moves, %s improvements"%(kind, moves[kind], improvements[kind]))
+    return best_mt_d
+
+def solve_schedule(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, num_jobs=1, persistent=False):
+    """
+    Find a schedule for the courses in courses_to_schedule_d.
+    For version 3 of the solver, num_jobs is the number of processes used to solve child solutions concurrently.
+    With more than one job, the children of as many of the best pending solutions as are needed to keep
+    the jobs busy are solved together, and then all added to the pending solutions.
+    If persistent is true, each process builds the model once (see ScheduleModel) and reuses it for all of its
+    child solutions, starting each solve from the parent solution.
+    If LNS_SEARCH is true, version 3 of the solver improves its first solution with solve_schedule_lns instead
+    (in this process only).
+    See LOCAL_SEARCH_ONLY and LOCAL_SEARCH_WARM_START for the use of local_search_scheduler.
+    """
+    # Which slots conflict with the fixed courses, shared by every model built below
+    fixed_conflicts = ss.fixed_conflict_index(sched_d)
+
+    hint = None
+    if LOCAL_SEARCH_ONLY or LOCAL_SEARCH_WARM_START:
+        problem = build_local_search_problem(conflicts_d, sched_d, courses_to_schedule_d, fixed_conflicts)
+        (hint, cost) = local_search_scheduler.timed_local_search(problem)
+        if LOCAL_SEARCH_ONLY:
+            return hint
+
+    if SOLVER_VERSION == 1 and LAZY_STUDENT_CONSTRAINTS:
+        return solve_schedule_lazy_v1(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, fixed_conflicts = fixed_conflicts, hint = hint)
+
+    (solver,courses) = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, fixed_conflicts = fixed_conflicts, hint = hint)
     
     if SOLVER_VERSION in [1,2]:
         return {cn : courses[cn].solution_meeting_time() for cn in courses}
 
     # For version 3 of the solver, we will find a solution, and then try to incrementally find a better one.
-    current_best_soln = Solution(courses, [], sched_d, conflicts_d, enroll_d)
+    # Child solutions differ from each other in only a few courses, so score them incrementally.
+    courses_to_mt_d = {cn : courses[cn].solution_meeting_time() for cn in courses}
+    scorer = schedule_score.schedule_scorer(make_sched_d_from_solution(sched_d, courses_to_mt_d), conflicts_d, enroll_d)
+    current_best_soln = Solution(courses_to_mt_d, [], sched_d, conflicts_d, enroll_d, scorer=scorer)
     pending = [current_best_soln]
     loop_count = 0
 
     print("Call %s is new best: score %s"%(loop_count,current_best_soln.simple_score))
 
+    if LNS_SEARCH:
+        time_limit = datetime.timedelta(minutes=3)
+        print("Improving the solution with large neighborhood search, will run for %s"%time_limit)
+        model = ScheduleModel(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, fixed_conflicts = fixed_conflicts)
+        return solve_schedule_lns(model, courses_to_mt_d, scorer, scorer.enroll_index, time_limit)
+
+    pool = None
+    if num_jobs > 1:
+        pool = multiprocessing.Pool(num_jobs, initializer=_init_child_worker, initargs=(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, persistent, fixed_conflicts, _child_worker_settings()))
+        print("Solving child solutions with %s processes"%num_jobs)
+    else:
+        _init_child_worker(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, persistent, fixed_conflicts)
+
     loop_start = datetime.datetime.now()
     time_limit = datetime.timedelta(minutes=3)
     print("Looking for a good solution, will run for %s"%time_limit)
-    while pending:
-        if (datetime.datetime.now() - loop_start) > time_limit:
-            #reached our time limits
-            print("Time limit reached! %s"%time_limit)
-            break
-
-        # some of the time, pick a random solution to expand, otherwise, pick the best of the queue
-        if False: #!@!random.randrange(100) < 20:
-            s = pending.pop(random.randrange(len(pending)))
-            was_rand = True
-        else:
-            # sort pending by simple score
-            was_rand = False
-            pending.sort(key=lambda x: x.simple_score)            
-            s = pending.pop(0)
-            # cull
-            pending = pending[:200]
-
-
-        # Expand the children of s
-        child_index = 0
-        for cc in s.child_constraints:
-            child_cs = list(s.constraints)
-            child_cs.append(cc)
-
-            loop_count += 1
-            
-            res = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = child_cs, loop_count = loop_count)
-            if res is None:
-                # we timed out
-                continue
-            
-            (solver,courses) = res
-            csoln = Solution(courses, child_cs, sched_d, conflicts_d, enroll_d,parent=s,was_rand=was_rand,history="child index %s"%child_index)
-            child_index += 1
-            if csoln.simple_score < current_best_soln.simple_score:
-                print("Call %s is new best: score %s"%(loop_count,csoln.simple_score))
-                current_best_soln = csoln
-
-            print("%s:%s"%(loop_count,csoln.simple_score))
-            pending.append(csoln)
+    try:
+        while pending:
+            if (datetime.datetime.now() - loop_start) > time_limit:
+                #reached our time limits
+                print("Time limit reached! %s"%time_limit)
+                break
+
+            # some of the time, pick a random solution to expand, otherwise, pick the best of the queue
+            if False: #!@!random.randrange(100) < 20:
+                s = pending.pop(random.randrange(len(pending)))
+                was_rand = True
+            else:
+                # sort pending by simple score
+                was_rand = False
+                pending.sort(key=lambda x: x.simple_score)            
+                s = pending.pop(0)
+                # cull
+                pending = pending[:200]
+
+            # Expand the children of s. When solving in parallel, also expand the next best pending
+            # solutions, until there are enough children to keep all the jobs busy.
+            expanding = [s]
+            while pool is not None and pending and sum(len(x.child_constraints) for x in expanding) < num_jobs:
+                expanding.append(pending.pop(0))
+
+            children = []
+            for x in expanding:
+                for cc in x.child_constraints:
+                    child_cs = list(x.constraints)
+                    child_cs.append(cc)
+
+                    loop_count += 1
+                    children.append((x, child_cs, loop_count))
+
+            args = [(child_cs, lc, x.courses_to_mt_d) for (x, child_cs, lc) in children]
+            results = pool.imap(_solve_child, args) if pool is not None else map(_solve_child, args)
+
+            child_index_d = {}
+            for ((x, child_cs, lc), res) in zip(children, results):
+                if res is None:
+                    # we timed out
+                    continue
             
+                (child_mt_d, gap) = res
+                child_index = child_index_d.get(id(x), 0)
+                csoln = Solution(child_mt_d, child_cs, sched_d, conflicts_d, enroll_d,parent=x,was_rand=was_rand,history="child index %s%s"%(child_index,_gap_history(gap)),scorer=scorer,gap=gap)
+                child_index_d[id(x)] = child_index + 1
+                if csoln.simple_score < current_best_soln.simple_score:
+                    print("Call %s is new best: score %s"%(lc,csoln.simple_score))
+                    current_best_soln = csoln
+
+                print("%s:%s"%(lc,csoln.simple_score))
+                pending.append(csoln)
+    finally:
+        if pool is not None:
+            pool.terminate()
 
     print("History of best solution:")
     sl = current_best_soln
@@ -864,15 +1463,25 @@ def output_schedule_registrar(cout, schedule_d, courses_to_mt_d):
             
 if __name__ == '__main__':
     def usage():
-        print('Usage: schedule_allston_courses <bad_course_conflicts.csv> <schedule.csv> <multi-year-enrollment-data.csv> [-allston-courses <allston_courses_to_schedule.csv>] [-out <output_file.csv>] [-print AREA | -registrar]')
+        print('Usage: schedule_allston_courses <bad_course_conflicts.csv> <schedule.csv> <multi-year-enrollment-data.csv> [-allston-courses <allston_courses_to_schedule.csv>] [-out <output_file.csv>] [-print AREA | -registrar] [-jobs N] [-persistent] [-backend cbc|cpsat] [-workers N] [-anytime] [-lazy] [-lns] [-local-search | -warm-start]')
         print('  bad_course_conflicts lists the courses that would be bad to schedule at the same time, including a weight of how bad the conflict is')
         print('  schedule.csv is an existing schedule of Harvard courses, both Cambridge and Allston courses. Allston course times will')
         print('                   be ignored, but that set of courses will be used for scheduling (unless -allston-courses is provided)')
         print('  allston_courses_to_schedule is optional, but if provided will be the list of Allston courses to schedule (Allston ')
         print('                   courses in schedule.csv will be ignored)')
+        print('  multi-year-enrollment-data.csv may also be a store directory created by enrollment_store.py')
         print('  output_file.csv is an output file of schedule times.')
         print('  -print AREA will only output results for the given area (e.g., "COMPSCI")')
         print('  -registrar will produce output in a similar format to the registrar course schedule output')
+        print('  -jobs N solves up to N child solutions at a time, in separate processes (default 1)')
+        print('  -persistent builds the solver model once per process and reuses it for each child solution')
+        print('  -backend NAME is the solver to use: cbc (the default) or cpsat (OR-tools CP-SAT)')
+        print('  -workers N is the number of parallel search workers used by the cpsat backend (default %s)'%cpsat_backend.NUM_WORKERS)
+        print('  -anytime keeps the feasible solutions of solver calls that reach their time limit, rather than discarding them')
+        print('  -lazy uses solver version 1, adding the constraints for student schedules lazily, for the schedules the solutions hurt')
+        print('  -lns improves the first solution by large neighborhood search, re-optimizing a few courses at a time')
+        print('  -local-search finds the schedule in seconds by simulated annealing (see local_search_scheduler.py), without the solver')
+        print('  -warm-start gives the solver the schedule found by simulated annealing as a starting point')
         
         sys.exit(1)
         
@@ -906,6 +1515,24 @@ if __name__ == '__main__':
     output_file = process_flag_param_arg(args, "-out")
     print_area = process_flag_param_arg(args, "-print")
     registrar_output = process_flag_arg(args, "-registrar")
+    num_jobs = process_flag_param_arg(args, "-jobs")
+    num_jobs = int(num_jobs) if num_jobs is not None else 1
+    persistent = process_flag_arg(args, "-persistent")
+    backend = process_flag_param_arg(args, "-backend")
+    if backend is not None:
+        if backend not in cpsat_backend.BACKENDS:
+            usage()
+        SOLVER_BACKEND = backend
+    num_workers = process_flag_param_arg(args, "-workers")
+    if num_workers is not None:
+        cpsat_backend.NUM_WORKERS = int(num_workers)
+    KEEP_FEASIBLE_SOLUTIONS = process_flag_arg(args, "-anytime")
+    if process_flag_arg(args, "-lazy"):
+        SOLVER_VERSION = 1
+        LAZY_STUDENT_CONSTRAINTS = True
+    LNS_SEARCH = process_flag_arg(args, "-lns")
+    LOCAL_SEARCH_ONLY = process_flag_arg(args, "-local-search")
+    LOCAL_SEARCH_WARM_START = process_flag_arg(args, "-warm-start")
         
 
     if len(args) != 3:
@@ -935,10 +1562,7 @@ if __name__ == '__main__':
     fin.close()
 
     # Build the student enrollment dictionary
-    fin = open(enrollment_file, 'r')
-    cin = csv.reader(fin)
-    enroll_d = schedule_score.build_enrollment_d(cin, sched_d)
-    fin.close()
+    enroll_d = schedule_score.load_enrollment_d(enrollment_file, sched_d)
     
 
     def guess_freq_and_length(cn, cts):
@@ -999,7 +1623,7 @@ if __name__ == '__main__':
     for cn in courses_to_schedule_d:
         assert cn not in sched_d, "%s is to be scheduled, but is already in %s"%(cn,schedule_file)
     
-    courses_to_mt_d = solve_schedule(conflicts_d, sched_d, courses_to_schedule_d, enroll_d)
+    courses_to_mt_d = solve_schedule(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, num_jobs=num_jobs, persistent=persistent)
 
     if output_file:
         # Output the combined schedule to the output file
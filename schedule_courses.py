@@ -15,6 +15,8 @@ from allston_course_selector import will_be_allston_course_subj_catalog, will_be
 from harvard_course_info import cross_list_canonical, is_cross_list_canonical, non_FAS_instructor
 import schedule_slots as ss
 from ortools.linear_solver import pywraplp
+import cpsat_backend
+import local_search_scheduler
 import scheduling_course_time as sct
 import build_schedule_score as schedule_score
 import build_allston_graphs
@@ -44,6 +46,20 @@ PARAMS =  {
 
 }
 
+# The solver backend (see cpsat_backend.BACKENDS): "cbc" (the default) or "cpsat"
+SOLVER_BACKEND = "cbc"
+
+# If true, a call to the solver that reaches its time limit keeps the feasible (but not proven optimal) solution
+# it has found, rather than being treated as timed out, so that the time spent on it isn't wasted.
+# See also cpsat_backend.solution_gap.
+KEEP_FEASIBLE_SOLUTIONS = False
+
+# If LOCAL_SEARCH_ONLY is true, the schedule is found by local_search_scheduler (in seconds) rather than by the
+# solver. If LOCAL_SEARCH_WARM_START is true, the solver is given the schedule found by local_search_scheduler
+# as a starting point.
+LOCAL_SEARCH_ONLY = False
+LOCAL_SEARCH_WARM_START = False
+
 
 def makeDisjunction(solver, v, disjuncts):
     """
@@ -51,6 +67,10 @@ def makeDisjunction(solver, v, disjuncts):
     one of the variables in disjuncts is 1. (All variables in
     disjuncts and v should be 0-1 valued variables.
     """
+    if cpsat_backend.is_cpsat(solver):
+        solver.AddDisjunction(v, disjuncts)
+        return
+
     cn = solver.Constraint(0, (len(disjuncts) - 1))
     cn.SetCoefficient(v, len(disjuncts))
     for x in disjuncts:
@@ -62,11 +82,18 @@ def makeConjunction(solver, v, conjuncts):
     all of the variables in disjuncts is 1. (All variables in
     conjuncts and v should be 0-1 valued variables.
     """
+    if cpsat_backend.is_cpsat(solver):
+        solver.AddConjunction(v, conjuncts)
+        return
+
     cn = solver.Constraint(0, (len(conjuncts) - 1))
     cn.SetCoefficient(v, -len(conjuncts))
     for x in conjuncts:
         cn.SetCoefficient(x, 1)
 
+def _gap_history(gap):
+    # Description of a non-optimal solution's gap, for the history of a Solution
+    return "" if gap is None or gap < 1e-6 else "; feasible, gap %.2f%%"%(100 * gap)
 
 
 class Course:
@@ -140,35 +167,46 @@ class Course:
                 cn.SetCoefficient(sx, 1)
 
 
-    def createObjective(self, solver, objective, conflict_vars_d, sched_d, conflicts_d, courses):
+    def slot_weight(self, asl):
+        """
+        The weight of actual slot asl for this course in the objective function, or None.
+        """
+        weight = None
+        # Put a little pressure on to not use slots 6 or 7
+        if asl[1] == "6":
+            weight = PARAMS['WEIGHT_AVOID_SLOT_6']
+        if asl[1] == "7":
+            weight = PARAMS['WEIGHT_AVOID_SLOT_7']
+
+        if asl=="T4a" or asl=="T5a" or asl=="T5" or asl=="T6":
+            if self.name in non_FAS_instructor:
+                # for non-FAS faculty, favor teaching on Tuesday 3pm-5pm
+                if asl == "T5a":
+                    weight = PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5']*3
+                else:
+                    weight = PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5']
+            else:
+                # avoid teaching on Tuesday 3pm-5pm for FAS instructors
+                weight = PARAMS['WEIGHT_AVOID_COURSES_TU_3_TO_5']
+
+        if asl[0]=="F":
+            # avoid Friday teaching, to mimic faculty preferences
+            weight = PARAMS['WEIGHT_AVOID_COURSES_FRIDAY']
+        return weight
+
+    def createObjective(self, solver, objective, conflict_vars_d, sched_d, conflicts_d, courses, fixed_conflicts=None):
         """
         Create/add to objective function for this course
+        fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
         """
+        if fixed_conflicts is None:
+            fixed_conflicts = ss.fixed_conflict_index(sched_d)
 
 
-        # Put a little pressure on to not use slots 6 or 7
         for asl in self.vars_actualslots:
-            if asl[1] == "6":
-                objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_SLOT_6'])
-                    
-            if asl[1] == "7":
-                objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_SLOT_7']) 
-
-            if asl=="T4a" or asl=="T5a" or asl=="T5" or asl=="T6":
-                if self.name in non_FAS_instructor:
-                    # for non-FAS faculty, favor teaching on Tuesday 3pm-5pm
-                    if asl == "T5a":
-                        objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5']*3)
-                    else:                        
-                        objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_FAVOR_COURSES_TU_3_TO_5'])
-                else:
-                    # avoid teaching on Tuesday 3pm-5pm for FAS instructors
-                    objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_COURSES_TU_3_TO_5'])
-
-            if asl[0]=="F":
-                # avoid Friday teaching, to mimic faculty preferences
-                objective.SetCoefficient(self.vars_actualslots[asl], PARAMS['WEIGHT_AVOID_COURSES_FRIDAY']) 
-            
+            weight = self.slot_weight(asl)
+            if weight is not None:
+                objective.SetCoefficient(self.vars_actualslots[asl], weight)
         
         
         # Add to objective function for bad course conflicts
@@ -197,13 +235,8 @@ class Course:
             if other not in courses:
                 # the other course already has a fixed schedule.
                 # Go through each actual slot and see if it intersects with other course
-                disjuncts = []
-                for s in self.vars_actualslots:
-                    my_course_time = ss.meeting_time_to_course_time([s])
-                    
-                    if sct.courses_conflict([my_course_time], sched_d[other]):
-                        # slots s conflicts with the time for other
-                        disjuncts.append(self.vars_actualslots[s])
+                conflicting_slots = fixed_conflicts.conflicting_slots(other)
+                disjuncts = [self.vars_actualslots[s] for s in self.vars_actualslots if s in conflicting_slots]
 
                 if len(disjuncts) > 0:
                     makeDisjunction(solver, v_conflicts, disjuncts)
@@ -215,7 +248,7 @@ class Course:
                 vs_d_same_slot = []
                 for asl in self.vars_actualslots:
                     for aslo in d.vars_actualslots:
-                        if sct.courses_conflict([ss.meeting_time_to_course_time([asl])], [ss.meeting_time_to_course_time([aslo])]):
+                        if ss.slots_overlap(asl, aslo):
                             # time slots conflict
                             v_both_use_slot = solver.IntVar(0, 1, self.name + " using " + asl + " and " + other + " using " + aslo)
                             makeConjunction(solver, v_both_use_slot, [self.vars_actualslots[asl], d.vars_actualslots[aslo]])
@@ -234,21 +267,30 @@ class Course:
                 return s
         return None
 
+# The areas that add_area_constraints spreads out
+AREAS = ("APCOMP","APMTH","BE","COMPSCI","ENG-SCI","ESE")
+
+def _area_slot_weight(cn, asl):
+    """
+    The weight that add_area_constraints gives actual slot asl of course cn in the objective function (replacing
+    the weight from Course.createObjective), or None.
+    """
+    # For COMPSCI, avoid Friday lunch (faculty meeting) and Thursday seminar
+    if cn.startswith("COMPSCI") and asl in ["F3a","R5a"]:
+        return PARAMS['WEIGHT_AVOID_CS_COURSES_IN_FAC_LUNCH_OR_COLLOQ']
+    return None
+
 def add_area_constraints(solver, objective, courses):
     """
     Add constraints to spread each area out over days of week and times of day
     """
-    areas = ("APCOMP","APMTH","BE","COMPSCI","ENG-SCI","ESE")
-
-    # For COMPSCI, avoid Friday lunch (faculty meeting) and Thursday seminar
     for c in courses:
-        if not c.startswith("COMPSCI"):
-            continue
-        for avoid in ["F3a","R5a"]:
-            if avoid in courses[c].vars_actualslots:
-                objective.SetCoefficient(courses[c].vars_actualslots[avoid], PARAMS['WEIGHT_AVOID_CS_COURSES_IN_FAC_LUNCH_OR_COLLOQ']) 
+        for asl in courses[c].vars_actualslots:
+            weight = _area_slot_weight(c, asl)
+            if weight is not None:
+                objective.SetCoefficient(courses[c].vars_actualslots[asl], weight)
     
-    for area in areas:
+    for area in AREAS:
         v_day_of_week_diff = solver.IntVar(0, solver.infinity(), area + " diff between TuTh and MWF courses")
         objective.SetCoefficient(v_day_of_week_diff, PARAMS['WEIGHT_DIFF_NUM_COURSES_DAY_OF_WEEK']) 
         
@@ -365,23 +407,36 @@ def build_to_schedule_d(csv_in, sched_d):
                                 
     return to_schedule_d
 
-def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = None, loop_count = None):
+def _make_course(cname, courses_to_schedule_d):
+    in_allston = will_be_allston_course_canonical_cn(cname)
+    return Course(cname, in_allston, courses_to_schedule_d[cname][0], courses_to_schedule_d[cname][1])
+
+def build_local_search_problem(conflicts_d, sched_d, courses_to_schedule_d, fixed_conflicts = None):
     """
-    Performs one call to the solver to find a schedule.
-    loop_count should be unique
+    The objective of the scheduling problem of solve_schedule_loop, as a local_search_scheduler.schedule_problem.
+    fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
+    """
+    courses = {cn : _make_course(cn, courses_to_schedule_d) for cn in courses_to_schedule_d}
+    if fixed_conflicts is None:
+        fixed_conflicts = ss.fixed_conflict_index(sched_d)
+
+    # Two scheduled courses conflict if they use overlapping actual slots (see Course.createObjective)
+    return local_search_scheduler.schedule_problem(courses, conflicts_d, sched_d, fixed_conflicts, PARAMS, AREAS, _area_slot_weight, ss.meeting_times_overlap)
+
+def build_schedule_model(conflicts_d, sched_d, courses_to_schedule_d, fixed_conflicts = None):
+    """
+    Create the solver, and the variables, constraints and objective of the scheduling problem (without any
+    constraints from previous solutions). Returns a triple (solver, courses, conflict_vars_d).
+    fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
     """
     # Create the solver
-    solver = pywraplp.Solver('CourseSchedule',
-    #                         pywraplp.Solver.GLOP_LINEAR_PROGRAMMING)
-    #                        pywraplp.Solver.BOP_INTEGER_PROGRAMMING)
-                             pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+    solver = cpsat_backend.new_solver('CourseSchedule', SOLVER_BACKEND)
 
     courses = {}
     # Let each constraint create its variables and constraints
     for cname in courses_to_schedule_d:
         assert is_cross_list_canonical(cname)
-        in_allston = will_be_allston_course_canonical_cn(cname)
-        courses[cname] = Course(cname, in_allston, courses_to_schedule_d[cname][0], courses_to_schedule_d[cname][1])
+        courses[cname] = _make_course(cname, courses_to_schedule_d)
         courses[cname].createVarsAndConstraints(solver)
 
     # Now let each course put in its objective function, to avoid bad conflicts
@@ -389,13 +444,26 @@ def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, c
     objective.SetMinimization()
 
     conflict_vars_d = {}
+    if fixed_conflicts is None:
+        fixed_conflicts = ss.fixed_conflict_index(sched_d)
     
     for cname in courses:
-        courses[cname].createObjective(solver, objective, conflict_vars_d, sched_d, conflicts_d, courses)
+        courses[cname].createObjective(solver, objective, conflict_vars_d, sched_d, conflicts_d, courses, fixed_conflicts)
 
 
     add_area_constraints(solver, objective, courses)
 
+    return (solver, courses, conflict_vars_d)
+
+def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = None, loop_count = None, fixed_conflicts = None, hint = None):
+    """
+    Performs one call to the solver to find a schedule.
+    loop_count should be unique
+    fixed_conflicts is an optional ss.fixed_conflict_index for sched_d.
+    hint is an optional dictionary from course name to meeting time, given to the solver as a starting point.
+    """
+    (solver, courses, conflict_vars_d) = build_schedule_model(conflicts_d, sched_d, courses_to_schedule_d, fixed_conflicts)
+
     if constraints:
         for cs in constraints:
             # cs is a list of pairs (cn, mt) of canonical course name cn and meeting time mt
@@ -407,6 +475,14 @@ def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, c
                 cnst = solver.Constraint(0, 0)
                 cnst.SetCoefficient(v, 1)
 
+    if hint is not None:
+        vars = []
+        values = []
+        for cn, mt in hint.items():
+            for s, x in courses[cn].vars_meeting_time.items():
+                vars.append(x)
+                values.append(1.0 if s == mt else 0.0)
+        solver.SetHint(vars, values)
         
     solver.SetTimeLimit(10 * 1000) # 10 second time limit
 
@@ -418,11 +494,11 @@ def solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, c
     # print ("Result status: %s"%result_status)
     # print ("Time: %s seconds"%((endtime-starttime).total_seconds()))
 
-    if result_status == pywraplp.Solver.FEASIBLE:
+    if result_status == pywraplp.Solver.NOT_SOLVED or (result_status == pywraplp.Solver.FEASIBLE and not KEEP_FEASIBLE_SOLUTIONS):
         # we timed out!
         return None
     
-    assert result_status == pywraplp.Solver.OPTIMAL
+    assert result_status in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE)
 
         
     # The solution looks legit (when using solvers other than
@@ -436,21 +512,29 @@ class Solution(object):
     Represents a solution, and provides enough info to try new "child solutions"
     i.e., solutions with additional constraints to avoid problematic course scheduling
     """
-    def __init__(self, courses, constraints, sched_d, conflicts_d, enroll_d, courses_to_schedule_d, parent=None, was_rand=False,history="",large_courses={}):
+    def __init__(self, courses, constraints, sched_d, conflicts_d, enroll_d, courses_to_schedule_d, parent=None, was_rand=False,history="",large_courses={},scorer=None,gap=None):
         self.parent = parent
         self.was_rand = was_rand
         self.history = history
+        # The MIP gap of the solver's solution (see cpsat_backend.solution_gap), if known
+        self.gap = gap
         self.courses_to_mt_d = {cn : courses[cn].solution_meeting_time() for cn in courses}
-        (self.score, rt_blame, lunch_blame) = schedule_score.build_schedule_score(make_sched_d_from_solution(sched_d, self.courses_to_mt_d), conflicts_d, enroll_d, courses_to_count = courses_to_schedule_d, print_conflicts = False, large_courses = large_courses)
+        if scorer is not None:
+            # Only rescore the student schedules affected by the courses that moved
+            scorer.update_courses({cn : [ss.meeting_time_to_course_time(mt)] for (cn, mt) in self.courses_to_mt_d.items()})
+            (self.score, rt_blame, lunch_blame) = scorer.score(print_conflicts=False)
+        else:
+            (self.score, rt_blame, lunch_blame) = schedule_score.build_schedule_score(make_sched_d_from_solution(sched_d, self.courses_to_mt_d), conflicts_d, enroll_d, courses_to_count = courses_to_schedule_d, print_conflicts = False, large_courses = large_courses)
         self.simple_score = self.score['simple_score']
         self.constraints = constraints
 
-        bad_rt_courses = sorted(list(rt_blame.keys()), key=lambda k:rt_blame[k], reverse = True)
+        bad_rt_courses = sorted(list(rt_blame.keys()), key=lambda k:(rt_blame[k], sorted(k)), reverse = True)
         # bad_rt_courses is a list of sets of courses that caused multiple Allston round trips, sorted with the worst first.
+        # Ties are broken by course name, so the order does not depend on how the blame was computed.
         # Just take a few of them
         bad_rt_courses = bad_rt_courses[:3]
 
-        bad_lunch_courses = sorted(list(lunch_blame.keys()), key=lambda k:lunch_blame[k], reverse = True)
+        bad_lunch_courses = sorted(list(lunch_blame.keys()), key=lambda k:(lunch_blame[k], sorted(k)), reverse = True)
         # bad_lunch_courses is a list of sets of courses that caused students to miss lunch, sorted with the worst first.
         # Just take a few of them
         bad_lunch_courses = bad_lunch_courses[:3]
@@ -470,10 +554,23 @@ class Solution(object):
 
 
 def solve_schedule(conflicts_d, sched_d, courses_to_schedule_d, enroll_d,large_courses):
-    (solver,courses) = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d)
+    # Which slots conflict with the fixed courses, shared by every model built below
+    fixed_conflicts = ss.fixed_conflict_index(sched_d)
+
+    # See LOCAL_SEARCH_ONLY and LOCAL_SEARCH_WARM_START
+    hint = None
+    if LOCAL_SEARCH_ONLY or LOCAL_SEARCH_WARM_START:
+        problem = build_local_search_problem(conflicts_d, sched_d, courses_to_schedule_d, fixed_conflicts)
+        (hint, cost) = local_search_scheduler.timed_local_search(problem)
+        if LOCAL_SEARCH_ONLY:
+            return hint
+
+    (solver,courses) = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, fixed_conflicts = fixed_conflicts, hint = hint)
     
     # For version 3 of the solver, we will find a solution, and then try to incrementally find a better one.
-    current_best_soln = Solution(courses, [], sched_d, conflicts_d, enroll_d, courses_to_schedule_d,large_courses = large_courses)
+    # Child solutions differ from each other in only a few courses, so score them incrementally.
+    scorer = schedule_score.schedule_scorer(make_sched_d_from_solution(sched_d, {cn : courses[cn].solution_meeting_time() for cn in courses}), conflicts_d, enroll_d, courses_to_count = courses_to_schedule_d, large_courses = large_courses)
+    current_best_soln = Solution(courses, [], sched_d, conflicts_d, enroll_d, courses_to_schedule_d,large_courses = large_courses,scorer=scorer)
     pending = [current_best_soln]
     loop_count = 0
 
@@ -503,14 +600,15 @@ def solve_schedule(conflicts_d, sched_d, courses_to_schedule_d, enroll_d,large_c
 
             loop_count += 1
             
-            res = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = child_cs, loop_count = loop_count)
+            res = solve_schedule_loop(conflicts_d, sched_d, courses_to_schedule_d, enroll_d, constraints = child_cs, loop_count = loop_count, fixed_conflicts = fixed_conflicts)
             if res is None:
                 # we timed out
                 print("---Timed out on child")
                 continue
             
             (solver,courses) = res
-            csoln = Solution(courses, child_cs, sched_d, conflicts_d, enroll_d,courses_to_schedule_d, parent=s,history="child index %s"%child_index,large_courses = large_courses)
+            gap = cpsat_backend.solution_gap(solver)
+            csoln = Solution(courses, child_cs, sched_d, conflicts_d, enroll_d,courses_to_schedule_d, parent=s,history="child index %s%s"%(child_index,_gap_history(gap)),large_courses = large_courses,scorer=scorer,gap=gap)
             child_index += 1
 
             print("    %s:%s"%(loop_count,csoln.simple_score))
@@ -586,15 +684,21 @@ def output_schedule_registrar(cout, schedule_d, courses_to_mt_d):
             
 if __name__ == '__main__':
     def usage():
-        print('Usage: schedule_courses <bad_course_conflicts.csv> <schedule.csv> <multi-year-enrollment-data.csv> [-courses <courses_to_schedule.csv>] [-allallston] [-out <output_file.csv>] [-print AREA | -registrar]')
+        print('Usage: schedule_courses <bad_course_conflicts.csv> <schedule.csv> <multi-year-enrollment-data.csv> [-courses <courses_to_schedule.csv>] [-allallston] [-out <output_file.csv>] [-print AREA | -registrar] [-backend cbc|cpsat] [-workers N] [-anytime] [-local-search | -warm-start]')
         print('  bad_course_conflicts lists the courses that would be bad to schedule at the same time, including a weight of how bad the conflict is')
         print('  schedule.csv is an existing schedule of Harvard courses, both Cambridge and Allston courses. ')
         print('  -large-courses is optional, but if provided will be the list of the large courses (used for output and cost computation)')
         print('  -courses is optional, but if provided will be the list of courses to schedule')
         print('  -allallston is optional, but if present will add all Allston courses to the list of courses to be scheduled')
+        print('  multi-year-enrollment-data.csv may also be a store directory created by enrollment_store.py')
         print('  output_file.csv is an output file of schedule times.')
         print('  -print AREA will only output results for the given area (e.g., "COMPSCI")')
         print('  -registrar will produce output in a similar format to the registrar course schedule output')
+        print('  -backend NAME is the solver to use: cbc (the default) or cpsat (OR-tools CP-SAT)')
+        print('  -workers N is the number of parallel search workers used by the cpsat backend (default %s)'%cpsat_backend.NUM_WORKERS)
+        print('  -anytime keeps the feasible solutions of solver calls that reach their time limit, rather than discarding them')
+        print('  -local-search finds the schedule in seconds by simulated annealing (see local_search_scheduler.py), without the solver')
+        print('  -warm-start gives the solver the schedule found by simulated annealing as a starting point')
         
         sys.exit(1)
         
@@ -628,6 +732,17 @@ if __name__ == '__main__':
     print_area = process_flag_param_arg(args, "-print")
     registrar_output = process_flag_arg(args, "-registrar")
     all_allston = process_flag_arg(args, "-allallston")
+    backend = process_flag_param_arg(args, "-backend")
+    if backend is not None:
+        if backend not in cpsat_backend.BACKENDS:
+            usage()
+        SOLVER_BACKEND = backend
+    num_workers = process_flag_param_arg(args, "-workers")
+    if num_workers is not None:
+        cpsat_backend.NUM_WORKERS = int(num_workers)
+    KEEP_FEASIBLE_SOLUTIONS = process_flag_arg(args, "-anytime")
+    LOCAL_SEARCH_ONLY = process_flag_arg(args, "-local-search")
+    LOCAL_SEARCH_WARM_START = process_flag_arg(args, "-warm-start")
         
 
     if len(args) != 3:
@@ -657,10 +772,7 @@ if __name__ == '__main__':
     fin.close()
 
     # Build the student enrollment dictionary
-    fin = open(enrollment_file, 'r')
-    cin = csv.reader(fin)
-    enroll_d = schedule_score.build_enrollment_d(cin, sched_d)
-    fin.close()
+    enroll_d = schedule_score.load_enrollment_d(enrollment_file, sched_d)
     
 
     courses_to_schedule_d = collections.OrderedDict()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A NumPy backend for the round trip and no lunch counts of build_schedule_score.py. The day schedules of
+all of the student schedules are encoded as arrays indexed by (schedule, day, position in the day), holding
+the location, start and end minutes and course of each entry. Round trips are then counted with array
+operations over the positions, and lunch availability is computed on a grid of the minutes of the lunch window.
+The results are the same as count_round_trips and count_no_lunches in build_schedule_score.py.
+
+Run as a script, it times the two backends against each other.
+"""
+
+import warnings
+import sys, csv, random, datetime
+import numpy as np
+import class_time as ct
+import scheduling_course_time as sct
+import build_schedule_score as schedule_score
+from allston_course_selector import will_be_allston_course_canonical_cn
+
+# Location codes
+NO_COURSE = 0
+CAMBRIDGE = 1
+ALLSTON = 2
+LOCATION_CODES = {"Cambridge": CAMBRIDGE, "Allston": ALLSTON}
+
+# The minutes of the lunch window, used to work out which Allston courses to blame for taking away lunch
+LUNCH_MINUTES = np.arange(schedule_score.LUNCH_START, schedule_score.LUNCH_END)
+
+# Compute lunch availability for this many schedules at a time, to bound the memory used
+CHUNK_SIZE = 5000
+
+def _histogram(values, weights, keys):
+    """
+    Given an array of non-negative ints values and an array of the same length of weights, return a
+    dictionary from each value to the sum of the weights with that value. The keys in keys are always present.
+    """
+    hist = {k: 0 for k in keys}
+    if len(values) == 0:
+        return hist
+
+    sums = np.bincount(values, weights=weights)
+    for v in np.unique(values):
+        hist[int(v)] = int(round(sums[v]))
+    return hist
+
+def _has_time_for_lunch(start, end, selected):
+    """
+    start and end are int arrays of the start and end minutes of the entries of day schedules, with the entries
+    along the last axis, and selected is a boolean array of the same shape picking the entries that take time.
+    Returns a boolean array (with the last axis removed) that is true where the selected entries leave a free
+    gap of at least schedule_score.LUNCH_DURATION minutes in the lunch window.
+    """
+    (lo, hi) = (schedule_score.LUNCH_START, schedule_score.LUNCH_END)
+    # Unselected entries are moved to the end of the lunch window, where they take no time
+    start = np.where(selected, np.clip(start, lo, hi), hi)
+    end = np.where(selected, np.clip(end, lo, hi), lo)
+
+    # In order of start time, the gap before each entry is from the latest end of the entries before it
+    order = np.argsort(start, axis=-1, kind='stable')
+    start = np.take_along_axis(start, order, axis=-1)
+    end = np.take_along_axis(end, order, axis=-1)
+    latest_end = np.maximum.accumulate(np.concatenate([np.full(start.shape[:-1] + (1,), lo, dtype=end.dtype), end], axis=-1), axis=-1)
+    gaps = np.concatenate([start, np.full(start.shape[:-1] + (1,), hi, dtype=start.dtype)], axis=-1) - latest_end
+    return (gaps >= schedule_score.LUNCH_DURATION).any(axis=-1)
+
+class encoded_student_schedules(object):
+    """
+    Array encoding of a dictionary of student schedules (see schedule_score.build_student_schedules).
+    Schedule i is the set of courses keys[i], taken by weights[i] students. For day d and position k in
+    that day's (sorted) list, loc[i,d,k] is the location code of the entry (NO_COURSE past the end of the list),
+    start[i,d,k] and end[i,d,k] are its start and end in minutes after midnight, and course[i,d,k] is an index
+    into course_names.
+    """
+    def __init__(self, student_schedule_d, enroll_d):
+        self.student_schedule_d = student_schedule_d
+        self.keys = list(student_schedule_d.keys())
+
+        n = len(self.keys)
+        num_days = len(sct.DAYNAMES)
+        width = max([len(lst) for days in student_schedule_d.values() for lst in days.values()] + [1])
+
+        self.weights = np.array([enroll_d.get(fs, 0) for fs in self.keys], dtype=np.int64)
+        self.has_allston = np.array([any(will_be_allston_course_canonical_cn(cn) for cn in fs) for fs in self.keys], dtype=bool)
+
+        self.loc = np.zeros((n, num_days, width), dtype=np.int8)
+        self.start = np.zeros((n, num_days, width), dtype=np.int16)
+        self.end = np.zeros((n, num_days, width), dtype=np.int16)
+        self.course = np.full((n, num_days, width), -1, dtype=np.int32)
+        self.course_names = []
+
+        course_ids = {}
+        minutes_d = {}
+        def minutes(t):
+            if t not in minutes_d:
+                (h, m) = ct.time_to_hm(t)
+                minutes_d[t] = h*60 + m
+            return minutes_d[t]
+
+        # Gather the entries into flat lists, and then fill in the arrays all at once
+        index = []
+        entries = []
+        for i in range(n):
+            days = student_schedule_d[self.keys[i]]
+            for d in range(num_days):
+                for k, (start, end, loc, cn) in enumerate(days[sct.DAYNAMES[d]]):
+                    if cn not in course_ids:
+                        course_ids[cn] = len(self.course_names)
+                        self.course_names.append(cn)
+                    index.append((i, d, k))
+                    entries.append((LOCATION_CODES[loc], minutes(start), minutes(end), course_ids[cn]))
+
+        if index:
+            index = tuple(np.array(index, dtype=np.int64).T)
+            entries = np.array(entries, dtype=np.int32)
+            self.loc[index] = entries[:, 0]
+            self.start[index] = entries[:, 1]
+            self.end[index] = entries[:, 2]
+            self.course[index] = entries[:, 3]
+
+        # Entries that don't take up at least a minute can split the available lunch time in ways the
+        # minute grid can't represent; the lunch counts for those schedules are left to the pure Python code.
+        self.degenerate = ((self.loc != NO_COURSE) & (self.start >= self.end)).any(axis=(1,2))
+
+        self._lunch = None
+
+    def count_round_trips(self):
+        """
+        Same as schedule_score.count_round_trips.
+        """
+        allston = (self.loc == ALLSTON)
+        # A round trip starts at each Allston entry that doesn't follow another Allston entry
+        # (students start the day in Cambridge).
+        prev_allston = np.zeros_like(allston)
+        prev_allston[:, :, 1:] = allston[:, :, :-1]
+        trips = (allston & ~prev_allston).sum(axis=2)
+
+        ret_d = {}
+        for d in range(len(sct.DAYNAMES)):
+            ret_d[sct.DAYNAMES[d]] = _histogram(trips[:, d], self.weights, range(3))
+        ret_d['week'] = _histogram(trips.sum(axis=1), self.weights, range(8))
+
+        multi_round_trip_blame = {}
+        for (i, d) in zip(*np.nonzero(trips > 1)):
+            # More than one round trip to Allston in a day. Blame the Allston courses on that day.
+            allston_courses = frozenset(self.course_names[c] for c in self.course[i, d][allston[i, d]])
+            multi_round_trip_blame[allston_courses] = multi_round_trip_blame.get(allston_courses, 0) + int(self.weights[i])
+
+        return (ret_d, multi_round_trip_blame)
+
+    def _lunch_by_day(self):
+        """
+        Returns a pair of boolean arrays (no_lunch, due_to_allston) indexed by (schedule, day). no_lunch is true if the
+        student has no time for lunch, and due_to_allston is true if the student would have had time for lunch if not
+        for the Allston courses. Also computes lunch_blame_by_day, a dictionary from (schedule, day) to the frozen set
+        of Allston courses blamed for taking away lunch on days where due_to_allston is true.
+        Only valid for schedules that are not degenerate.
+        """
+        if self._lunch is not None:
+            return self._lunch
+
+        n = len(self.keys)
+        no_lunch = np.zeros((n, len(sct.DAYNAMES)), dtype=bool)
+        due_to_allston = np.zeros((n, len(sct.DAYNAMES)), dtype=bool)
+        self.lunch_blame_by_day = {}
+
+        for chunk_start in range(0, n, CHUNK_SIZE):
+            rows = np.arange(chunk_start, min(n, chunk_start + CHUNK_SIZE))
+            rows = rows[~self.degenerate[rows]]
+            (start, end, loc) = (self.start[rows], self.end[rows], self.loc[rows])
+            cambridge_lunch = _has_time_for_lunch(start, end, loc == CAMBRIDGE)
+            lunch = _has_time_for_lunch(start, end, loc != NO_COURSE)
+            no_lunch[rows] = ~lunch
+            due_to_allston[rows] = cambridge_lunch & ~lunch
+
+            # Blame: an Allston course takes away lunch time if it is the first Allston course of the day
+            # (in order of the day's list) to cover some minute that is free of Cambridge courses.
+            (ri, di) = np.nonzero(cambridge_lunch & ~lunch)
+            if len(ri) == 0:
+                continue
+            (i, d) = (rows[ri], di)
+            covers = (self.start[i, d][..., None] <= LUNCH_MINUTES) & (LUNCH_MINUTES < self.end[i, d][..., None])
+            cambridge_busy = (covers & (self.loc[i, d] == CAMBRIDGE)[..., None]).any(axis=1)
+            covers &= (self.loc[i, d] == ALLSTON)[..., None]
+            covers &= ~cambridge_busy[:, None, :]
+            covered = covers.any(axis=1)
+            first = covers.argmax(axis=1)
+            for j in range(len(i)):
+                positions = np.unique(first[j][covered[j]])
+                self.lunch_blame_by_day[(int(i[j]), int(d[j]))] = frozenset(self.course_names[c] for c in self.course[i[j], d[j], positions])
+
+        self._lunch = (no_lunch, due_to_allston)
+        return self._lunch
+
+    def count_no_lunches(self, only_allston=False, due_to_allston=False):
+        """
+        Same as schedule_score.count_no_lunches.
+        """
+        (no_lunch, no_lunch_due_to_allston) = self._lunch_by_day()
+
+        counted = ~self.degenerate
+        if only_allston:
+            counted &= self.has_allston
+
+        days = no_lunch_due_to_allston if due_to_allston else no_lunch
+        rows = np.nonzero(counted)[0]
+        ret_d = _histogram(days[rows].sum(axis=1), self.weights[rows], range(8))
+
+        lunch_blame = {}
+        for (i, d), fsblame in self.lunch_blame_by_day.items():
+            if counted[i]:
+                lunch_blame[fsblame] = int(self.weights[i]) + lunch_blame.get(fsblame, 0)
+
+        # Degenerate schedules are counted by the pure Python code
+        for i in np.nonzero(self.degenerate)[0]:
+            fs = self.keys[i]
+            res = schedule_score.count_no_lunches_for_schedule(fs, self.student_schedule_d[fs], only_allston, due_to_allston)
+            if res is None:
+                continue
+            (no_lunch_days, blame) = res
+            for fsblame in blame:
+                lunch_blame[fsblame] = int(self.weights[i]) + lunch_blame.get(fsblame, 0)
+            ret_d[no_lunch_days] += int(self.weights[i])
+
+        return (ret_d, lunch_blame)
+
+def synthetic_enroll_d(sched_d, num_students, seed=0):
+    """
+    Build a synthetic enrollment dictionary (see schedule_score.build_enrollment_d) for num_students students,
+    each taking between 3 and 5 of the courses in sched_d in a term. Courses are picked with a skewed distribution,
+    so that some are much more popular than others, like real enrollments.
+    """
+    rng = random.Random(seed)
+    courses = sorted(sched_d.keys())
+    popularity = [1.0 / (r + 1) for r in range(len(courses))]
+    rng.shuffle(popularity)
+
+    enroll_d = {}
+    for s in range(num_students):
+        cns = set(rng.choices(courses, weights=popularity, k=rng.randint(3, 5)))
+        if len(cns) < schedule_score.MIN_COURSES:
+            continue
+        if schedule_score.DROP_NON_ALLSTON_ENROLLMENTS and schedule_score.num_allston_courses(cns) == 0:
+            continue
+        fs = frozenset(cns)
+        enroll_d[fs] = enroll_d.get(fs, 0) + 1
+    return enroll_d
+
+if __name__ == '__main__':
+    def usage():
+        print('Usage: schedule_score_numpy.py <schedule.csv> [<multi-year-enrollment-data.csv> | -synthetic NUM_STUDENTS]')
+        print('  Times the pure Python and NumPy round trip and no lunch counts against each other.')
+        print('  -synthetic generates random enrollments for NUM_STUDENTS students from the courses in schedule.csv')
+        sys.exit(1)
+
+    def brief_warning(message, category, filename, lineno, line=None):
+        return "Warning: %s\n"%message
+
+    warnings.formatwarning = brief_warning
+
+    args = list(sys.argv[1:])
+    num_synthetic = None
+    if "-synthetic" in args:
+        ind = args.index("-synthetic")
+        if ind + 1 >= len(args):
+            usage()
+        num_synthetic = int(args[ind+1])
+        del args[ind:ind+2]
+
+    if len(args) != (1 if num_synthetic is not None else 2):
+        usage()
+
+    fin = open(args[0], 'r')
+    cin = csv.reader(fin)
+    sched_d = sct.build_course_schedule(cin, filename=args[0])
+    fin.close()
+
+    if num_synthetic is not None:
+        enroll_d = synthetic_enroll_d(sched_d, num_synthetic)
+        print("Synthetic enrollments for %s students: %s distinct schedules"%(num_synthetic, len(enroll_d)))
+    else:
+        enroll_d = schedule_score.load_enrollment_d(args[1], sched_d)
+
+    times_d = schedule_score.build_student_schedules(enroll_d, sched_d)
+
+    starttime = datetime.datetime.now()
+    python_res = (schedule_score.count_round_trips(times_d, enroll_d),
+                  schedule_score.count_no_lunches(times_d, enroll_d),
+                  schedule_score.count_no_lunches(times_d, enroll_d, only_allston=True),
+                  schedule_score.count_no_lunches(times_d, enroll_d, only_allston=True, due_to_allston=True))
+    python_time = (datetime.datetime.now() - starttime).total_seconds()
+
+    starttime = datetime.datetime.now()
+    enc = encoded_student_schedules(times_d, enroll_d)
+    encode_time = (datetime.datetime.now() - starttime).total_seconds()
+    numpy_res = (enc.count_round_trips(),
+                 enc.count_no_lunches(),
+                 enc.count_no_lunches(only_allston=True),
+                 enc.count_no_lunches(only_allston=True, due_to_allston=True))
+    numpy_time = (datetime.datetime.now() - starttime).total_seconds()
+
+    print("Python: %.3f seconds"%python_time)
+    print("NumPy:  %.3f seconds (%.3f seconds encoding)"%(numpy_time, encode_time))
+    print("Speedup: %.1fx"%(python_time / numpy_time if numpy_time > 0 else float('inf')))
+    print("Results %s"%("match" if python_res == numpy_res else "DIFFER"))
@@ -9,6 +9,7 @@ Some utilities/data structures expressing scheduling slots. Used in the solution
 """
 
 import scheduling_course_time as sct
+import class_time as ct
 
 # List of sets of slots for classes that meet once per week
 ALLSTON_MEETING_TIMES_ONCE_PER_WEEK_ONE_SLOT = (
@@ -121,80 +122,206 @@ def _assert_is_slot(s):
         assert len(s) == 3
         assert s[2] == 'a'
 
-def is_allston_slot(s):
+# #########################
+#
+# Precomputed tables of slots and meeting times
+#
+# Each slot, and each meeting time, is given an integer id, and the information the schedulers need about them is
+# computed once and stored in tables indexed by id, so that model building doesn't reparse the slot strings.
+
+# All the slots, in order of id
+SLOTS = tuple(d + str(n) + suffix for suffix in ("", "a") for d in DAYS_OF_WEEK for n in range(1,8))
+SLOT_IDS = {s: i for (i, s) in enumerate(SLOTS)}
+
+def _compute_slot_times(s):
     _assert_is_slot(s)
-    return len(s) == 3
+    times = CAMBRIDGE_SLOT_TIMES
+    if len(s) > 2 and s[2] == 'a':
+        times = ALLSTON_SLOT_TIMES
+    
+    return times[int(s[1])]
+
+# Tables indexed by slot id: the day (index into DAYS_OF_WEEK), the slot number (1-7), whether it is an Allston slot,
+# the start and end times ("hh:mm") and the start and end in minutes after midnight.
+SLOT_DAY = tuple(DAYS_OF_WEEK.index(s[0]) for s in SLOTS)
+SLOT_NUMBER = tuple(int(s[1]) for s in SLOTS)
+SLOT_IS_ALLSTON = tuple(len(s) == 3 for s in SLOTS)
+SLOT_START_TIME = tuple(_compute_slot_times(s)[0] for s in SLOTS)
+SLOT_END_TIME = tuple(_compute_slot_times(s)[1] for s in SLOTS)
+SLOT_INTERVAL = tuple(ct.time_as_interval(a, b) for (a, b) in zip(SLOT_START_TIME, SLOT_END_TIME))
+
+# SLOT_OVERLAP[i][j] is true if slots i and j are on the same day at overlapping times
+SLOT_OVERLAP = tuple(tuple(SLOT_DAY[i] == SLOT_DAY[j] and SLOT_INTERVAL[i][0] < SLOT_INTERVAL[j][1] and SLOT_INTERVAL[j][0] < SLOT_INTERVAL[i][1]
+                           for j in range(len(SLOTS)))
+                     for i in range(len(SLOTS)))
+
+def slot_id(s):
+    i = SLOT_IDS.get(s)
+    if i is None:
+        _assert_is_slot(s)
+    return i
 
-def is_allston_meeting_time(mt):
-    is_allston = is_allston_slot(mt[0])
+def slots_overlap(s1, s2):
+    """
+    Do slots s1 and s2 meet at overlapping times?
+    """
+    return SLOT_OVERLAP[slot_id(s1)][slot_id(s2)]
+
+def is_allston_slot(s):
+    return SLOT_IS_ALLSTON[slot_id(s)]
+
+def slot_start_time(s):
+    return SLOT_START_TIME[slot_id(s)]
+
+def slot_end_time(s):
+    return SLOT_END_TIME[slot_id(s)]
 
+def slot_interval(s):
+    """
+    The start and end of slot s, in minutes after midnight.
+    """
+    return SLOT_INTERVAL[slot_id(s)]
+
+# Tables indexed by meeting time id. Meeting times (tuples of slots) are added to them by meeting_time_id, the first
+# time they are seen; all the meeting times of ALLSTON_MEETING_TIMES and CAMBRIDGE_MEETING_TIMES are added below.
+MEETING_TIMES = []
+MEETING_TIME_IDS = {}
+# The slot ids of the meeting time
+MT_SLOTS = []
+# The sorted tuple of the days (indexes into DAYS_OF_WEEK) the meeting time meets, and their bitmask
+MT_DAYS = []
+MT_DAY_MASK = []
+MT_FREQUENCY = []
+MT_IS_TU_TH = []
+MT_IS_ALLSTON = []
+# The lowest slot number of the meeting time
+MT_START_SLOT = []
+# The start and end, in minutes after midnight, of the meeting time (from the start of its first slot to the end of its last)
+MT_INTERVAL = []
+# The sct.course_time of the meeting time, created when first asked for
+MT_COURSE_TIME = []
+# MT_DISTANCE[i][j] is distance_between_meeting_times for meeting times i and j, and MT_OVERLAP[i][j] is true
+# if they have slots that overlap
+MT_DISTANCE = []
+MT_OVERLAP = []
+
+def _compute_distance(slots1, slots2):
+    min_dist = None
+    for i in slots1:
+        for j in slots2:
+            if SLOT_DAY[i] != SLOT_DAY[j]:
+                # different days
+                continue
+            d = abs(SLOT_NUMBER[i] - SLOT_NUMBER[j])
+            if min_dist is None or d < min_dist:
+                min_dist = d
+    return min_dist
+
+def _compute_overlap(slots1, slots2):
+    return any(SLOT_OVERLAP[i][j] for i in slots1 for j in slots2)
+
+def _register_meeting_time(mt):
+    _assert_is_meeting_time(mt)
+    i = len(MEETING_TIMES)
+    slots = tuple(SLOT_IDS[s] for s in mt)
+    days = tuple(sorted(set(SLOT_DAY[s] for s in slots)))
+
+    is_allston = SLOT_IS_ALLSTON[slots[0]]
     # Check that all slots are consistent
-    for s in mt:
-        assert is_allston_slot(s) == is_allston
+    for s in slots:
+        assert SLOT_IS_ALLSTON[s] == is_allston
+
+    MEETING_TIMES.append(mt)
+    MEETING_TIME_IDS[mt] = i
+    MT_SLOTS.append(slots)
+    MT_DAYS.append(days)
+    MT_DAY_MASK.append(sum(1 << d for d in days))
+    MT_FREQUENCY.append(len(days))
+    MT_IS_TU_TH.append(all(DAYS_OF_WEEK[d] in ("T","R") for d in days))
+    MT_IS_ALLSTON.append(is_allston)
+    MT_START_SLOT.append(min(SLOT_NUMBER[s] for s in slots))
+    MT_INTERVAL.append((min(SLOT_INTERVAL[s][0] for s in slots), max(SLOT_INTERVAL[s][1] for s in slots)))
+    MT_COURSE_TIME.append(None)
+
+    for j in range(i):
+        MT_DISTANCE[j].append(_compute_distance(MT_SLOTS[j], slots))
+        MT_OVERLAP[j].append(_compute_overlap(MT_SLOTS[j], slots))
+    MT_DISTANCE.append([_compute_distance(slots, MT_SLOTS[j]) for j in range(i+1)])
+    MT_OVERLAP.append([_compute_overlap(slots, MT_SLOTS[j]) for j in range(i+1)])
+    return i
+
+def meeting_time_id(mt):
+    """
+    The id of meeting time mt (a tuple or list of slots), for the MT_ tables.
+    """
+    mt = tuple(mt)
+    i = MEETING_TIME_IDS.get(mt)
+    if i is None:
+        i = _register_meeting_time(mt)
+    return i
 
-    return is_allston
+for meeting_times_d in (ALLSTON_MEETING_TIMES, CAMBRIDGE_MEETING_TIMES):
+    for meeting_times in meeting_times_d.values():
+        for mt in meeting_times:
+            meeting_time_id(mt)
+
+def is_allston_meeting_time(mt):
+    return MT_IS_ALLSTON[meeting_time_id(mt)]
 
 def meeting_time_is_tu_th(mt):
-    _assert_is_meeting_time(mt)
-    days = set(DAYS_OF_WEEK) & set([s[0] for s in mt])
-    return len(days) == len(days & set(("T","R")))
+    return MT_IS_TU_TH[meeting_time_id(mt)]
 
 def meeting_frequency(mt):
-    _assert_is_meeting_time(mt)
-    return len(set([s[0] for s in mt]))
+    return MT_FREQUENCY[meeting_time_id(mt)]
 
 def meeting_time_starts_between_9_and_4(mt):
-    _assert_is_meeting_time(mt)
     # is the start slot 1-5 inclusive?
-    return min([int(s[1]) for s in mt]) in range(1,6)
+    return MT_START_SLOT[meeting_time_id(mt)] in range(1,6)
 
 def start_time_slot(mt):
-    return min([int(s[1]) for s in mt])
+    return MT_START_SLOT[meeting_time_id(mt)]
 
-def slot_start_time(s):
-    _assert_is_slot(s)
-    times = CAMBRIDGE_SLOT_TIMES
-    if len(s) > 2 and s[2] == 'a':
-        times = ALLSTON_SLOT_TIMES
-    
-    return times[int(s[1])][0]
+def meeting_time_days(mt):
+    """
+    The sorted tuple of the days (indexes into DAYS_OF_WEEK) that meeting time mt meets
+    """
+    return MT_DAYS[meeting_time_id(mt)]
 
-def slot_end_time(s):
-    _assert_is_slot(s)
-    times = CAMBRIDGE_SLOT_TIMES
-    if len(s) > 2 and s[2] == 'a':
-        times = ALLSTON_SLOT_TIMES
-    
-    return times[int(s[1])][1]
+def meeting_time_interval(mt):
+    """
+    The start and end of meeting time mt, in minutes after midnight
+    """
+    return MT_INTERVAL[meeting_time_id(mt)]
 
-    
 def meeting_time_to_course_time(mt):
     """
     Convert a meeting time (i.e., a list of strings of the form "M1a", etc") to a sct.course_time.
     Useful for checking conflicts with other scts.
+    The course_time is created once per meeting time and shared, so it must not be modified.
     """
-    _assert_is_meeting_time(mt)
-    days = list(set(DAYS_OF_WEEK) & set([s[0] for s in mt]))
-    times = list(set(range(1,8)) & set([int(s[1]) for s in mt]))
-
-    assert (max(times) - min(times)) in [0,1]
-
-    slot_times = CAMBRIDGE_SLOT_TIMES
-    if is_allston_meeting_time(mt):
-        slot_times = ALLSTON_SLOT_TIMES
-        
-    start_time = slot_times[min(times)][0]
-    end_time = slot_times[max(times)][1]
-    return sct.course_time(start_time,
-                           end_time,
-                           "M" in days,
-                           "T" in days,
-                           "W" in days,
-                           "R" in days,
-                           "F" in days,
-                           False, # Saturday
-                           False, # Sunday
-                           normalized_time = True)
+    i = meeting_time_id(mt)
+    if MT_COURSE_TIME[i] is None:
+        slots = MT_SLOTS[i]
+        days = [DAYS_OF_WEEK[d] for d in MT_DAYS[i]]
+        times = [SLOT_NUMBER[s] for s in slots]
+
+        assert (max(times) - min(times)) in [0,1]
+
+        slot_times = ALLSTON_SLOT_TIMES if MT_IS_ALLSTON[i] else CAMBRIDGE_SLOT_TIMES
+
+        start_time = slot_times[min(times)][0]
+        end_time = slot_times[max(times)][1]
+        MT_COURSE_TIME[i] = sct.course_time(start_time,
+                                            end_time,
+                                            "M" in days,
+                                            "T" in days,
+                                            "W" in days,
+                                            "R" in days,
+                                            "F" in days,
+                                            False, # Saturday
+                                            False, # Sunday
+                                            normalized_time = True)
+    return MT_COURSE_TIME[i]
 
 def distance_between_meeting_times(mt1, mt2):
     """
@@ -203,13 +330,32 @@ def distance_between_meeting_times(mt1, mt2):
     Distance n means that there is at least one actual slots that is n slots away.
     Returns a positive integer, or None if they are on different days
     """
-    min_dist = None
-    for asl1 in mt1:
-        for asl2 in mt2:
-            if asl1[0] != asl2[0]:
-                # different days
-                continue
-            d = abs(int(asl1[1]) - int(asl2[1]))
-            if min_dist is None or d < min_dist:
-                min_dist = d
-    return min_dist
\ No newline at end of file
+    return MT_DISTANCE[meeting_time_id(mt1)][meeting_time_id(mt2)]
+
+def meeting_times_overlap(mt1, mt2):
+    """
+    Do meeting times mt1 and mt2 have slots that meet at overlapping times?
+    """
+    return MT_OVERLAP[meeting_time_id(mt1)][meeting_time_id(mt2)]
+
+class fixed_conflict_index(object):
+    """
+    Which slots conflict with each course of a fixed schedule sched_d (a dictionary from canonical course name to
+    a list of sct.course_time). Built once for sched_d and shared by all of the models built for it, so that
+    each slot is checked against each fixed course at most once. A course's conflicts are computed the first time
+    they are asked for.
+    """
+    def __init__(self, sched_d):
+        self.sched_d = sched_d
+        self.conflicts_d = {}
+
+    def conflicting_slots(self, cn):
+        """
+        The frozenset of slots that conflict with the times of course cn of sched_d.
+        """
+        slots = self.conflicts_d.get(cn)
+        if slots is None:
+            cts = self.sched_d[cn]
+            slots = frozenset(s for s in SLOTS if sct.courses_conflict([meeting_time_to_course_time((s,))], cts))
+            self.conflicts_d[cn] = slots
+        return slots
@@ -37,6 +37,8 @@ def parse_canonical_course_name(cn):
 
 DAYNAMES = ['M','T','W',"Th",'F','Sa','Su']
 
+MINUTES_PER_DAY = 24*60
+
 class course_time(object):
     """
     The object used to represent the time  and days that a course meets
@@ -51,6 +53,7 @@ class course_time(object):
         self.days = []
         for d in [mon, tue, wed, thu, fri, sat, sun]:
             self.days.append(d == 'Y' or d == True)
+        self._compute_mask()
 
     def __str__(self):
         return self.time_start+"-"+self.time_end + " " + self.days_of_week()
@@ -69,6 +72,32 @@ class course_time(object):
             return days
         return separator.join(days)
 
+    def _compute_mask(self):
+        """
+        Compute self.mask, a bitmask of the minutes of the week that this course time occupies:
+        bit d*MINUTES_PER_DAY + m is set if the course meets during minute m (after midnight) on
+        day d. Two course times then conflict if and only if their masks intersect.
+        Times that don't occupy at least one minute (e.g., empty or zero length times) get a mask
+        of None, and are checked using time_as_interval instead.
+        """
+        self.mask = None
+        if self.time_start == "" or self.time_end == "":
+            return
+
+        (start_h, start_m) = ct.time_to_hm(self.time_start)
+        (end_h, end_m) = ct.time_to_hm(self.time_end)
+        start = start_h*60 + start_m
+        end = end_h*60 + end_m
+        if not (start < end):
+            return
+
+        day_bits = ((1 << (end - start)) - 1) << start
+        mask = 0
+        for i in range(len(self.days)):
+            if self.days[i]:
+                mask |= day_bits << (i * MINUTES_PER_DAY)
+        self.mask = mask
+
     def time_as_interval(self):
         """
         Returns the start and end time as an interval of the number of minutes
@@ -108,11 +137,16 @@ class course_time(object):
         # Now update the time_end, by making sure the slot is the same length.
         self.time_end = ct._add_minutes(self.time_start, duration)
 
+        self._compute_mask()
+
         if warn_str is not None:
             warnings.warn(warn_str + (" Setting it to %s-%s"%(self.time_start,self.time_end)))
 
     
     def conflicts_with(self, other):
+        if self.mask is not None and other.mask is not None:
+            return (self.mask & other.mask) != 0
+
         if (True, True) in zip(self.days, other.days):
             # we intersect on at least one day
             (my_start, my_end) = self.time_as_interval()
@@ -121,11 +155,28 @@ class course_time(object):
 
         return False
 
+def course_times_mask(sched):
+    """
+    sched is a list of course_times
+    return: the union of the masks of the course times in sched (see course_time), or None if any of them has no mask
+    """
+    mask = 0
+    for cto in sched:
+        if cto.mask is None:
+            return None
+        mask |= cto.mask
+    return mask
+
 def courses_conflict(sched1, sched2):
     """
     sched1 and sched2 are lists of course_times
     return: true if any of the course times in sched1 overlap with any of the course times in sched2
     """
+    mask1 = course_times_mask(sched1)
+    mask2 = course_times_mask(sched2)
+    if mask1 is not None and mask2 is not None:
+        return (mask1 & mask2) != 0
+
     for ct1 in sched1:
         for ct2 in sched2:
             if ct1.conflicts_with(ct2):
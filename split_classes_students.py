@@ -10,16 +10,43 @@ by later programs. One of these is the classes that will be taught in Allston; t
 students who took one of these classes. The third set is the set of all classes taken by the students who take at least
 one class that will be in Allston. These three sets are saved as pickles in the directory in which the program is run.
 """
-import csv, sys, pickle
+import csv, sys, os, pickle
 import make_name_dicts as mnd
 import allston_course_selector as acs
 
-if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('Usage: python split_classes_students.py enrollment_file.csv')
-        sys.exit(1)
+def split_from_store(store):
+    """
+    Build the three sets (Allston classes, students taking one of them, and all the classes those students take)
+    from an enrollment_store.enrollment_store, without going through the rows one at a time.
+    """
+    import numpy as np
+
+    # will_be_allston_course only looks at the first 6 columns, so ask it once per distinct combination of them
+    (course_ids, courses) = store.distinct(range(6))
+    allston_rows = np.array([acs.will_be_allston_course(list(c)) for c in courses], dtype=bool)[course_ids]
+
+    class_ids = store.ids(1)
+    student_ids = store.ids(8)
+    classes = store.values(1)
+    students = store.values(8)
+
+    allston_class_s = {classes[i] for i in np.unique(class_ids[allston_rows]).tolist()}
+    seas_student_ids = np.unique(student_ids[allston_rows])
+    student_s = {students[i] for i in seas_student_ids.tolist()}
+    allston_student_class_s = {classes[i] for i in np.unique(class_ids[np.isin(student_ids, seas_student_ids)]).tolist()}
+
+    return (allston_class_s, student_s, allston_student_class_s)
+
+def split_classes_students(fname):
+    """
+    Build the three sets (Allston classes, students taking one of them, and all the classes those students take)
+    from the enrollment file fname, which is either a CSV file or a store directory created by enrollment_store.py.
+    """
+    if os.path.isdir(fname):
+        import enrollment_store
+        if enrollment_store.is_store(fname):
+            return split_from_store(enrollment_store.enrollment_store(fname))
 
-    fname = sys.argv[1]
     fin = open(fname, 'r')
     cin = csv.reader(fin)
 
@@ -40,6 +67,16 @@ if __name__ == '__main__':
             allston_student_class_s.add(l[1])
     fin.close()
 
+    return (allston_class_s, student_s, allston_student_class_s)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python split_classes_students.py enrollment_file.csv')
+        print('  The enrollment file may also be a store directory created by enrollment_store.py')
+        sys.exit(1)
+
+    (allston_class_s, student_s, allston_student_class_s) = split_classes_students(sys.argv[1])
+
     mnd.pickle_data('Allston_class_set.pkl', allston_class_s)
     mnd.pickle_data('SEAS_student_set.pkl', student_s)
     mnd.pickle_data('all_seas_student_classes_set.pkl', allston_student_class_s)
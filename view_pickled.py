@@ -5,38 +5,69 @@ Created on 2019-03-14
 
 @author chong
 
-Utility to view pickled data quickly
+Utility to view pickled data (or artifact files, see artifacts.py) quickly
 """
 import make_name_dicts as mnd
+import artifacts
 import sys
 import collections.abc as col
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print('Usage: python view_pickled.py [-csv] file.pkl')
+    def usage():
+        print('Usage: python view_pickled.py [-csv] [-table NAME] [-limit N] file.pkl|file.art')
+        print('  -table NAME shows only the table NAME of an artifact file (see artifacts.py); by default all of its tables are shown')
+        print('  -limit N shows only the first N entries; for artifact files, the rest are not read')
         sys.exit(2)
 
-    file = sys.argv[1]
+    args = list(sys.argv[1:])
     csv = False
-    if file == "-csv":
-        file = sys.argv[2]
-        csv = True
-    
-    d = mnd.unpickle_data(file)
-    if isinstance(d, col.Mapping):
-        for k, v in d.items():
-            if csv:
-                print("%s,%s"%((str(k).strip(),str(v).strip())))
-            else:
-                print(k,':',v)
-
-    elif isinstance(d, col.Iterable):
-        for e in d:
-            print(e)
+    table = None
+    limit = None
+    while len(args) > 1 and args[0].startswith("-"):
+        if args[0] == "-csv":
+            csv = True
+            del args[0]
+        elif args[0] == "-table":
+            table = args[1]
+            del args[0:2]
+        elif args[0] == "-limit":
+            limit = int(args[1])
+            del args[0:2]
+        else:
+            usage()
 
-    else:
-        print ("Can't print type %s"%type(d))
+    if len(args) != 1:
+        usage()
+    file = args[0]
+
+    def show(d):
+        if isinstance(d, col.Mapping):
+            for i, (k, v) in enumerate(d.items()):
+                if limit is not None and i >= limit:
+                    break
+                if csv:
+                    print("%s,%s"%((str(k).strip(),str(v).strip())))
+                else:
+                    print(k,':',v)
+
+        elif isinstance(d, col.Iterable):
+            for i, e in enumerate(d):
+                if limit is not None and i >= limit:
+                    break
+                print(e)
 
+        else:
+            print ("Can't print type %s"%type(d))
 
-    if isinstance(d, col.Sized) and not csv:
-        print("Count: %s"%len(d))
+
+        if isinstance(d, col.Sized) and not csv:
+            print("Count: %s"%len(d))
+
+    if artifacts.is_artifact(file):
+        with artifacts.artifact(file) as art:
+            for name in ([table] if table is not None else art.table_names()):
+                if not csv:
+                    print("Table %s:"%name)
+                show(art.table(name))
+    else:
+        show(mnd.unpickle_data(file))